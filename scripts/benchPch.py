@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+
+"""Measure the clean-build time precompiled headers save on a multi-file project.
+
+Generates the same project twice with pico_project.py, with and without
+--precompiledHeaders, adds a number of extra source files that include the
+same headers as the generated main file, and reports the median clean build
+time of each. Needs an installed SDK, toolchain, CMake and Ninja.
+"""
+
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
+
+
+def generate(args, root, name, pch):
+    command = [
+        sys.executable,
+        "-m",
+        "pico_project",
+        "--userHome",
+        args.userHome,
+        "--sdkVersion",
+        args.sdkVersion,
+        "--toolchainVersion",
+        args.toolchainVersion,
+        "--picotoolVersion",
+        args.picotoolVersion,
+        "--ninjaPath",
+        args.ninjaPath,
+        "--cmakePath",
+        args.cmakePath,
+        "--boardtype",
+        args.boardtype,
+        "--projectRoot",
+        root,
+    ]
+    for feature in args.feature or []:
+        command += ["--feature", feature]
+    if pch:
+        command.append("--precompiledHeaders")
+    subprocess.run(command + [name], cwd=SCRIPT_DIR, check=True, capture_output=True)
+
+    # extra sources with the same includes as main.c, like a real multi-file project
+    project = Path(root, name)
+    includes = "".join(
+        line
+        for line in (project / "main.c").read_text().splitlines(keepends=True)
+        if line.startswith("#include")
+    )
+    sources = []
+    for i in range(args.sources):
+        (project / f"source{i}.c").write_text(
+            f"{includes}\nint source{i}(int x)\n{{\n    return x * {i} + 1;\n}}\n"
+        )
+        sources.append(f"source{i}.c")
+    with open(project / "CMakeLists.txt", "a") as f:
+        f.write(f"\ntarget_sources({name} PRIVATE {' '.join(sources)})\n")
+    return project
+
+
+def clean_build_ms(args, project, env):
+    build = project / "build"
+    subprocess.run(
+        [args.cmakePath, "-G", "Ninja", f"-DCMAKE_MAKE_PROGRAM={args.ninjaPath}", ".."],
+        cwd=build,
+        env=env,
+        check=True,
+        capture_output=True,
+    )
+    times = []
+    for _ in range(args.runs):
+        subprocess.run(
+            [args.cmakePath, "--build", ".", "--target", "clean"],
+            cwd=build,
+            env=env,
+            check=True,
+            capture_output=True,
+        )
+        start = time.perf_counter()
+        subprocess.run(
+            [args.cmakePath, "--build", "."],
+            cwd=build,
+            env=env,
+            check=True,
+            capture_output=True,
+        )
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--userHome", default=str(Path.home()))
+    parser.add_argument("--sdkVersion", required=True)
+    parser.add_argument("--toolchainVersion", required=True)
+    parser.add_argument("--picotoolVersion", required=True)
+    parser.add_argument("--cmakePath", default=shutil.which("cmake"))
+    parser.add_argument("--ninjaPath", default=shutil.which("ninja"))
+    parser.add_argument("--boardtype", default="pico")
+    parser.add_argument("-f", "--feature", action="append", help="Feature to add")
+    parser.add_argument("-n", "--sources", type=int, default=20, help="Extra sources")
+    parser.add_argument("--runs", type=int, default=3, help="Clean builds per variant")
+    args = parser.parse_args()
+
+    # pico-vscode.cmake finds the tools through the home directory
+    env = dict(os.environ, HOME=args.userHome, USERPROFILE=args.userHome)
+
+    with tempfile.TemporaryDirectory() as root:
+        results = {}
+        for pch in (False, True):
+            project = generate(args, root, "pch" if pch else "nopch", pch)
+            results[pch] = clean_build_ms(args, project, env)
+
+    print(f"{args.sources + 1} sources, features: {', '.join(args.feature or []) or 'none'}")
+    print(f"Without precompiled headers: {results[False]:.0f} ms")
+    print(f"With precompiled headers: {results[True]:.0f} ms")
+    print(f"Saved: {results[False] - results[True]:.0f} ms ({(1 - results[True] / results[False]) * 100:.0f}%)")
+
+
+if __name__ == "__main__":
+    main()
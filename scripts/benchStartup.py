@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+"""Measure the cold start of pico_project.py against its STARTUP_BUDGET_MS.
+
+Every New Project click in the extension waits on pico_project.py, so this
+measures the time it adds on top of a bare interpreter start-up (median of
+several runs that stop right after argument parsing) and lists the slowest
+imports reported by `python -X importtime`. Exits with 1 if the budget is
+exceeded.
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
+
+sys.path.insert(0, SCRIPT_DIR)
+from pico_project import STARTUP_BUDGET_MS
+
+
+def median_ms(command, runs):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=SCRIPT_DIR, capture_output=True)
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def slowest_imports(count):
+    """Return the (self time in us, module) pairs of the slowest imports of pico_project"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import pico_project"],
+        cwd=SCRIPT_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, module = line[len("import time:") :].split("|")
+        imports.append((int(self_us), module.strip()))
+    return sorted(imports, reverse=True)[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-n", "--runs", type=int, default=15, help="Runs per measurement")
+    args = parser.parse_args()
+
+    # The extension runs the generator as a module, so its bytecode gets cached.
+    # Without a project name it exits right after parsing the command line.
+    generator = [sys.executable, "-m", "pico_project"]
+    subprocess.run(generator, cwd=SCRIPT_DIR, capture_output=True)
+
+    baseline = median_ms([sys.executable, "-c", "pass"], args.runs)
+    cold_start = median_ms(generator, args.runs)
+    overhead = cold_start - baseline
+
+    print(f"Interpreter start-up: {baseline:.1f} ms")
+    print(f"pico_project.py: {cold_start:.1f} ms")
+    print(f"Overhead: {overhead:.1f} ms (budget {STARTUP_BUDGET_MS} ms)")
+    print("Slowest imports (self time):")
+    for self_us, module in slowest_imports(10):
+        print(f"  {self_us / 1000:6.1f} ms  {module}")
+
+    if overhead > STARTUP_BUDGET_MS:
+        print("Startup budget exceeded")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
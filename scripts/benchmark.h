@@ -0,0 +1,163 @@
+#ifndef _PICO_VSCODE_BENCHMARK_H
+#define _PICO_VSCODE_BENCHMARK_H
+
+// Small timing harness to measure code on RP2040 and RP2350
+//
+// Cycles are counted with the cycle counter of the core: SysTick on RP2040
+// (Cortex-M0+ has no DWT cycle counter), DWT CYCCNT on RP2350 Arm and mcycle
+// on RP2350 RISC-V. benchmark_run() first runs the code a few times so XIP cache
+// and branch predictors are warm, then prints the min, median and max of the
+// timed runs over stdio, with the cost of the measurement itself subtracted.
+//
+// Call benchmark_init() once, after stdio_init_all() and any clock changes.
+
+#include <stdio.h>
+#include "pico/stdlib.h"
+#include "hardware/clocks.h"
+
+// Timed runs per benchmark_run() are capped to this
+#ifndef BENCHMARK_MAX_REPETITIONS
+#define BENCHMARK_MAX_REPETITIONS 64
+#endif
+
+#if defined(__riscv)
+
+static inline void benchmark_counter_init(void) {
+    // mcycle is only counting if its mcountinhibit bit is clear
+    __asm volatile ("csrc mcountinhibit, %0" : : "r" (1u));
+}
+
+static inline uint32_t benchmark_counter(void) {
+    uint32_t cycles;
+    __asm volatile ("csrr %0, mcycle" : "=r" (cycles));
+    return cycles;
+}
+
+#define BENCHMARK_COUNTER_MASK 0xffffffffu
+
+#elif PICO_RP2040
+
+#include "hardware/structs/systick.h"
+
+static inline void benchmark_counter_init(void) {
+    // Free running 24 bit SysTick at the processor clock, without its interrupt
+    systick_hw->rvr = 0x00ffffff;
+    systick_hw->cvr = 0;
+    systick_hw->csr = 0x5; // CLKSOURCE (processor clock) | ENABLE
+}
+
+static inline uint32_t benchmark_counter(void) {
+    // SysTick counts down
+    return ~systick_hw->cvr & 0x00ffffff;
+}
+
+#define BENCHMARK_COUNTER_MASK 0x00ffffffu
+
+#else
+
+// Architectural Armv8-M debug registers of the Cortex-M33
+#define BENCHMARK_DEMCR (*(volatile uint32_t *)0xe000edfc)
+#define BENCHMARK_DWT_CTRL (*(volatile uint32_t *)0xe0001000)
+#define BENCHMARK_DWT_CYCCNT (*(volatile uint32_t *)0xe0001004)
+
+static inline void benchmark_counter_init(void) {
+    BENCHMARK_DEMCR |= 1u << 24; // TRCENA, enables the DWT
+    BENCHMARK_DWT_CTRL |= 1u;    // CYCCNTENA
+}
+
+static inline uint32_t benchmark_counter(void) {
+    return BENCHMARK_DWT_CYCCNT;
+}
+
+#define BENCHMARK_COUNTER_MASK 0xffffffffu
+
+#endif
+
+typedef void (*benchmark_fn_t)(void *arg);
+
+typedef struct {
+    uint32_t min;
+    uint32_t median;
+    uint32_t max;
+} benchmark_result_t;
+
+// Cycles measuring a function that does nothing takes, see benchmark_init()
+static uint32_t benchmark_overhead;
+
+static inline uint32_t benchmark_measure(benchmark_fn_t fn, void *arg) {
+    uint64_t start_us = time_us_64();
+    uint32_t start = benchmark_counter();
+    fn(arg);
+    uint32_t cycles = (benchmark_counter() - start) & BENCHMARK_COUNTER_MASK;
+    uint64_t elapsed_us = time_us_64() - start_us;
+
+    // Runs the counter could have wrapped in (every 2^24 cycles with SysTick)
+    // are timed with the 1MHz timer instead
+    uint64_t timer_cycles = elapsed_us * (clock_get_hz(clk_sys) / 1000000);
+    if (timer_cycles > BENCHMARK_COUNTER_MASK / 2) {
+        return timer_cycles > UINT32_MAX ? UINT32_MAX : (uint32_t)timer_cycles;
+    }
+    return cycles;
+}
+
+static __noinline void benchmark_empty(void *arg) {
+    (void)arg;
+}
+
+static inline void benchmark_init(void) {
+    benchmark_counter_init();
+
+    benchmark_overhead = 0;
+    uint32_t overhead = UINT32_MAX;
+    for (int i = 0; i < 8; i++) {
+        uint32_t cycles = benchmark_measure(benchmark_empty, NULL);
+        if (cycles < overhead) {
+            overhead = cycles;
+        }
+    }
+    benchmark_overhead = overhead;
+}
+
+// Run fn(arg) warmup times, then time it repetitions times and print the results
+static inline benchmark_result_t benchmark_run(const char *name, benchmark_fn_t fn, void *arg,
+                                               uint warmup, uint repetitions) {
+    uint32_t samples[BENCHMARK_MAX_REPETITIONS];
+    if (repetitions < 1) {
+        repetitions = 1;
+    } else if (repetitions > BENCHMARK_MAX_REPETITIONS) {
+        repetitions = BENCHMARK_MAX_REPETITIONS;
+    }
+
+    for (uint i = 0; i < warmup; i++) {
+        fn(arg);
+    }
+
+    for (uint i = 0; i < repetitions; i++) {
+        uint32_t cycles = benchmark_measure(fn, arg);
+        cycles = cycles > benchmark_overhead ? cycles - benchmark_overhead : 0;
+        // Insertion sort, so the median is in the middle afterwards
+        uint j = i;
+        for (; j > 0 && samples[j - 1] > cycles; j--) {
+            samples[j] = samples[j - 1];
+        }
+        samples[j] = cycles;
+    }
+
+    benchmark_result_t result = {samples[0], samples[repetitions / 2], samples[repetitions - 1]};
+    uint32_t mhz = clock_get_hz(clk_sys) / 1000000;
+    printf("%s: min %u, median %u, max %u cycles (median %u ns at %u MHz, %u runs)\n", name,
+           (unsigned)result.min, (unsigned)result.median, (unsigned)result.max,
+           (unsigned)((uint64_t)result.median * 1000 / mhz), (unsigned)mhz, repetitions);
+    return result;
+}
+
+// Print the throughput of a benchmark_run() result that processed bytes per run
+static inline void benchmark_print_throughput(const char *name, benchmark_result_t result,
+                                              uint32_t bytes) {
+    uint32_t mhz = clock_get_hz(clk_sys) / 1000000;
+    uint32_t cycles = result.median ? result.median : 1;
+    printf("%s: %u bytes per run, %u KB/s (median)\n", name, (unsigned)bytes,
+           (unsigned)((uint64_t)bytes * mhz * 1000000 / cycles / 1024));
+}
+
+#endif
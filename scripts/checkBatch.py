@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+
+"""Check that one failing entry of a pico_project.py --batch run doesn't stop the others.
+
+Runs the generator on a manifest whose first entries fail in different ways
+(a non-string project name, a PICO_CONFIG value given as a JSON number) and
+whose last entry is a plain project, against a throwaway SDK folder that
+only has what project generation reads. Exits with 1 if the batch stops
+early, a result is missing or the plain project isn't generated.
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
+
+SDK_VERSION = "2.1.0"
+
+manifest = [
+    # not a string, fails with a TypeError rather than a ProjectGenerationError
+    {"projectName": 7},
+    {"projectName": "json_config", "configs": {"PICO_STACK_SIZE": 4096}},
+    {"projectName": "plain"},
+]
+expected = {"7": False, "json_config": True, "plain": True}
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        userHome = Path(tmp, "home")
+        sdkImport = userHome / ".pico-sdk" / "sdk" / SDK_VERSION / "external"
+        sdkImport.mkdir(parents=True)
+        (sdkImport / "pico_sdk_import.cmake").write_text("# placeholder\n")
+        projectRoot = Path(tmp, "projects")
+        projectRoot.mkdir()
+        manifestPath = Path(tmp, "manifest.json")
+        manifestPath.write_text(json.dumps(manifest))
+
+        result = subprocess.run(
+            [
+                sys.executable,
+                "-m",
+                "pico_project",
+                "--batch",
+                str(manifestPath),
+                "--userHome",
+                str(userHome),
+                "--projectRoot",
+                str(projectRoot),
+                "--sdkVersion",
+                SDK_VERSION,
+                "--toolchainVersion",
+                "14_2_Rel1",
+                "--picotoolVersion",
+                SDK_VERSION,
+                "--ninjaPath",
+                "ninja",
+                "--cmakePath",
+                "cmake",
+            ],
+            cwd=SCRIPT_DIR,
+            capture_output=True,
+            text=True,
+        )
+        try:
+            results = json.loads(result.stdout)
+        except ValueError:
+            print("The batch run didn't print a result list:")
+            print(result.stdout + result.stderr)
+            sys.exit(1)
+
+        problems = []
+        success = {str(r["projectName"]): r["success"] for r in results}
+        for name, wanted in expected.items():
+            if name not in success:
+                problems.append(f"no result for {name}")
+            elif success[name] != wanted:
+                error = next(r["error"] for r in results if str(r["projectName"]) == name)
+                problems.append(f"{name}: success is {success[name]}, expected {wanted} ({error})")
+        if not (projectRoot / "plain" / "CMakeLists.txt").exists():
+            problems.append("plain wasn't generated")
+
+        for r in results:
+            print(f"{r['projectName']}: {'ok' if r['success'] else r['error']}")
+        if problems:
+            print("Batch check failed: " + "; ".join(problems))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,21 @@
 #!/usr/bin/env python3
 
+"""Build every pico-examples target as a standalone project and record which
+ones work in data/<version>/examples.json.
+
+The matrix is available as a library so other orchestrators can embed it:
+
+    from genExamples import MatrixConfig, run_matrix
+
+    for result in run_matrix(MatrixConfig(boards=["pico2"])):
+        print(result.target, result.ok)
+
+Importing this module has no side effects - toolchains are only downloaded and
+repositories only cloned once run_matrix() is called. Running it as a script
+reads its configuration from the environment (see config_from_env) and updates
+examples.json.
+"""
+
 import os
 import re
 import glob
@@ -7,42 +23,73 @@ import shutil
 import json
 import multiprocessing
 import subprocess
+import sys
 import configparser
 import platform
+import time
+from dataclasses import dataclass, field
+from typing import Iterator, Optional
 
 from pico_project import GenerateCMake, copyExampleConfigs
+import pico_sdk_index
 
-# This script is designed to be run on Linux
-assert platform.system() == "Linux"
+SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
 
-boards = ["pico", "pico_w", "pico2", "pico2_w"]
+BOARDS_DEFAULT = ["pico", "pico_w", "pico2", "pico2_w"]
 
-platforms = {
+PLATFORMS_DEFAULT = {
     "pico": ["rp2040"],
     "pico_w": ["rp2040"],
     "pico2": ["rp2350-arm-s", "rp2350-riscv"],
     "pico2_w": ["rp2350-arm-s", "rp2350-riscv"],
 }
 
-examples = {
-    "example_format": {
-        "path": "hello_world/usb",
-        "name": "usb",
-        "libPaths": [],
-        "libNames": [],
-        "boards": [],
-        "supportRiscV": False,
-    }
+# Newly generated projects built for every board/platform next to the examples,
+# as the code the generator writes for these features and options isn't covered
+# by any example. Each one is a name and the params dict keys it is generated with.
+GENERATED_DEFAULT = {
+    "benchmark": {"features": ["benchmark"]},
+    "multicore": {"features": ["multicore"]},
+    "multicore-ram": {"multicoreInRam": True},
+    "sys-clock": {"sysClockKhz": 200000},
+    "dma-stream-spi": {"dmaStream": "spi"},
+    "dma-stream-uart": {"dmaStream": "uart"},
+    "dma-stream-adc": {"dmaStream": "adc"},
+    "pio-stream": {"pioStreamBitRate": 10000000},
+    "memory-layout": {
+        "hotCodePlacement": "scratch_x",
+        "hotDataPlacement": "scratch_y",
+        "stackSize": 2048,
+    },
+    "compiler-runtime": {
+        "floatImplementation": "compiler",
+        "doubleImplementation": "compiler",
+        "dividerImplementation": "compiler",
+        "printfImplementation": "compiler",
+    },
+    "rtt": {"wantRTT": True, "wantUART": False},
 }
 
-examples.clear()
-
 CURRENT_DATA_VERSION = "0.18.0"
 
 SDK_VERSION_DEFAULT = "2.3.0"
 ARM_TOOLCHAIN_VERSION_DEFAULT = "15_2_Rel1"
 RISCV_TOOLCHAIN_VERSION_DEFAULT = "RISCV_ZCB_RPI_2_3_0_0"
 
+# Environment used when configuring pico-examples to find all targets
+CONFIGURE_ENV = {
+    "WIFI_SSID": "Your Wi-Fi SSID",
+    "WIFI_PASSWORD": "Your Wi-Fi Password",
+    "TEST_TCP_SERVER_IP": "192.168.1.100",  # This isn't read from environment variables, so also needs to be passed to cmake
+    "MQTT_SERVER": "myMQTTserver",
+}
+
+# Environment used for all configure & build steps
+BUILD_ENV = {
+    "CFLAGS": "-Werror=cpp",
+    "CXXFLAGS": "-Werror=cpp",
+}
+
 
 def env_get_default(env_var, default):
     value = os.environ.get(env_var, default)
@@ -52,155 +99,248 @@ def env_get_default(env_var, default):
     return value
 
 
-SDK_VERSION = env_get_default("SDK_VERSION", SDK_VERSION_DEFAULT)
-ARM_TOOLCHAIN_VERSION = env_get_default(
-    "ARM_TOOLCHAIN_VERSION", ARM_TOOLCHAIN_VERSION_DEFAULT
-)
-RISCV_TOOLCHAIN_VERSION = env_get_default(
-    "RISCV_TOOLCHAIN_VERSION", RISCV_TOOLCHAIN_VERSION_DEFAULT
-)
-
-FORK_NAME = env_get_default("FORK_NAME", "raspberrypi")
-
-# To test with develop SDK, uncomment the line below - this will clone the SDK & picotool, and build picotool & pioasm
-# note: the 2.3- is required due to VERSION_LESS checks in pico-vscode.cmake
-# SDK_VERSION = "2.3-develop"
-
-BUILD_TOOLS = not os.path.exists(os.path.expanduser(f"~/.pico-sdk/sdk/{SDK_VERSION}"))
-
-if "develop" in SDK_VERSION:
-    SDK_BRANCH = "develop"
-    PICOTOOL_BRANCH = "develop"
-    EXAMPLES_BRANCH = env_get_default("EXAMPLES_BRANCH", "develop")
-    BUILD_TOOLS = True  # Always clone & build the latest when using develop
-else:
-    SDK_BRANCH = SDK_VERSION
-    PICOTOOL_BRANCH = SDK_VERSION
-    EXAMPLES_BRANCH = env_get_default("EXAMPLES_BRANCH", f"sdk-{SDK_VERSION}")
-
-# Platform & toolchain setup
-platform = "linux_x64" if platform.machine() == "x86_64" else "linux_arm64"
-config = configparser.ConfigParser()
-config.read(
-    f"{os.path.dirname(os.path.realpath(__file__))}/../data/{CURRENT_DATA_VERSION}/supportedToolchains.ini"
-)
-
-# Download arm toolchain if not already downloaded
-if not os.path.exists(
-    os.path.expanduser(f"~/.pico-sdk/toolchain/{ARM_TOOLCHAIN_VERSION}")
-):
-    toolchain_url = config[ARM_TOOLCHAIN_VERSION][platform]
-    os.makedirs(
-        os.path.expanduser(f"~/.pico-sdk/toolchain/{ARM_TOOLCHAIN_VERSION}"),
-        exist_ok=True,
-    )
-    os.system(f"wget {toolchain_url}")
-    os.system(
-        f"tar -xf {toolchain_url.split('/')[-1]} --strip-components 1 -C ~/.pico-sdk/toolchain/{ARM_TOOLCHAIN_VERSION}"
-    )
-    os.system(f"rm {toolchain_url.split('/')[-1]}")
-
-# Download riscv toolchain if not already downloaded
-if not os.path.exists(
-    os.path.expanduser(f"~/.pico-sdk/toolchain/{RISCV_TOOLCHAIN_VERSION}")
-):
-    toolchain_url = config[RISCV_TOOLCHAIN_VERSION][platform]
-    os.makedirs(
-        os.path.expanduser(f"~/.pico-sdk/toolchain/{RISCV_TOOLCHAIN_VERSION}"),
-        exist_ok=True,
-    )
-    os.system(f"wget {toolchain_url}")
-    os.system(
-        f"tar -xf {toolchain_url.split('/')[-1]} -C ~/.pico-sdk/toolchain/{RISCV_TOOLCHAIN_VERSION}"
+@dataclass
+class MatrixConfig:
+    """Configuration of one example matrix run"""
+
+    sdk_version: str = SDK_VERSION_DEFAULT
+    arm_toolchain_version: str = ARM_TOOLCHAIN_VERSION_DEFAULT
+    riscv_toolchain_version: str = RISCV_TOOLCHAIN_VERSION_DEFAULT
+    fork_name: str = "raspberrypi"
+    # None means sdk-<sdk_version>, or develop for develop SDKs
+    examples_branch: Optional[str] = None
+    boards: list = field(default_factory=lambda: list(BOARDS_DEFAULT))
+    platforms: dict = field(default_factory=lambda: dict(PLATFORMS_DEFAULT))
+    # Directory for clones, build trees and errors-<board>-<platform> folders
+    work_dir: str = field(default_factory=os.getcwd)
+    data_version: str = CURRENT_DATA_VERSION
+    # Number of parallel example builds, None means one per CPU
+    processes: Optional[int] = None
+    # Clone & build the SDK, picotool and pioasm - None means only if the SDK isn't installed yet
+    build_tools: Optional[bool] = None
+    # Extra params dict keys for every conversion and generated project, to validate
+    # generator options like {"wantUnityBuild": True} against all examples
+    extra_params: dict = field(default_factory=dict)
+    # Generated projects to build, see GENERATED_DEFAULT
+    generated: dict = field(default_factory=lambda: dict(GENERATED_DEFAULT))
+    # Fail the run if the SDK index differs from a CMake configure of the SDK,
+    # otherwise the differences are only reported as warnings
+    strict_sdk_index: bool = False
+
+    @property
+    def is_develop(self):
+        return "develop" in self.sdk_version
+
+    @property
+    def sdk_branch(self):
+        return "develop" if self.is_develop else self.sdk_version
+
+    @property
+    def picotool_branch(self):
+        return "develop" if self.is_develop else self.sdk_version
+
+    @property
+    def examples_ref(self):
+        if self.examples_branch is not None:
+            return self.examples_branch
+        return "develop" if self.is_develop else f"sdk-{self.sdk_version}"
+
+    @property
+    def pico_sdk_path(self):
+        return f"~/.pico-sdk/sdk/{self.sdk_version}"
+
+    @property
+    def examples_dir(self):
+        return os.path.join(self.work_dir, "pico-examples")
+
+    @property
+    def examples_json(self):
+        return f"{SCRIPT_DIR}/../data/{self.data_version}/examples.json"
+
+    def wants_tools_build(self):
+        if self.is_develop:
+            # Always clone & build the latest when using develop
+            return True
+        if self.build_tools is not None:
+            return self.build_tools
+        return not os.path.exists(os.path.expanduser(self.pico_sdk_path))
+
+    def toolchain_version(self, platform):
+        return (
+            self.riscv_toolchain_version
+            if "riscv" in platform
+            else self.arm_toolchain_version
+        )
+
+
+@dataclass
+class JobResult:
+    """Outcome of building one example or generated project for one board/platform combination"""
+
+    board: str
+    platform: str
+    target: str
+    # Example folder and library folders, relative to pico-examples
+    path: str
+    lib_names: list
+    lib_paths: list
+    ok: bool
+    # Failed only because of a #warning, so neither recorded nor reported as an error
+    warning_only: bool = False
+    # A generated project from MatrixConfig.generated, not an example
+    generated: bool = False
+    cmake_returncode: int = 0
+    build_returncode: int = 0
+    duration: float = 0.0
+
+
+def config_from_env():
+    """Create a MatrixConfig from the environment variables set by the genExamples workflow"""
+    config = MatrixConfig(
+        sdk_version=env_get_default("SDK_VERSION", SDK_VERSION_DEFAULT),
+        arm_toolchain_version=env_get_default(
+            "ARM_TOOLCHAIN_VERSION", ARM_TOOLCHAIN_VERSION_DEFAULT
+        ),
+        riscv_toolchain_version=env_get_default(
+            "RISCV_TOOLCHAIN_VERSION", RISCV_TOOLCHAIN_VERSION_DEFAULT
+        ),
+        fork_name=env_get_default("FORK_NAME", "raspberrypi"),
     )
-    os.system(f"rm {toolchain_url.split('/')[-1]}")
+    # To test with develop SDK, set SDK_VERSION=2.3-develop - this will clone the SDK & picotool, and build picotool & pioasm
+    # note: the 2.3- is required due to VERSION_LESS checks in pico-vscode.cmake
+    examples_branch = env_get_default("EXAMPLES_BRANCH", None)
+    if examples_branch is not None:
+        config.examples_branch = examples_branch
+    # e.g. EXTRA_PARAMS='{"wantUnityBuild": true}'
+    extra_params = env_get_default("EXTRA_PARAMS", None)
+    if extra_params is not None:
+        config.extra_params = json.loads(extra_params)
+    config.strict_sdk_index = env_get_default("STRICT_SDK_INDEX", "false") == "true"
+    return config
 
-# Copy pico-vscode.cmake to ~/.pico-sdk/cmake/pico-vscode.cmake
-os.makedirs(os.path.expanduser("~/.pico-sdk/cmake"), exist_ok=True)
-shutil.copy(
-    f"{os.path.dirname(os.path.realpath(__file__))}/pico-vscode.cmake",
-    os.path.expanduser("~/.pico-sdk/cmake/pico-vscode.cmake"),
-)
 
-if BUILD_TOOLS:
-    # Clone pico-sdk
+def _run(command, cwd, env=None):
+    subprocess.run(command, shell=True, cwd=cwd, env=env)
+
+
+def _rmtree(path):
     try:
-        shutil.rmtree(os.path.expanduser(f"~/.pico-sdk/sdk/{SDK_VERSION}"))
+        shutil.rmtree(path)
     except FileNotFoundError:
         pass
-    os.system(
-        f"git -c advice.detachedHead=false clone https://github.com/raspberrypi/pico-sdk.git --depth=1 --branch {SDK_BRANCH} --recurse-submodules --shallow-submodules ~/.pico-sdk/sdk/{SDK_VERSION}"
+
+
+def _host_platform():
+    return "linux_x64" if platform.machine() == "x86_64" else "linux_arm64"
+
+
+def _install_toolchain(config, version, strip_components):
+    toolchain_dir = os.path.expanduser(f"~/.pico-sdk/toolchain/{version}")
+    if os.path.exists(toolchain_dir):
+        return
+
+    toolchains = configparser.ConfigParser()
+    toolchains.read(f"{SCRIPT_DIR}/../data/{config.data_version}/supportedToolchains.ini")
+    toolchain_url = toolchains[version][_host_platform()]
+    archive = toolchain_url.split("/")[-1]
+    os.makedirs(toolchain_dir, exist_ok=True)
+    _run(f"wget {toolchain_url}", config.work_dir)
+    _run(
+        f"tar -xf {archive} {'--strip-components 1 ' if strip_components else ''}-C {toolchain_dir}",
+        config.work_dir,
+    )
+    _run(f"rm {archive}", config.work_dir)
+
+
+def _build_tools(config):
+    sdk_version = config.sdk_version
+
+    # Clone pico-sdk
+    _rmtree(os.path.expanduser(config.pico_sdk_path))
+    _run(
+        f"git -c advice.detachedHead=false clone https://github.com/raspberrypi/pico-sdk.git --depth=1 --branch {config.sdk_branch} --recurse-submodules --shallow-submodules {config.pico_sdk_path}",
+        config.work_dir,
     )
 
     # Clone & build picotool
-    try:
-        shutil.rmtree("picotool")
-    except FileNotFoundError:
-        pass
-    try:
-        shutil.rmtree("picotool-build")
-    except FileNotFoundError:
-        pass
-    try:
-        shutil.rmtree(os.path.expanduser(f"~/.pico-sdk/picotool/{SDK_VERSION}"))
-    except FileNotFoundError:
-        pass
-    os.system(
-        f"git -c advice.detachedHead=false clone https://github.com/raspberrypi/picotool.git --depth=1 --branch {PICOTOOL_BRANCH}"
+    _rmtree(os.path.join(config.work_dir, "picotool"))
+    _rmtree(os.path.join(config.work_dir, "picotool-build"))
+    _rmtree(os.path.expanduser(f"~/.pico-sdk/picotool/{sdk_version}"))
+    _run(
+        f"git -c advice.detachedHead=false clone https://github.com/raspberrypi/picotool.git --depth=1 --branch {config.picotool_branch}",
+        config.work_dir,
     )
-    os.system(
-        f"cmake -S picotool -B picotool-build -GNinja -DPICO_SDK_PATH=~/.pico-sdk/sdk/{SDK_VERSION} -DPICOTOOL_FLAT_INSTALL=1 -DPICOTOOL_NO_LIBUSB=1"
+    _run(
+        f"cmake -S picotool -B picotool-build -GNinja -DPICO_SDK_PATH={config.pico_sdk_path} -DPICOTOOL_FLAT_INSTALL=1 -DPICOTOOL_NO_LIBUSB=1",
+        config.work_dir,
     )
-    os.system(f"cmake --build picotool-build")
-    os.system(
-        f"cmake --install picotool-build --prefix ~/.pico-sdk/picotool/{SDK_VERSION}"
+    _run("cmake --build picotool-build", config.work_dir)
+    _run(
+        f"cmake --install picotool-build --prefix ~/.pico-sdk/picotool/{sdk_version}",
+        config.work_dir,
     )
 
     # Build pioasm
-    try:
-        shutil.rmtree("pioasm-build")
-    except FileNotFoundError:
-        pass
-    try:
-        shutil.rmtree(os.path.expanduser(f"~/.pico-sdk/tools/{SDK_VERSION}"))
-    except FileNotFoundError:
-        pass
-    os.system(
-        f"cmake -S ~/.pico-sdk/sdk/{SDK_VERSION}/tools/pioasm -B pioasm-build -GNinja -DPIOASM_FLAT_INSTALL=1 -DPIOASM_VERSION_STRING={SDK_VERSION}"
+    _rmtree(os.path.join(config.work_dir, "pioasm-build"))
+    _rmtree(os.path.expanduser(f"~/.pico-sdk/tools/{sdk_version}"))
+    _run(
+        f"cmake -S {config.pico_sdk_path}/tools/pioasm -B pioasm-build -GNinja -DPIOASM_FLAT_INSTALL=1 -DPIOASM_VERSION_STRING={sdk_version}",
+        config.work_dir,
     )
-    os.system(f"cmake --build pioasm-build")
-    os.system(f"cmake --install pioasm-build --prefix ~/.pico-sdk/tools/{SDK_VERSION}")
-
-try:
-    shutil.rmtree("pico-examples")
-except FileNotFoundError:
-    pass
-try:
-    for path in glob.glob("errors-pico*"):
-        shutil.rmtree(path)
-except FileNotFoundError:
-    pass
-os.system(
-    f"git -c advice.detachedHead=false clone https://github.com/{FORK_NAME}/pico-examples.git --depth=1 --branch {EXAMPLES_BRANCH}"
-)
-
-PICO_SDK_PATH = f"~/.pico-sdk/sdk/{SDK_VERSION}"
-configure_env = {
-    "PICO_SDK_PATH": PICO_SDK_PATH,
-    "WIFI_SSID": "Your Wi-Fi SSID",
-    "WIFI_PASSWORD": "Your Wi-Fi Password",
-    "TEST_TCP_SERVER_IP": "192.168.1.100",  # This isn't read from environment variables, so also needs to be passed to cmake
-    "MQTT_SERVER": "myMQTTserver",
-}
+    _run("cmake --build pioasm-build", config.work_dir)
+    _run(
+        f"cmake --install pioasm-build --prefix ~/.pico-sdk/tools/{sdk_version}",
+        config.work_dir,
+    )
+
+
+# Setup steps already done in this process, so several matrices can share them
+_prepared = set()
+
 
-os.environ["CFLAGS"] = "-Werror=cpp"
-os.environ["CXXFLAGS"] = "-Werror=cpp"
+def prepare(config):
+    """Install toolchains & tools and clone pico-examples, skipping anything this process already did"""
+    os.makedirs(config.work_dir, exist_ok=True)
 
-updated_examples = set()
+    for version, strip_components in (
+        (config.arm_toolchain_version, True),
+        (config.riscv_toolchain_version, False),
+    ):
+        if ("toolchain", version) not in _prepared:
+            _install_toolchain(config, version, strip_components)
+            _prepared.add(("toolchain", version))
+
+    # Copy pico-vscode.cmake and the compiler cache it uses to ~/.pico-sdk/cmake
+    os.makedirs(os.path.expanduser("~/.pico-sdk/cmake"), exist_ok=True)
+    for name in ("pico-vscode.cmake", "pico-vscode-compiler.cmake"):
+        shutil.copy(
+            f"{SCRIPT_DIR}/{name}",
+            os.path.expanduser(f"~/.pico-sdk/cmake/{name}"),
+        )
 
+    if ("tools", config.sdk_version) not in _prepared:
+        if config.wants_tools_build():
+            _build_tools(config)
+        _prepared.add(("tools", config.sdk_version))
 
-def copy_btstack_sources(dir, loc):
-    pico_btstack_path = os.path.expanduser(f"{PICO_SDK_PATH}/lib/btstack")
+    examples_key = ("examples", config.work_dir, config.fork_name, config.examples_ref)
+    if examples_key not in _prepared:
+        # Only one pico-examples checkout can live in a work_dir
+        _prepared.difference_update(
+            [k for k in _prepared if k[:2] == ("examples", config.work_dir)]
+        )
+        _rmtree(config.examples_dir)
+        for path in glob.glob(os.path.join(config.work_dir, "errors-pico*")):
+            _rmtree(path)
+        _run(
+            f"git -c advice.detachedHead=false clone https://github.com/{config.fork_name}/pico-examples.git --depth=1 --branch {config.examples_ref}",
+            config.work_dir,
+        )
+        _prepared.add(examples_key)
+
+
+def copy_btstack_sources(config, dir, loc):
+    pico_btstack_path = os.path.expanduser(f"{config.pico_sdk_path}/lib/btstack")
 
     with open(f"{dir}/CMakeLists.txt", "r") as f:
         content = f.read()
@@ -232,235 +372,405 @@ def copy_btstack_sources(dir, loc):
         copy_from_block(match.group(1))
 
 
-for board in boards:
-    for platform in platforms[board]:
-        try:
-            shutil.rmtree("build")
-        except FileNotFoundError:
-            pass
-        toolchainVersion = (
-            RISCV_TOOLCHAIN_VERSION if "riscv" in platform else ARM_TOOLCHAIN_VERSION
-        )
-        toolchainPath = f"~/.pico-sdk/toolchain/{toolchainVersion}"
-        picotoolDir = f"~/.pico-sdk/picotool/{SDK_VERSION}/picotool"
+def discover_targets(config, board, platform):
+    """Configure pico-examples for one board/platform and find every example executable and library"""
+    build_dir = os.path.join(config.work_dir, "build")
+    _rmtree(build_dir)
+    toolchainPath = f"~/.pico-sdk/toolchain/{config.toolchain_version(platform)}"
+    picotoolDir = f"~/.pico-sdk/picotool/{config.sdk_version}/picotool"
 
-        # Setup env to find targets
-        for k, v in configure_env.items():
-            os.environ[k] = v
+    # Setup env to find targets
+    env = dict(os.environ, **BUILD_ENV, **CONFIGURE_ENV)
+    env["PICO_SDK_PATH"] = config.pico_sdk_path
 
-        os.system(
-            f"cmake -S pico-examples -B build -DPICO_BOARD={board} -DPICO_PLATFORM={platform} -DPICO_TOOLCHAIN_PATH={toolchainPath} -Dpicotool_DIR={picotoolDir} -DTEST_TCP_SERVER_IP=$TEST_TCP_SERVER_IP"
-        )
+    _run(
+        f"cmake -S {config.examples_dir} -B {build_dir} -DPICO_BOARD={board} -DPICO_PLATFORM={platform} -DPICO_TOOLCHAIN_PATH={toolchainPath} -Dpicotool_DIR={picotoolDir} -DTEST_TCP_SERVER_IP=$TEST_TCP_SERVER_IP",
+        config.work_dir,
+        env,
+    )
+
+    help_output = subprocess.run(
+        f"cmake --build {build_dir} --target help",
+        shell=True,
+        cwd=config.work_dir,
+        env=env,
+        capture_output=True,
+        text=True,
+    ).stdout
+
+    targets = []
+
+    for line in help_output.splitlines():
+        target = line.strip(".").strip()
+        if (
+            "all" in target
+            or "build_variant" in target
+            or target == "clean"
+            or target == "depend"
+            or target == "edit_cache"
+            or target == "rebuild_cache"
+            or target.endswith("_pio_h")
+            or target.endswith("_poll")
+        ):
+            continue
+        if target.endswith("_background"):
+            target = target[: -len("_background")]
+        targets.append(target)
+
+    target_locs = {}
+    lib_locs = {}
+
+    for root, subdirs, files in os.walk(config.examples_dir):
+        for filename in files:
+            if filename != "CMakeLists.txt":
+                continue
+            file_path = os.path.join(root, filename)
 
-        os.system("cmake --build build --target help > targets.txt")
-
-        # Clear env for clean tests
-        for k in configure_env.keys():
-            del os.environ[k]
-
-        targets = []
-
-        with open("targets.txt", "r") as f:
-            for line in f.readlines():
-                target = line.strip(".").strip()
-                if (
-                    "all" in target
-                    or "build_variant" in target
-                    or target == "clean"
-                    or target == "depend"
-                    or target == "edit_cache"
-                    or target == "rebuild_cache"
-                    or target.endswith("_pio_h")
-                    or target.endswith("_poll")
-                ):
-                    continue
-                if target.endswith("_background"):
-                    target = target[: -len("_background")]
-                targets.append(target)
-
-        walk_dir = "./pico-examples"
-        target_locs = {}
-        lib_locs = {}
-
-        for root, subdirs, files in os.walk(walk_dir):
-            for filename in files:
-                if filename != "CMakeLists.txt":
-                    continue
-                file_path = os.path.join(root, filename)
-
-                with open(file_path, "r") as f:
-                    f_content = f.read()
-                    if "add_library" in f_content:
-                        for target in targets:
-                            if f"add_library({target}" in f_content:
-                                tmp = lib_locs.get(target, {"locs": []})
-                                tmp["locs"].append(file_path)
-                                lib_locs[target] = tmp
-                    if "add_executable" in f_content:
-                        exes = []
-                        for target in targets:
-                            if (
-                                f"pico_add_extra_outputs({target})" in f_content
-                                or f"pico_add_extra_outputs({target}_background)"
-                                in f_content
-                            ):
-                                exes.append(target)
-                                tmp = target_locs.get(target, {"locs": [], "libs": []})
-                                tmp["locs"].append(file_path)
-                                target_locs[target] = tmp
-
-        for k, v in target_locs.items():
-            if len(v["locs"]) > 1:
-                raise ValueError(f"Too many locs {v}")
-            target_locs[k]["loc"] = v["locs"][0]
-            with open(v["locs"][0], "r") as f:
+            with open(file_path, "r") as f:
                 f_content = f.read()
-                for lib in lib_locs:
-                    if lib in f_content:
-                        target_locs[k]["libs"].append(lib)
-
-        for k, v in lib_locs.items():
-            if len(v["locs"]) > 1:
-                raise ValueError(f"Too many locs {v}")
-            lib_locs[k]["loc"] = v["locs"][0]
-
-        # Test build them all
-
-        # Test build function
-        def test_build(target, v):
-            dir = f"tmp-{target}"
-            try:
-                shutil.rmtree(dir)
-            except FileNotFoundError:
-                pass
-            try:
-                shutil.rmtree(f"{dir}-build")
-            except FileNotFoundError:
-                pass
-
-            os.mkdir(f"{dir}-build")
-            loc = v["loc"]
-            loc = loc.replace("/CMakeLists.txt", "")
-            shutil.copytree(loc, dir)
-            if len(v["libs"]):
-                for lib in v["libs"]:
-                    shutil.copytree(
-                        lib_locs[lib]["loc"].replace("/CMakeLists.txt", ""),
-                        f"{dir}/{lib}",
-                    )
-            isBTStackExample = "btstack_examples" in loc
-            if isBTStackExample:
-                copy_btstack_sources(dir, loc)
-            params = {
-                "projectName": target,
-                "wantOverwrite": True,
-                "wantConvert": True,
-                "wantExample": True,
-                "wantBTStackExample": isBTStackExample,
-                "boardtype": board,
-                "sdkVersion": SDK_VERSION,
-                "toolchainVersion": toolchainVersion,
-                "picotoolVersion": SDK_VERSION,
-                "exampleLibs": v["libs"],
-            }
-            GenerateCMake(dir, params)
-            copyExampleConfigs(dir)
-
-            shutil.copy(
-                os.path.expanduser(f"{PICO_SDK_PATH}/external/pico_sdk_import.cmake"),
-                f"{dir}/",
-            )
+                if "add_library" in f_content:
+                    for target in targets:
+                        if f"add_library({target}" in f_content:
+                            tmp = lib_locs.get(target, {"locs": []})
+                            tmp["locs"].append(file_path)
+                            lib_locs[target] = tmp
+                if "add_executable" in f_content:
+                    for target in targets:
+                        if (
+                            f"pico_add_extra_outputs({target})" in f_content
+                            or f"pico_add_extra_outputs({target}_background)"
+                            in f_content
+                        ):
+                            tmp = target_locs.get(target, {"locs": [], "libs": []})
+                            tmp["locs"].append(file_path)
+                            target_locs[target] = tmp
+
+    for k, v in target_locs.items():
+        if len(v["locs"]) > 1:
+            raise ValueError(f"Too many locs {v}")
+        target_locs[k]["loc"] = v["locs"][0]
+        with open(v["locs"][0], "r") as f:
+            f_content = f.read()
+            for lib in lib_locs:
+                if lib in f_content:
+                    target_locs[k]["libs"].append(lib)
+
+    for k, v in lib_locs.items():
+        if len(v["locs"]) > 1:
+            raise ValueError(f"Too many locs {v}")
+        lib_locs[k]["loc"] = v["locs"][0]
+
+    return target_locs, lib_locs
+
+
+def test_build(config, board, platform, target, v, lib_locs):
+    """Convert one example to a standalone project and build it"""
+    start = time.monotonic()
+    dir = os.path.join(config.work_dir, f"tmp-{target}")
+    _rmtree(dir)
+    _rmtree(f"{dir}-build")
+
+    os.mkdir(f"{dir}-build")
+    loc = v["loc"]
+    loc = loc.replace("/CMakeLists.txt", "")
+    shutil.copytree(loc, dir)
+    lib_dirs = [lib_locs[lib]["loc"].replace("/CMakeLists.txt", "") for lib in v["libs"]]
+    for lib, lib_dir in zip(v["libs"], lib_dirs):
+        shutil.copytree(lib_dir, f"{dir}/{lib}")
+    isBTStackExample = "btstack_examples" in loc
+    if isBTStackExample:
+        copy_btstack_sources(config, dir, loc)
+    toolchainVersion = config.toolchain_version(platform)
+    params = {
+        "projectName": target,
+        "wantOverwrite": True,
+        "wantConvert": True,
+        "wantExample": True,
+        "wantBTStackExample": isBTStackExample,
+        "boardtype": board,
+        "sdkVersion": config.sdk_version,
+        "toolchainVersion": toolchainVersion,
+        "picotoolVersion": config.sdk_version,
+        "exampleLibs": v["libs"],
+        **config.extra_params,
+    }
+    GenerateCMake(dir, params)
+    copyExampleConfigs(dir)
 
-            rescmake = subprocess.run(
-                f"cmake -S {dir} -B {dir}-build -GNinja",
-                shell=True,
-                capture_output=True,
-                text=True,
-            )
-            resbuild = subprocess.run(
-                f"cmake --build {dir}-build", shell=True, capture_output=True, text=True
+    shutil.copy(
+        os.path.expanduser(f"{config.pico_sdk_path}/external/pico_sdk_import.cmake"),
+        f"{dir}/",
+    )
+
+    env = dict(os.environ, **BUILD_ENV)
+    rescmake = subprocess.run(
+        f"cmake -S {dir} -B {dir}-build -GNinja",
+        shell=True,
+        cwd=config.work_dir,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    resbuild = subprocess.run(
+        f"cmake --build {dir}-build",
+        shell=True,
+        cwd=config.work_dir,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    build_output = (
+        rescmake.stdout + rescmake.stderr + resbuild.stdout + resbuild.stderr
+    )
+    ok = not (rescmake.returncode or resbuild.returncode)
+    warning_only = False
+    if not ok:
+        if "error: #warning" in build_output:
+            print(f"Skipping #warning-only failure for {target}")
+            warning_only = True
+        else:
+            print(
+                f"Error occurred with {target} {v} - cmake {rescmake.returncode}, build {resbuild.returncode}"
             )
-            build_output = (
-                rescmake.stdout + rescmake.stderr + resbuild.stdout + resbuild.stderr
+            shutil.copytree(
+                dir, os.path.join(config.work_dir, f"errors-{board}-{platform}", target)
             )
-            ret = None
-            if rescmake.returncode or resbuild.returncode:
-                if "error: #warning" in build_output:
-                    print(f"Skipping #warning-only failure for {target}")
-                else:
-                    print(
-                        f"Error occurred with {target} {v} - cmake {rescmake.returncode}, build {resbuild.returncode}"
-                    )
-                    shutil.copytree(dir, f"errors-{board}-{platform}/{target}")
-            else:
-                ret = (target, v, loc)
 
-            shutil.rmtree(dir)
-            shutil.rmtree(f"{dir}-build")
-            return ret
+    shutil.rmtree(dir)
+    shutil.rmtree(f"{dir}-build")
+
+    examples_prefix = f"{config.examples_dir}/"
+    return JobResult(
+        board=board,
+        platform=platform,
+        target=target,
+        path=loc.replace(examples_prefix, ""),
+        lib_names=list(v["libs"]),
+        lib_paths=[lib_dir.replace(examples_prefix, "") for lib_dir in lib_dirs],
+        ok=ok,
+        warning_only=warning_only,
+        cmake_returncode=rescmake.returncode,
+        build_returncode=resbuild.returncode,
+        duration=time.monotonic() - start,
+    )
+
+
+def generated_build(config, board, platform, name, entry):
+    """Generate a new project from the params dict keys in entry and build it"""
+    start = time.monotonic()
+    target = f"generated-{name}"
+    dir = os.path.join(config.work_dir, f"tmp-{target}-{board}-{platform}")
+    _rmtree(dir)
+    os.mkdir(dir)
+
+    # The batch manifest passes extra_params through as params keys
+    manifest = os.path.join(dir, "manifest.json")
+    with open(manifest, "w") as f:
+        json.dump(
+            [{"projectName": target, **entry, **config.extra_params}], f
+        )
+    resgen = subprocess.run(
+        [
+            sys.executable,
+            "pico_project.py",
+            "--batch",
+            manifest,
+            "--boardtype",
+            board,
+            "--sdkVersion",
+            config.sdk_version,
+            "--toolchainVersion",
+            config.toolchain_version(platform),
+            "--picotoolVersion",
+            config.sdk_version,
+            "--userHome",
+            os.path.expanduser("~"),
+            "--projectRoot",
+            dir,
+        ],
+        cwd=SCRIPT_DIR,
+        capture_output=True,
+        text=True,
+    )
+
+    project = os.path.join(dir, target)
+    env = dict(os.environ, **BUILD_ENV)
+    rescmake = subprocess.run(
+        f"cmake -S {project} -B {project}/build -GNinja",
+        shell=True,
+        cwd=config.work_dir,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    resbuild = subprocess.run(
+        f"cmake --build {project}/build",
+        shell=True,
+        cwd=config.work_dir,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    ok = not (resgen.returncode or rescmake.returncode or resbuild.returncode)
+    if not ok:
+        print(
+            f"Error occurred with {target} - generate {resgen.returncode}, cmake {rescmake.returncode}, build {resbuild.returncode}"
+        )
+        _rmtree(f"{project}/build")
+        shutil.copytree(
+            project, os.path.join(config.work_dir, f"errors-{board}-{platform}", target)
+        )
+
+    shutil.rmtree(dir)
+
+    return JobResult(
+        board=board,
+        platform=platform,
+        target=target,
+        path="",
+        lib_names=[],
+        lib_paths=[],
+        ok=ok,
+        generated=True,
+        cmake_returncode=rescmake.returncode,
+        build_returncode=resbuild.returncode,
+        duration=time.monotonic() - start,
+    )
 
-        with multiprocessing.Pool(processes=os.cpu_count()) as pool:
-            ret = pool.starmap(
-                test_build,
-                [(target, v) for target, v in target_locs.items()],
+
+def _run_job(job):
+    fn, args = job
+    return fn(*args)
+
+
+def run_matrix(config):
+    """Build all examples and generated projects for every board/platform in config, yielding each JobResult as soon as it finishes
+
+    Results are streamed per board/platform - all results for one combination are
+    yielded before the next combination is configured.
+    """
+    prepare(config)
+
+    for board in config.boards:
+        for platform in config.platforms[board]:
+            target_locs, lib_locs = discover_targets(config, board, platform)
+            jobs = [
+                (test_build, (config, board, platform, target, v, lib_locs))
+                for target, v in target_locs.items()
+            ]
+            jobs += [
+                (generated_build, (config, board, platform, name, entry))
+                for name, entry in config.generated.items()
+            ]
+            with multiprocessing.Pool(
+                processes=config.processes or os.cpu_count()
+            ) as pool:
+                for result in pool.imap_unordered(_run_job, jobs):
+                    yield result
+
+
+def record_example(examples, result):
+    """Merge a successful JobResult into an examples.json style dict"""
+    if examples.get(result.target) != None:
+        example = examples[result.target]
+        assert example["path"] == result.path
+        assert example["name"] == result.target
+        assert example["libPaths"] == result.lib_paths
+        assert example["libNames"] == result.lib_names
+        if not result.board in example["boards"]:
+            example["boards"].append(result.board)
+        example["supportRiscV"] |= "riscv" in result.platform
+    else:
+        examples[result.target] = {
+            "path": result.path,
+            "name": result.target,
+            "libPaths": result.lib_paths,
+            "libNames": result.lib_names,
+            "boards": [result.board],
+            "supportRiscV": "riscv" in result.platform,
+        }
+
+
+def write_examples(config, examples, keep_only=None):
+    """Update examples.json with examples, optionally dropping all entries not in keep_only"""
+    with open(config.examples_json, "r") as f:
+        current_examples = dict(json.load(f))
+
+    current_examples.update(examples)
+    if keep_only is not None:
+        current_examples = {
+            k: v for k, v in current_examples.items() if k in keep_only
+        }
+
+    with open(config.examples_json, "w") as f:
+        json.dump(current_examples, f, indent=4)
+
+
+def check_sdk_index(config):
+    """Problems of the SDK index the generator uses, checked against a CMake configure of the SDK"""
+    home = os.path.expanduser("~")
+    index = pico_sdk_index.LoadIndex(home, config.sdk_version)
+    if index is None:
+        return [f"SDK {config.sdk_version} is not installed"]
+    problems = []
+    for chip in pico_sdk_index.CHIP_FOLDERS:
+        problems += [
+            f"{chip} {problem}"
+            for problem in pico_sdk_index.CheckAgainstCMake(
+                index,
+                chip,
+                os.path.expanduser(config.pico_sdk_path),
+                toolchainPath=os.path.join(
+                    home, ".pico-sdk", "toolchain", config.arm_toolchain_version
+                ),
             )
-            ret = filter(lambda x: x != None, ret)
-            for target, v, loc in ret:
-                if examples.get(target) != None:
-                    example = examples[target]
-                    assert example["path"] == loc.replace(f"{walk_dir}/", "")
-                    assert example["name"] == target
-                    assert example["libPaths"] == [
-                        lib_locs[lib]["loc"]
-                        .replace("/CMakeLists.txt", "")
-                        .replace(f"{walk_dir}/", "")
-                        for lib in v["libs"]
-                    ]
-                    assert example["libNames"] == v["libs"]
-                    if not board in example["boards"]:
-                        example["boards"].append(board)
-                    example["supportRiscV"] |= "riscv" in platform
-                else:
-                    examples[target] = {
-                        "path": loc.replace(f"{walk_dir}/", ""),
-                        "name": target,
-                        "libPaths": [
-                            lib_locs[lib]["loc"]
-                            .replace("/CMakeLists.txt", "")
-                            .replace(f"{walk_dir}/", "")
-                            for lib in v["libs"]
-                        ],
-                        "libNames": v["libs"],
-                        "boards": [board],
-                        "supportRiscV": "riscv" in platform,
-                    }
+        ]
+    return problems
+
+
+def main():
+    # This script is designed to be run on Linux
+    assert platform.system() == "Linux"
+
+    config = config_from_env()
+
+    if config.extra_params:
+        # Validating generator options, examples.json only records the default conversion
+        failed = [r for r in run_matrix(config) if not (r.ok or r.warning_only)]
+        for result in failed:
+            print(f"Failed with {config.extra_params}: {result.target} ({result.board}, {result.platform})")
+        sys.exit(1 if failed else 0)
+
+    examples = {}
+    failed_generated = []
+    current = None
+
+    for result in run_matrix(config):
         # Write out after each platform
-        with open(
-            f"{os.path.dirname(os.path.realpath(__file__))}/../data/{CURRENT_DATA_VERSION}/examples.json",
-            "r",
-        ) as f:
-            current_examples = json.load(f)
-
-        current_examples.update(examples)
-        updated_examples.update(examples.keys())
-
-        with open(
-            f"{os.path.dirname(os.path.realpath(__file__))}/../data/{CURRENT_DATA_VERSION}/examples.json",
-            "w",
-        ) as f:
-            json.dump(current_examples, f, indent=4)
-
-# Finalise list, removing any examples no longer supported
-with open(
-    f"{os.path.dirname(os.path.realpath(__file__))}/../data/{CURRENT_DATA_VERSION}/examples.json",
-    "r",
-) as f:
-    current_examples = dict(json.load(f))
-
-current_examples = {k: v for k, v in current_examples.items() if k in updated_examples}
-
-with open(
-    f"{os.path.dirname(os.path.realpath(__file__))}/../data/{CURRENT_DATA_VERSION}/examples.json",
-    "w",
-) as f:
-    json.dump(current_examples, f, indent=4)
+        if current is not None and current != (result.board, result.platform):
+            write_examples(config, examples)
+        current = (result.board, result.platform)
+        if result.generated:
+            if not result.ok:
+                failed_generated.append(result)
+        elif result.ok:
+            record_example(examples, result)
+
+    # Finalise list, removing any examples no longer supported
+    write_examples(config, examples, keep_only=set(examples.keys()))
+
+    for result in failed_generated:
+        print(f"Failed to build {result.target} ({result.board}, {result.platform})")
+
+    # differences can be gaps of the index's CMake parser that don't affect
+    # any example, so they only fail the run when asked to
+    index_problems = check_sdk_index(config)
+    for problem in index_problems:
+        print(f"{'Error' if config.strict_sdk_index else 'Warning'}: SDK index: {problem}")
+
+    if failed_generated or (config.strict_sdk_index and index_problems):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
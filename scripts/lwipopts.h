@@ -5,6 +5,32 @@
 // Common settings used in most of the pico_w examples
 // (see https://www.nongnu.org/lwip/2_1_x/group__lwip__opts.html for details)
 
+#if PICO_CYW43_ARCH_FREERTOS
+// lwIP runs in its own FreeRTOS task (pico_cyw43_arch_lwip_sys_freertos)
+#ifndef NO_SYS
+#define NO_SYS                      0
+#endif
+#ifndef TCPIP_THREAD_STACKSIZE
+#define TCPIP_THREAD_STACKSIZE      1024
+#endif
+#ifndef DEFAULT_THREAD_STACKSIZE
+#define DEFAULT_THREAD_STACKSIZE    1024
+#endif
+#ifndef DEFAULT_RAW_RECVMBOX_SIZE
+#define DEFAULT_RAW_RECVMBOX_SIZE   8
+#endif
+#ifndef TCPIP_MBOX_SIZE
+#define TCPIP_MBOX_SIZE             8
+#endif
+#ifndef LWIP_TIMEVAL_PRIVATE
+#define LWIP_TIMEVAL_PRIVATE        0
+#endif
+// received packets are handed to lwIP under the core lock instead of a message to its task
+#ifndef LWIP_TCPIP_CORE_LOCKING_INPUT
+#define LWIP_TCPIP_CORE_LOCKING_INPUT 1
+#endif
+#endif
+
 // allow override in some examples
 #ifndef NO_SYS
 #define NO_SYS                      1
@@ -0,0 +1,39 @@
+#ifndef _PICO_VSCODE_MEMORY_LAYOUT_H
+#define _PICO_VSCODE_MEMORY_LAYOUT_H
+
+// Placement of hot code and data
+//
+// Mark functions with HOT_FUNC(name) and buffers with HOT_DATA(name), then
+// choose where they go with PICO_VSCODE_HOT_CODE and PICO_VSCODE_HOT_DATA in
+// CMakeLists.txt:
+//
+//   flash      run through the XIP cache, the default for code
+//   sram       striped main SRAM, spread over all banks
+//   scratch_x  the 4K scratch X bank, which also holds the core 1 stack
+//   scratch_y  the 4K scratch Y bank, which also holds the core 0 stack
+//
+// Code in RAM doesn't stall on XIP cache misses. Giving a core's hot code and
+// data a scratch bank of their own keeps DMA and the other core, which use the
+// striped banks, from contending with it.
+
+#include "pico.h"
+
+#if PICO_VSCODE_HOT_CODE_SRAM
+#define HOT_FUNC(name) __not_in_flash_func(name)
+#elif PICO_VSCODE_HOT_CODE_SCRATCH_X
+#define HOT_FUNC(name) __attribute__((section(".scratch_x." __STRING(name)))) name
+#elif PICO_VSCODE_HOT_CODE_SCRATCH_Y
+#define HOT_FUNC(name) __attribute__((section(".scratch_y." __STRING(name)))) name
+#else
+#define HOT_FUNC(name) name
+#endif
+
+#if PICO_VSCODE_HOT_DATA_SCRATCH_X
+#define HOT_DATA(name) __scratch_x(__STRING(name)) name
+#elif PICO_VSCODE_HOT_DATA_SCRATCH_Y
+#define HOT_DATA(name) __scratch_y(__STRING(name)) name
+#else
+#define HOT_DATA(name) name
+#endif
+
+#endif
@@ -0,0 +1,66 @@
+# Included by project() before and after it enables languages, see pico-vscode.cmake
+#
+# The first configure with a toolchain, SDK toolchain file, platform and CMake
+# version runs CMake's compiler identification, ABI detection and compiler
+# checks as usual, and their results are saved under ~/.pico-sdk/cmake/compiler-cache.
+# Later configures of any project with the same combination load those results
+# and mark the compilers as forced, so CMake skips the try_compile steps.
+# Nothing is loaded if the compiler binary changed or is gone since the capture,
+# so a reinstalled or broken toolchain is checked by CMake again.
+
+if(NOT CMAKE_CURRENT_SOURCE_DIR STREQUAL CMAKE_SOURCE_DIR OR NOT CMAKE_TOOLCHAIN_FILE)
+    return()
+endif()
+
+string(MD5 picoVscodeCompilerKey "${CMAKE_TOOLCHAIN_FILE};${PICO_TOOLCHAIN_PATH};${PICO_PLATFORM}")
+set(picoVscodeCompilerCache "${USERHOME}/.pico-sdk/cmake/compiler-cache/${CMAKE_VERSION}/${picoVscodeCompilerKey}.cmake")
+
+if(NOT CMAKE_C_COMPILER_LOADED)
+    # before the languages are enabled: load the saved results, the file checks the compiler itself
+    if(EXISTS ${picoVscodeCompilerCache})
+        include(${picoVscodeCompilerCache})
+    endif()
+    return()
+endif()
+
+# after the languages are enabled: save the results of a configure that really ran the checks
+if(EXISTS ${picoVscodeCompilerCache} OR CMAKE_C_COMPILER_FORCED OR NOT CMAKE_C_ABI_COMPILED)
+    return()
+endif()
+
+file(TIMESTAMP ${CMAKE_C_COMPILER} picoVscodeCompilerTime "%Y-%m-%dT%H:%M:%S" UTC)
+string(CONCAT picoVscodeCompilerContent
+    "# Generated by pico-vscode-compiler.cmake from a configure of ${CMAKE_SOURCE_DIR}\n"
+    "# Toolchain file ${CMAKE_TOOLCHAIN_FILE}, platform ${PICO_PLATFORM}\n"
+    "file(TIMESTAMP \"${CMAKE_C_COMPILER}\" picoVscodeCompilerTime \"%Y-%m-%dT%H:%M:%S\" UTC)\n"
+    "if(NOT picoVscodeCompilerTime STREQUAL \"${picoVscodeCompilerTime}\")\n"
+    "    return()\n"
+    "endif()\n"
+)
+foreach(lang IN ITEMS C CXX)
+    set(picoVscodeCompilerFile "${CMAKE_BINARY_DIR}/CMakeFiles/${CMAKE_VERSION}/CMake${lang}Compiler.cmake")
+    if(NOT CMAKE_${lang}_COMPILER_LOADED OR NOT CMAKE_${lang}_ABI_COMPILED OR NOT EXISTS ${picoVscodeCompilerFile})
+        continue()
+    endif()
+    # identification and ABI results, without the state of this build tree; the
+    # semicolons of list values are kept out of the way of the list commands
+    file(READ ${picoVscodeCompilerFile} picoVscodeCompilerLines)
+    string(REPLACE ";" "<semicolon>" picoVscodeCompilerLines "${picoVscodeCompilerLines}")
+    string(REPLACE "\n" ";" picoVscodeCompilerLines "${picoVscodeCompilerLines}")
+    list(FILTER picoVscodeCompilerLines INCLUDE
+        REGEX "^set\\((CMAKE_${lang}[0-9]*_|CMAKE_COMPILER_IS_GNU)")
+    list(FILTER picoVscodeCompilerLines EXCLUDE
+        REGEX "^set\\(CMAKE_${lang}_(COMPILER|COMPILER_LOADED|COMPILER_WORKS|COMPILER_ENV_VAR|COMPILER_ID_RUN) ")
+    list(JOIN picoVscodeCompilerLines "\n" picoVscodeCompilerLines)
+    string(REPLACE "<semicolon>" ";" picoVscodeCompilerLines "${picoVscodeCompilerLines}")
+    string(APPEND picoVscodeCompilerContent
+        "set(CMAKE_${lang}_COMPILER_ID_RUN TRUE)\n"
+        "set(CMAKE_${lang}_COMPILER_FORCED TRUE)\n"
+        "${picoVscodeCompilerLines}\n"
+    )
+endforeach()
+
+# written next to the cache file and renamed, so parallel configures never see half a file
+string(RANDOM picoVscodeCompilerSuffix)
+file(WRITE "${picoVscodeCompilerCache}.${picoVscodeCompilerSuffix}" "${picoVscodeCompilerContent}")
+file(RENAME "${picoVscodeCompilerCache}.${picoVscodeCompilerSuffix}" ${picoVscodeCompilerCache})
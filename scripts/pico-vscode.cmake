@@ -1,6 +1,14 @@
 set(PICO_SDK_PATH "${USERHOME}/.pico-sdk/sdk/${sdkVersion}")
 set(PICO_TOOLCHAIN_PATH "${USERHOME}/.pico-sdk/toolchain/${toolchainVersion}")
 
+# Reuse the compiler identification of earlier configures with this toolchain
+set(picoVscodeCompiler ${CMAKE_CURRENT_LIST_DIR}/pico-vscode-compiler.cmake)
+if((CMAKE_VERSION VERSION_GREATER_EQUAL "3.15") AND EXISTS ${picoVscodeCompiler}
+        AND NOT DEFINED CMAKE_PROJECT_INCLUDE_BEFORE AND NOT DEFINED CMAKE_PROJECT_INCLUDE)
+    set(CMAKE_PROJECT_INCLUDE_BEFORE ${picoVscodeCompiler})
+    set(CMAKE_PROJECT_INCLUDE ${picoVscodeCompiler})
+endif()
+
 if (sdkVersion VERSION_LESS "2.0.0")
     if(WIN32)
         set(pico-sdk-tools_DIR "${USERHOME}/.pico-sdk/tools/${sdkVersion}")
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+
+#
+# Copyright (c) 2020-2024 Raspberry Pi (Trading) Ltd.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+#
+
+"""Extract the PICO_CONFIG table of an installed Pico SDK
+
+Scans the sources of the SDK's src/ tree (in parallel) for
+`// PICO_CONFIG: NAME, description, type=..., default=..., group=...`
+annotations and writes them to ~/.pico-sdk/cmake/pico-configs/<version>.tsv,
+in the same format as scripts/pico_configs.tsv. Results are cached per file,
+keyed on mtime, size and content hash, so rerunning it after an SDK update
+only parses the files that changed.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+# Bump when the table format or the parser changes, so older caches are not used
+CACHE_VERSION = 1
+
+COLUMNS = (
+    "name",
+    "location",
+    "description",
+    "type",
+    "advanced",
+    "default",
+    "depends",
+    "group",
+    "max",
+    "min",
+)
+
+SOURCE_SUFFIXES = (".h", ".c", ".S")
+
+_config_re = re.compile(r"//\s*PICO_CONFIG:\s*(\w+)\s*,\s*(.*)$")
+_attribute_re = re.compile(r"^(\w+)=(.*)$")
+
+
+def TablePath(userHome, sdkVersion):
+    return Path(userHome, ".pico-sdk", "cmake", "pico-configs", f"{sdkVersion}.tsv")
+
+
+def CachePath(userHome, sdkVersion):
+    return Path(userHome, ".pico-sdk", "cmake", "pico-configs", f"{sdkVersion}.cache.json")
+
+
+def ParseConfigLine(line):
+    """Row of the PICO_CONFIG annotation in line, without its location, or None
+
+    Descriptions can contain commas, so the key=value attributes are taken from
+    the end of the annotation and everything before them is the description.
+    """
+    match = _config_re.search(line)
+    if match is None:
+        return None
+
+    parts = [part.strip() for part in match.group(2).split(",")]
+    row = {column: "" for column in COLUMNS}
+    row["name"] = match.group(1)
+    while len(parts) > 1:
+        attribute = _attribute_re.match(parts[-1])
+        if attribute is None or attribute.group(1) not in COLUMNS:
+            break
+        row[attribute.group(1)] = attribute.group(2).strip()
+        parts.pop()
+    row["description"] = ", ".join(parts)
+    return row
+
+
+def ParseFile(job):
+    """Hash of one source file and the rows of its PICO_CONFIG annotations
+
+    The rows are None if the hash is still oldHash, the cached ones are valid then.
+    """
+    sdkPath, relativePath, oldHash = job
+    with open(Path(sdkPath, relativePath), "rb") as f:
+        content = f.read()
+    digest = hashlib.sha256(content).hexdigest()
+    if digest == oldHash:
+        return relativePath, digest, None
+
+    rows = []
+    for number, line in enumerate(
+        content.decode("utf-8", errors="replace").splitlines(), 1
+    ):
+        if "PICO_CONFIG:" not in line:
+            continue
+        row = ParseConfigLine(line)
+        if row is not None:
+            row["location"] = f"{relativePath}:{number}"
+            rows.append(row)
+    return relativePath, digest, rows
+
+
+def FindSources(sdkPath):
+    """Paths relative to sdkPath of all scanned sources, with their (mtime, size)"""
+    sources = {}
+    srcPath = Path(sdkPath, "src")
+    for root, dirs, files in os.walk(srcPath):
+        dirs.sort()
+        for name in sorted(files):
+            if name.endswith(SOURCE_SUFFIXES):
+                path = os.path.join(root, name)
+                stat = os.stat(path)
+                relativePath = Path(path).relative_to(sdkPath).as_posix()
+                sources[relativePath] = [stat.st_mtime, stat.st_size]
+    return sources
+
+
+def _LoadCache(cachePath):
+    try:
+        with open(cachePath, "r") as f:
+            cache = json.load(f)
+        if cache.get("cacheVersion") == CACHE_VERSION:
+            return cache["files"]
+    except (OSError, ValueError, KeyError):
+        pass
+    return {}
+
+
+def _WriteAtomically(path, content):
+    os.makedirs(path.parent, exist_ok=True)
+    tmpPath = f"{path}.{os.getpid()}.tmp"
+    with open(tmpPath, "w", newline="\n") as f:
+        f.write(content)
+    os.replace(tmpPath, path)
+
+
+def ExtractConfigs(userHome, sdkVersion, processes=None):
+    """Update the PICO_CONFIG table of the installed SDK sdkVersion and return its path
+
+    Returns None if the SDK isn't installed.
+    """
+    sdkPath = Path(userHome, ".pico-sdk", "sdk", sdkVersion)
+    if not Path(sdkPath, "src").is_dir():
+        return None
+
+    cachePath = CachePath(userHome, sdkVersion)
+    tablePath = TablePath(userHome, sdkVersion)
+    cached = _LoadCache(cachePath)
+    sources = FindSources(sdkPath)
+
+    files = {}
+    changed = []
+    for relativePath, stat in sources.items():
+        entry = cached.get(relativePath)
+        if entry is not None and entry["stat"] == stat:
+            files[relativePath] = entry
+        else:
+            changed.append(relativePath)
+
+    if not changed and len(files) == len(cached) and tablePath.exists():
+        return tablePath
+
+    if changed:
+        jobs = [
+            (os.fspath(sdkPath), relativePath, cached.get(relativePath, {}).get("hash"))
+            for relativePath in changed
+        ]
+        with ProcessPoolExecutor(processes) as pool:
+            for relativePath, digest, rows in pool.map(ParseFile, jobs, chunksize=32):
+                if rows is None:
+                    # only the mtime changed, e.g. after a fresh checkout of the same version
+                    rows = cached[relativePath]["rows"]
+                files[relativePath] = {
+                    "stat": sources[relativePath],
+                    "hash": digest,
+                    "rows": rows,
+                }
+
+    rows = {}
+    for relativePath in sorted(files):
+        for row in files[relativePath]["rows"]:
+            # the first definition wins, like in the SDK's own config documentation
+            rows.setdefault(row["name"], row)
+
+    table = "\t".join(COLUMNS) + "\n"
+    for name in sorted(rows):
+        table += "\t".join(rows[name][column] for column in COLUMNS) + "\n"
+
+    _WriteAtomically(tablePath, table)
+    _WriteAtomically(
+        cachePath, json.dumps({"cacheVersion": CACHE_VERSION, "files": files})
+    )
+    return tablePath
+
+
+def LoadTable(path):
+    """Rows of a PICO_CONFIG table, by config name"""
+    with open(path, "r") as f:
+        lines = f.read().splitlines()
+    header = lines[0].split("\t")
+    table = {}
+    for line in lines[1:]:
+        if line:
+            row = dict(zip(header, line.split("\t")))
+            table[row["name"]] = row
+    return table
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("sdkVersion", help="Version of the installed SDK")
+    parser.add_argument(
+        "-home", "--userHome", default=Path.home(), help="Folder containing .pico-sdk"
+    )
+    parser.add_argument(
+        "-j", "--processes", type=int, help="Number of parser processes"
+    )
+    args = parser.parse_args()
+
+    tablePath = ExtractConfigs(args.userHome, args.sdkVersion, args.processes)
+    if tablePath is None:
+        print(f"SDK {args.sdkVersion} is not installed")
+        sys.exit(-1)
+    print(f"{len(LoadTable(tablePath))} PICO_CONFIG entries in {tablePath}")
+
+
+if __name__ == "__main__":
+    main()
@@ -18,14 +18,50 @@ import shutil
 from pathlib import Path
 import sys
 import re
-import platform
-import csv
 import json
+import io
+import time
+import contextlib
 
 sourcefolder = os.path.dirname(os.path.abspath(__file__))
 
+# Startup budget: every New Project click waits for this script, so its cold
+# start on top of the bare interpreter start-up has to stay below this, as
+# measured by benchStartup.py. Only import what every run needs at the top of
+# this file and build large tables lazily (see CodeFragments).
+STARTUP_BUDGET_MS = 60
+
+# Build profiles a generated project can switch between, see BuildProfileCMake
+build_profiles = {
+    "default": "SDK defaults for the build type",
+    "max-speed": "copy_to_ram, -O3 and link-time optimisation",
+    "min-size": "-Os and link-time optimisation",
+}
+
+# Sources per unity build batch, enough to amortise the compiler start-up
+# without making a single changed file recompile half the project
+UNITY_BATCH_SIZE = 8
+
 CMAKELIST_FILENAME = "CMakeLists.txt"
 CMAKECACHE_FILENAME = "CMakeCache.txt"
+PROJECT_LINKER_SCRIPT = "memmap_custom.ld"
+CMAKE_FINGERPRINT_FILENAME = "pico-vscode-fingerprint.txt"
+
+# params that end up in the CMake cache of a generated project, see CMakeFingerprint
+CMAKE_FINGERPRINT_PARAMS = (
+    "boardtype",
+    "sdkVersion",
+    "toolchainVersion",
+    "picotoolVersion",
+    "configs",
+    "wantRunFromRAM",
+    "cmakePath",
+    "ninjaPath",
+    "buildProfile",
+    "freertosKernelPath",
+    "hotCodePlacement",
+    "hotDataPlacement",
+)
 
 ARM_TRIPLE = "arm-none-eabi"
 RISCV_TRIPLE = "riscv32-unknown-elf"
@@ -90,6 +126,20 @@ features_list = {
         "",
     ),
     "clocks": ("HW clocks", "clocks.c", "hardware/clocks.h", "hardware_clocks", ""),
+    "benchmark": (
+        "Benchmark harness",
+        "benchmark.c",
+        "benchmark.h",
+        "hardware_timer",
+        "benchmark.h",
+    ),
+    "multicore": (
+        "Multicore",
+        "multicore.c",
+        "pico/multicore.h",
+        "pico_multicore",
+        "",
+    ),
 }
 
 picow_options_list = {
@@ -115,9 +165,89 @@ picow_options_list = {
         "pico_cyw43_arch_lwip_threadsafe_background",
         "lwipopts.h",
     ),
-    #    'picow_freertos' :  ("Full lwIP (FreeRTOS)", "",            "pico/cyw43_arch.h",    "pico_cyw43_arch_lwip_sys_freertos",                "lwipopts.h"),
+    "picow_freertos": (
+        "Full lwIP (FreeRTOS)",
+        "",
+        "pico/cyw43_arch.h",
+        "pico_cyw43_arch_lwip_sys_freertos",
+        "lwipopts.h",
+    ),
+}
+
+# Features the generator adds for options rather than -f, their code fragments
+# depend on the option's value (see OptionFragments)
+generator_option_features = {
+    "sys_clock": ("System clock", "", "hardware/vreg.h", "hardware_vreg", ""),
+    "dma_stream_spi": ("SPI DMA stream", "", "hardware/spi.h", "hardware_spi", ""),
+    "dma_stream_uart": ("UART DMA stream", "", "hardware/uart.h", "hardware_uart", ""),
+    "dma_stream_adc": ("ADC DMA stream", "", "hardware/adc.h", "hardware_adc", ""),
+    "dma_stream": ("DMA stream", "", "hardware/dma.h", "hardware_dma", ""),
+    # no code of its own, for option features that use DMA
+    "dma_channels": ("DMA channels", "", "hardware/dma.h", "hardware_dma", ""),
+    "pio_stream": ("PIO DMA stream", "", "hardware/pio.h", "hardware_pio", "pio_stream.pio"),
+    "memory_layout": ("Memory layout", "", "memory_layout.h", "", "memory_layout.h"),
+    "freertos_kernel": (
+        "FreeRTOS kernel",
+        "",
+        "FreeRTOS.h",
+        "FreeRTOS-Kernel-Heap4",
+        "FreeRTOSConfig.h",
+    ),
+}
+
+# Runtime implementations each platform's SDK libraries offer, per
+# pico_set_<kind>_implementation call. "default" leaves the SDK's choice.
+runtime_implementations = {
+    "float": {
+        "rp2040": ("default", "pico", "compiler", "none"),
+        # pico is pico_vfp, the single precision FPU
+        "rp2350-arm-s": ("default", "pico", "pico_vfp", "pico_dcp", "compiler", "none"),
+        "rp2350-riscv": ("default", "pico", "compiler", "none"),
+    },
+    "double": {
+        "rp2040": ("default", "pico", "compiler", "none"),
+        # pico is pico_dcp, the double precision coprocessor
+        "rp2350-arm-s": ("default", "pico", "pico_dcp", "compiler", "none"),
+        "rp2350-riscv": ("default", "pico", "compiler", "none"),
+    },
+    # only the RP2040 has the SIO hardware divider, the RP2350 cores divide in an instruction
+    "divider": {
+        "rp2040": ("default", "hardware", "hardware_explicit", "compiler"),
+        "rp2350-arm-s": ("default", "compiler"),
+        "rp2350-riscv": ("default", "compiler"),
+    },
+    "printf": {
+        "rp2040": ("default", "pico", "compiler", "none"),
+        "rp2350-arm-s": ("default", "pico", "compiler", "none"),
+        "rp2350-riscv": ("default", "pico", "compiler", "none"),
+    },
+}
+
+# Where --hotCodePlacement and --hotDataPlacement can put code and data marked
+# with the HOT_FUNC and HOT_DATA macros of memory_layout.h
+hot_code_placements = ("flash", "sram", "scratch_x", "scratch_y")
+hot_data_placements = ("sram", "scratch_x", "scratch_y")
+
+# Size of each scratch bank, which the default linker scripts put a core's stack in
+SCRATCH_BANK_SIZE = 4096
+
+# SDK linker scripts to start a project-local one from, newest SDK layout first
+sdk_linker_script_dirs = (
+    "src/rp2_common/pico_standard_link/{chip}",
+    "src/rp2_common/pico_crt0/{chip}",
+)
+
+# FreeRTOS kernel port folder for each platform, under portable/ThirdParty/GCC
+freertos_ports = {
+    "rp2040": "RP2040",
+    "rp2350": "RP2350_ARM_NTZ",
+    "rp2350-arm-s": "RP2350_ARM_NTZ",
+    "rp2350-riscv": "RP2350_RISC-V",
 }
 
+# Peripherals --dmaStream can stream to or from
+dma_stream_peripherals = ("spi", "uart", "adc")
+
 stdlib_examples_list = {
     "uart": ("UART", "uart.c", "hardware/uart.h", "hardware_uart"),
     "gpio": ("GPIO interface", "gpio.c", "hardware/gpio.h", "hardware_gpio"),
@@ -134,272 +264,687 @@ debugger_config_list = ["interface/cmsis-dap.cfg", "raspberrypi-swd.cfg"]
 
 DEFINES = 0
 INITIALISERS = 1
+# Optional, code that has to run before stdio_init_all()
+PRE_INITIALISERS = 2
 # Could add an extra item that shows how to use some of the available functions for the feature
-# EXAMPLE = 2
-
-# This also contains example code for the standard library (see stdlib_examples_list)
-code_fragments_per_feature = {
-    "uart": [
+# EXAMPLE = 3
+
+
+def MulticoreFragments(inRam):
+    """Code fragments of the multicore feature, with core 1's loop and data in RAM if inRam"""
+    if inRam:
+        data = [
+            "// Core 1's data is in its scratch RAM bank (SCRATCH_X, which also holds its stack)",
+            'static uint32_t __scratch_x("core1") core1_table[256];',
+        ]
+        entry = [
+            "// Core 1: take work items, process them and send back the results. It runs from",
+            "// RAM so it doesn't stall on flash (XIP) while core 0 uses it, only library calls",
+            "// like the queue functions still run from flash.",
+            "void __not_in_flash_func(core1_entry)(void) {",
+        ]
+    else:
+        data = ["static uint32_t core1_table[256];"]
+        entry = [
+            "// Core 1: take work items, process them and send back the results",
+            "void core1_entry(void) {",
+        ]
+    return [
         (
-            "// UART defines",
-            "// By default the stdout UART is `uart0`, so we will use the second one",
-            "#define UART_ID uart1",
-            "#define BAUD_RATE 115200",
+            '#include "pico/util/queue.h"',
             "",
-            "// Use pins 4 and 5 for UART1",
-            "// Pins can be changed, see the GPIO function select table in the datasheet for information on GPIO assignments",
-            "#define UART_TX_PIN 4",
-            "#define UART_RX_PIN 5",
-        ),
-        (
-            "// Set up our UART",
-            "uart_init(UART_ID, BAUD_RATE);",
-            "// Set the TX and RX pins by using the function select on the GPIO",
-            "// Set datasheet for more information on function select",
-            "gpio_set_function(UART_TX_PIN, GPIO_FUNC_UART);",
-            "gpio_set_function(UART_RX_PIN, GPIO_FUNC_UART);",
+            "// Work split between the cores: core 0 produces work items, core 1 consumes",
+            "// them and queues the results. queue_t is safe to use from both cores.",
+            "typedef struct {",
+            "    uint32_t id;",
+            "    uint32_t input;",
+            "} work_item_t;",
             "",
-            "// Use some the various UART functions to send out data",
-            "// In a default system, printf will also output via the default UART",
+            "typedef struct {",
+            "    uint32_t id;",
+            "    uint32_t output;",
+            "} work_result_t;",
             "",
-            # here should be following
-            # "// Send out a character without any conversions",
-            # "uart_putc_raw(UART_ID, 'A');",
-            # "",
-            # "// Send out a character but do CR/LF conversions",
-            # "uart_putc(UART_ID, 'B');",
-            # "",
-            "// Send out a string, with CR/LF conversions",
-            'uart_puts(UART_ID, " Hello, UART!\\n");',
+            "#define WORK_QUEUE_LENGTH 8",
             "",
-            "// For more examples of UART use see https://github.com/raspberrypi/pico-examples/tree/master/uart",
-        ),
-    ],
-    "spi": [
-        (
-            "// SPI Defines",
-            "// We are going to use SPI 0, and allocate it to the following GPIO pins",
-            "// Pins can be changed, see the GPIO function select table in the datasheet for information on GPIO assignments",
-            "#define SPI_PORT spi0",
-            "#define PIN_MISO 16",
-            "#define PIN_CS   17",
-            "#define PIN_SCK  18",
-            "#define PIN_MOSI 19",
-        ),
-        (
-            "// SPI initialisation. This example will use SPI at 1MHz.",
-            "spi_init(SPI_PORT, 1000*1000);",
-            "gpio_set_function(PIN_MISO, GPIO_FUNC_SPI);",
-            "gpio_set_function(PIN_CS,   GPIO_FUNC_SIO);",
-            "gpio_set_function(PIN_SCK,  GPIO_FUNC_SPI);",
-            "gpio_set_function(PIN_MOSI, GPIO_FUNC_SPI);",
+            "static queue_t work_queue;",
+            "static queue_t result_queue;",
             "",
-            "// Chip select is active-low, so we'll initialise it to a driven-high state",
-            "gpio_set_dir(PIN_CS, GPIO_OUT);",
-            "gpio_put(PIN_CS, 1);",
-            "// For more examples of SPI use see https://github.com/raspberrypi/pico-examples/tree/master/spi",
-        ),
-    ],
-    "i2c": [
-        (
-            "// I2C defines",
-            "// This example will use I2C0 on GPIO8 (SDA) and GPIO9 (SCL) running at 400KHz.",
-            "// Pins can be changed, see the GPIO function select table in the datasheet for information on GPIO assignments",
-            "#define I2C_PORT i2c0",
-            "#define I2C_SDA 8",
-            "#define I2C_SCL 9",
-        ),
-        (
-            "// I2C Initialisation. Using it at 400Khz.",
-            "i2c_init(I2C_PORT, 400*1000);",
+            *data,
             "",
-            "gpio_set_function(I2C_SDA, GPIO_FUNC_I2C);",
-            "gpio_set_function(I2C_SCL, GPIO_FUNC_I2C);",
-            "gpio_pull_up(I2C_SDA);",
-            "gpio_pull_up(I2C_SCL);",
-            "// For more examples of I2C use see https://github.com/raspberrypi/pico-examples/tree/master/i2c",
-        ),
-    ],
-    "dma": [
-        (
-            "// Data will be copied from src to dst",
-            'const char src[] = "Hello, world! (from DMA)";',
-            "char dst[count_of(src)];",
+            *entry,
+            "    for (int i = 0; i < 256; i++) {",
+            "        core1_table[i] = i * i;",
+            "    }",
+            "    while (true) {",
+            "        work_item_t item;",
+            "        queue_remove_blocking(&work_queue, &item);",
+            "        work_result_t result = {item.id, core1_table[item.input & 0xff] + item.input};",
+            "        queue_add_blocking(&result_queue, &result);",
+            "    }",
+            "}",
         ),
         (
-            "// Get a free channel, panic() if there are none",
-            "int chan = dma_claim_unused_channel(true);",
-            "",
-            "// 8 bit transfers. Both read and write address increment after each",
-            "// transfer (each pointing to a location in src or dst respectively).",
-            "// No DREQ is selected, so the DMA transfers as fast as it can.",
-            "",
-            "dma_channel_config c = dma_channel_get_default_config(chan);",
-            "channel_config_set_transfer_data_size(&c, DMA_SIZE_8);",
-            "channel_config_set_read_increment(&c, true);",
-            "channel_config_set_write_increment(&c, true);",
+            "// Producer/consumer example: core 0 queues work for core 1 and collects the results",
+            "queue_init(&work_queue, sizeof(work_item_t), WORK_QUEUE_LENGTH);",
+            "queue_init(&result_queue, sizeof(work_result_t), WORK_QUEUE_LENGTH);",
+            "multicore_launch_core1(core1_entry);",
             "",
-            "dma_channel_configure(",
-            "    chan,          // Channel to be configured",
-            "    &c,            // The configuration we just created",
-            "    dst,           // The initial write address",
-            "    src,           // The initial read address",
-            "    count_of(src), // Number of transfers; in this case each is 1 byte.",
-            "    true           // Start immediately.",
-            ");",
-            "",
-            "// We could choose to go and do something else whilst the DMA is doing its",
-            "// thing. In this case the processor has nothing else to do, so we just",
-            "// wait for the DMA to finish.",
-            "dma_channel_wait_for_finish_blocking(chan);",
-            "",
-            "// The DMA has now copied our text from the transmit buffer (src) to the",
-            "// receive buffer (dst), so we can print it out from there.",
-            "puts(dst);",
+            "uint32_t work_produced = 0;",
+            "uint32_t work_consumed = 0;",
+            "while (work_consumed < 100) {",
+            "    work_item_t item = {work_produced, work_produced * 3};",
+            "    if (work_produced < 100 && queue_try_add(&work_queue, &item)) {",
+            "        work_produced++;",
+            "    }",
+            "    work_result_t result;",
+            "    if (queue_try_remove(&result_queue, &result)) {",
+            "        work_consumed++;",
+            "    }",
+            "}",
+            'printf("Core 1 processed %u work items\\n", (unsigned)work_consumed);',
         ),
-    ],
-    "pio": [
+    ]
+
+
+def _BuildCodeFragments():
+    # This also contains example code for the standard library (see stdlib_examples_list)
+    fragments = {
+        "uart": [
+            (
+                "// UART defines",
+                "// By default the stdout UART is `uart0`, so we will use the second one",
+                "#define UART_ID uart1",
+                "#define BAUD_RATE 115200",
+                "",
+                "// Use pins 4 and 5 for UART1",
+                "// Pins can be changed, see the GPIO function select table in the datasheet for information on GPIO assignments",
+                "#define UART_TX_PIN 4",
+                "#define UART_RX_PIN 5",
+            ),
+            (
+                "// Set up our UART",
+                "uart_init(UART_ID, BAUD_RATE);",
+                "// Set the TX and RX pins by using the function select on the GPIO",
+                "// Set datasheet for more information on function select",
+                "gpio_set_function(UART_TX_PIN, GPIO_FUNC_UART);",
+                "gpio_set_function(UART_RX_PIN, GPIO_FUNC_UART);",
+                "",
+                "// Use some the various UART functions to send out data",
+                "// In a default system, printf will also output via the default UART",
+                "",
+                # here should be following
+                # "// Send out a character without any conversions",
+                # "uart_putc_raw(UART_ID, 'A');",
+                # "",
+                # "// Send out a character but do CR/LF conversions",
+                # "uart_putc(UART_ID, 'B');",
+                # "",
+                "// Send out a string, with CR/LF conversions",
+                'uart_puts(UART_ID, " Hello, UART!\\n");',
+                "",
+                "// For more examples of UART use see https://github.com/raspberrypi/pico-examples/tree/master/uart",
+            ),
+        ],
+        "spi": [
+            (
+                "// SPI Defines",
+                "// We are going to use SPI 0, and allocate it to the following GPIO pins",
+                "// Pins can be changed, see the GPIO function select table in the datasheet for information on GPIO assignments",
+                "#define SPI_PORT spi0",
+                "#define PIN_MISO 16",
+                "#define PIN_CS   17",
+                "#define PIN_SCK  18",
+                "#define PIN_MOSI 19",
+            ),
+            (
+                "// SPI initialisation. This example will use SPI at 1MHz.",
+                "spi_init(SPI_PORT, 1000*1000);",
+                "gpio_set_function(PIN_MISO, GPIO_FUNC_SPI);",
+                "gpio_set_function(PIN_CS,   GPIO_FUNC_SIO);",
+                "gpio_set_function(PIN_SCK,  GPIO_FUNC_SPI);",
+                "gpio_set_function(PIN_MOSI, GPIO_FUNC_SPI);",
+                "",
+                "// Chip select is active-low, so we'll initialise it to a driven-high state",
+                "gpio_set_dir(PIN_CS, GPIO_OUT);",
+                "gpio_put(PIN_CS, 1);",
+                "// For more examples of SPI use see https://github.com/raspberrypi/pico-examples/tree/master/spi",
+            ),
+        ],
+        "i2c": [
+            (
+                "// I2C defines",
+                "// This example will use I2C0 on GPIO8 (SDA) and GPIO9 (SCL) running at 400KHz.",
+                "// Pins can be changed, see the GPIO function select table in the datasheet for information on GPIO assignments",
+                "#define I2C_PORT i2c0",
+                "#define I2C_SDA 8",
+                "#define I2C_SCL 9",
+            ),
+            (
+                "// I2C Initialisation. Using it at 400Khz.",
+                "i2c_init(I2C_PORT, 400*1000);",
+                "",
+                "gpio_set_function(I2C_SDA, GPIO_FUNC_I2C);",
+                "gpio_set_function(I2C_SCL, GPIO_FUNC_I2C);",
+                "gpio_pull_up(I2C_SDA);",
+                "gpio_pull_up(I2C_SCL);",
+                "// For more examples of I2C use see https://github.com/raspberrypi/pico-examples/tree/master/i2c",
+            ),
+        ],
+        "dma": [
+            (
+                "// Data will be copied from src to dst",
+                'const char src[] = "Hello, world! (from DMA)";',
+                "char dst[count_of(src)];",
+            ),
+            (
+                "// Get a free channel, panic() if there are none",
+                "int chan = dma_claim_unused_channel(true);",
+                "",
+                "// 8 bit transfers. Both read and write address increment after each",
+                "// transfer (each pointing to a location in src or dst respectively).",
+                "// No DREQ is selected, so the DMA transfers as fast as it can.",
+                "",
+                "dma_channel_config c = dma_channel_get_default_config(chan);",
+                "channel_config_set_transfer_data_size(&c, DMA_SIZE_8);",
+                "channel_config_set_read_increment(&c, true);",
+                "channel_config_set_write_increment(&c, true);",
+                "",
+                "dma_channel_configure(",
+                "    chan,          // Channel to be configured",
+                "    &c,            // The configuration we just created",
+                "    dst,           // The initial write address",
+                "    src,           // The initial read address",
+                "    count_of(src), // Number of transfers; in this case each is 1 byte.",
+                "    true           // Start immediately.",
+                ");",
+                "",
+                "// We could choose to go and do something else whilst the DMA is doing its",
+                "// thing. In this case the processor has nothing else to do, so we just",
+                "// wait for the DMA to finish.",
+                "dma_channel_wait_for_finish_blocking(chan);",
+                "",
+                "// The DMA has now copied our text from the transmit buffer (src) to the",
+                "// receive buffer (dst), so we can print it out from there.",
+                "puts(dst);",
+            ),
+        ],
+        "pio": [
+            (
+                '#include "blink.pio.h"',
+                "",
+                "void blink_pin_forever(PIO pio, uint sm, uint offset, uint pin, uint freq) {",
+                "    blink_program_init(pio, sm, offset, pin);",
+                "    pio_sm_set_enabled(pio, sm, true);",
+                "",
+                '    printf("Blinking pin %d at %d Hz\\n", pin, freq);',
+                "",
+                "    // PIO counter program takes 3 more cycles in total than we pass as",
+                "    // input (wait for n + 1; mov; jmp)",
+                "    pio->txf[sm] = (125000000 / (2 * freq)) - 3;",
+                "}",
+            ),
+            (
+                "// PIO Blinking example",
+                "PIO pio = pio0;",
+                "uint offset = pio_add_program(pio, &blink_program);",
+                'printf("Loaded program at %d\\n", offset);',
+                "",
+                "#ifdef PICO_DEFAULT_LED_PIN",
+                "blink_pin_forever(pio, 0, offset, PICO_DEFAULT_LED_PIN, 3);",
+                "#else",
+                "blink_pin_forever(pio, 0, offset, 6, 3);",
+                "#endif",
+                "// For more pio examples see https://github.com/raspberrypi/pico-examples/tree/master/pio",
+            ),
+        ],
+        "clocks": [
+            (),
+            (
+                'printf("System Clock Frequency is %d Hz\\n", clock_get_hz(clk_sys));',
+                'printf("USB Clock Frequency is %d Hz\\n", clock_get_hz(clk_usb));',
+                "// For more examples of clocks use see https://github.com/raspberrypi/pico-examples/tree/master/clocks",
+            ),
+        ],
+        "benchmark": [
+            (
+                "// Code to benchmark, replace the body with what you want to measure",
+                "void benchmark_workload(void *arg) {",
+                "    volatile uint32_t *data = (volatile uint32_t *)arg;",
+                "    uint32_t sum = 0;",
+                "    for (int i = 0; i < 256; i++) {",
+                "        sum += data[i];",
+                "    }",
+                "    data[0] = sum;",
+                "}",
+                "",
+                "static uint32_t benchmark_data[256];",
+            ),
+            (
+                "// Benchmark example: 10 warm-up runs, then the min/median/max cycles of 32 timed runs",
+                "benchmark_init();",
+                'benchmark_result_t result = benchmark_run("Sum of 256 words", benchmark_workload, benchmark_data, 10, 32);',
+                'benchmark_print_throughput("Sum of 256 words", result, sizeof(benchmark_data));',
+            ),
+        ],
+        "multicore": MulticoreFragments(False),
+        # --dmaStream, the peripheral's fragment comes first and defines what
+        # the generic dma_stream one needs
+        "dma_stream_spi": [
+            (
+                "// SPI DMA stream out of memory, on SPI 1",
+                "#define STREAM_SPI spi1",
+                "#define STREAM_SPI_SCK 10",
+                "#define STREAM_SPI_TX 11",
+                "#define STREAM_TO_PERIPHERAL 1",
+                "#define STREAM_DMA_SIZE DMA_SIZE_8",
+                "#define STREAM_DREQ spi_get_dreq(STREAM_SPI, true)",
+                "#define STREAM_DATA_REGISTER (&spi_get_hw(STREAM_SPI)->dr)",
+                "typedef uint8_t stream_sample_t;",
+                "",
+                "// Returns the line rate in bytes per second",
+                "static uint32_t stream_peripheral_init(void) {",
+                "    uint baud = spi_init(STREAM_SPI, 31250 * 1000);",
+                "    gpio_set_function(STREAM_SPI_SCK, GPIO_FUNC_SPI);",
+                "    gpio_set_function(STREAM_SPI_TX, GPIO_FUNC_SPI);",
+                "    return baud / 8;",
+                "}",
+                "",
+                "static void stream_peripheral_start(void) {}",
+                "",
+                "static void stream_peripheral_stop(void) {}",
+                "",
+                "// Refill a buffer the DMA has sent with the next samples to send",
+                "static void stream_process(stream_sample_t *samples, uint count) {",
+                "    static stream_sample_t next;",
+                "    for (uint i = 0; i < count; i++) {",
+                "        samples[i] = next++;",
+                "    }",
+                "}",
+            ),
+            (),
+        ],
+        "dma_stream_uart": [
+            (
+                "// UART DMA stream into memory, on UART 1",
+                "#define STREAM_UART uart1",
+                "#define STREAM_UART_TX 8",
+                "#define STREAM_UART_RX 9",
+                "#define STREAM_TO_PERIPHERAL 0",
+                "#define STREAM_DMA_SIZE DMA_SIZE_8",
+                "#define STREAM_DREQ uart_get_dreq(STREAM_UART, false)",
+                "#define STREAM_DATA_REGISTER (&uart_get_hw(STREAM_UART)->dr)",
+                "typedef uint8_t stream_sample_t;",
+                "",
+                "// Returns the line rate in bytes per second",
+                "static uint32_t stream_peripheral_init(void) {",
+                "    uint baud = uart_init(STREAM_UART, 921600);",
+                "    gpio_set_function(STREAM_UART_TX, GPIO_FUNC_UART);",
+                "    gpio_set_function(STREAM_UART_RX, GPIO_FUNC_UART);",
+                "    // 8N1 takes 10 bits per byte",
+                "    return baud / 10;",
+                "}",
+                "",
+                "static void stream_peripheral_start(void) {}",
+                "",
+                "static void stream_peripheral_stop(void) {}",
+                "",
+                "// Use the samples of a buffer the DMA has filled",
+                "static uint32_t stream_checksum;",
+                "static void stream_process(stream_sample_t *samples, uint count) {",
+                "    for (uint i = 0; i < count; i++) {",
+                "        stream_checksum += samples[i];",
+                "    }",
+                "}",
+            ),
+            (),
+        ],
+        "dma_stream_adc": [
+            (
+                '#include "hardware/clocks.h"',
+                "",
+                "// ADC DMA stream into memory, from ADC input 0 at full speed",
+                "#ifndef ADC_BASE_PIN",
+                "#define ADC_BASE_PIN 26",
+                "#endif",
+                "#define STREAM_ADC_INPUT 0",
+                "#define STREAM_TO_PERIPHERAL 0",
+                "#define STREAM_DMA_SIZE DMA_SIZE_16",
+                "#define STREAM_DREQ DREQ_ADC",
+                "#define STREAM_DATA_REGISTER (&adc_hw->fifo)",
+                "typedef uint16_t stream_sample_t;",
+                "",
+                "// Returns the line rate in bytes per second",
+                "static uint32_t stream_peripheral_init(void) {",
+                "    adc_init();",
+                "    adc_gpio_init(ADC_BASE_PIN + STREAM_ADC_INPUT);",
+                "    adc_select_input(STREAM_ADC_INPUT);",
+                "    // Every sample goes through the FIFO and raises DREQ",
+                "    adc_fifo_setup(true, true, 1, false, false);",
+                "    // Back to back conversions, each takes 96 ADC clocks",
+                "    adc_set_clkdiv(0);",
+                "    return clock_get_hz(clk_adc) / 96 * sizeof(stream_sample_t);",
+                "}",
+                "",
+                "static void stream_peripheral_start(void) {",
+                "    adc_run(true);",
+                "}",
+                "",
+                "static void stream_peripheral_stop(void) {",
+                "    adc_run(false);",
+                "    adc_fifo_drain();",
+                "}",
+                "",
+                "// Use the samples of a buffer the DMA has filled",
+                "static uint32_t stream_checksum;",
+                "static void stream_process(stream_sample_t *samples, uint count) {",
+                "    for (uint i = 0; i < count; i++) {",
+                "        stream_checksum += samples[i];",
+                "    }",
+                "}",
+            ),
+            (),
+        ],
+        "dma_stream": [
+            (
+                '#include "hardware/irq.h"',
+                "",
+                "// Double-buffered DMA stream: two DMA channels chained to each other each move",
+                "// one buffer, so one is always running while the CPU works on the other. The",
+                "// DMA IRQ re-arms a channel when it finishes and hands its buffer to the CPU.",
+                "#define STREAM_BUFFER_SAMPLES 1024",
+                "#define STREAM_DMA_IRQ_INDEX 0",
+                "",
+                "static stream_sample_t stream_buffers[2][STREAM_BUFFER_SAMPLES];",
+                "static int stream_channels[2];",
+                "// Bit n is set while buffer n belongs to the CPU",
+                "static volatile uint32_t stream_ready;",
+                "static volatile uint32_t stream_overruns;",
+                "static int stream_next_buffer;",
+                "",
+                "static void stream_dma_irq_handler(void) {",
+                "    for (int i = 0; i < 2; i++) {",
+                "        if (dma_irqn_get_channel_status(STREAM_DMA_IRQ_INDEX, stream_channels[i])) {",
+                "            dma_irqn_acknowledge_channel(STREAM_DMA_IRQ_INDEX, stream_channels[i]);",
+                "            // The other channel is running now, rewind this one for when it chains back",
+                "#if STREAM_TO_PERIPHERAL",
+                "            dma_channel_set_read_addr(stream_channels[i], stream_buffers[i], false);",
+                "#else",
+                "            dma_channel_set_write_addr(stream_channels[i], stream_buffers[i], false);",
+                "#endif",
+                "            if (stream_ready & (1u << i)) {",
+                "                // The CPU still had this buffer, so samples were lost",
+                "                stream_overruns++;",
+                "            }",
+                "            stream_ready |= 1u << i;",
+                "        }",
+                "    }",
+                "}",
+                "",
+                "static void stream_start(void) {",
+                "    for (int i = 0; i < 2; i++) {",
+                "        stream_channels[i] = dma_claim_unused_channel(true);",
+                "    }",
+                "    for (int i = 0; i < 2; i++) {",
+                "        dma_channel_config c = dma_channel_get_default_config(stream_channels[i]);",
+                "        channel_config_set_transfer_data_size(&c, STREAM_DMA_SIZE);",
+                "        channel_config_set_read_increment(&c, STREAM_TO_PERIPHERAL);",
+                "        channel_config_set_write_increment(&c, !STREAM_TO_PERIPHERAL);",
+                "        channel_config_set_dreq(&c, STREAM_DREQ);",
+                "        channel_config_set_chain_to(&c, stream_channels[1 - i]);",
+                "#if STREAM_TO_PERIPHERAL",
+                "        dma_channel_configure(stream_channels[i], &c, STREAM_DATA_REGISTER, stream_buffers[i], STREAM_BUFFER_SAMPLES, false);",
+                "#else",
+                "        dma_channel_configure(stream_channels[i], &c, stream_buffers[i], STREAM_DATA_REGISTER, STREAM_BUFFER_SAMPLES, false);",
+                "#endif",
+                "        dma_irqn_set_channel_enabled(STREAM_DMA_IRQ_INDEX, stream_channels[i], true);",
+                "    }",
+                "    irq_add_shared_handler(DMA_IRQ_0 + STREAM_DMA_IRQ_INDEX, stream_dma_irq_handler, PICO_SHARED_IRQ_HANDLER_DEFAULT_ORDER_PRIORITY);",
+                "    irq_set_enabled(DMA_IRQ_0 + STREAM_DMA_IRQ_INDEX, true);",
+                "    dma_channel_start(stream_channels[0]);",
+                "    stream_peripheral_start();",
+                "}",
+                "",
+                "// Index of the next buffer the DMA has finished with, or -1 if it isn't done yet.",
+                "// Streaming into memory it holds new samples, streaming out of memory it is free",
+                "// to be refilled. Give it back with stream_release_buffer() as soon as possible.",
+                "static int stream_take_buffer(void) {",
+                "    return (stream_ready & (1u << stream_next_buffer)) ? stream_next_buffer : -1;",
+                "}",
+                "",
+                "static void stream_release_buffer(void) {",
+                "    uint32_t save = save_and_disable_interrupts();",
+                "    stream_ready &= ~(1u << stream_next_buffer);",
+                "    restore_interrupts(save);",
+                "    stream_next_buffer ^= 1;",
+                "}",
+                "",
+                "static void stream_stop(void) {",
+                "    for (int i = 0; i < 2; i++) {",
+                "        dma_irqn_set_channel_enabled(STREAM_DMA_IRQ_INDEX, stream_channels[i], false);",
+                "        // Unchain first, so aborting one channel can't start the other",
+                "        dma_channel_config c = dma_get_channel_config(stream_channels[i]);",
+                "        channel_config_set_chain_to(&c, stream_channels[i]);",
+                "        dma_channel_set_config(stream_channels[i], &c, false);",
+                "    }",
+                "    for (int i = 0; i < 2; i++) {",
+                "        dma_channel_abort(stream_channels[i]);",
+                "    }",
+                "    stream_peripheral_stop();",
+                "}",
+            ),
+            (
+                "// Stream for a second, then report the throughput against the line rate",
+                "uint32_t stream_line_rate = stream_peripheral_init();",
+                "stream_start();",
+                "uint32_t stream_samples = 0;",
+                "absolute_time_t stream_end = make_timeout_time_ms(1000);",
+                "while (!time_reached(stream_end)) {",
+                "    if (stream_take_buffer() < 0) {",
+                "        tight_loop_contents();",
+                "        continue;",
+                "    }",
+                "    stream_process(stream_buffers[stream_next_buffer], STREAM_BUFFER_SAMPLES);",
+                "    stream_release_buffer();",
+                "    stream_samples += STREAM_BUFFER_SAMPLES;",
+                "}",
+                "stream_stop();",
+                'printf("Streamed %u bytes in 1 s, line rate %u bytes/s, %u overruns\\n",',
+                "       (unsigned)(stream_samples * sizeof(stream_sample_t)), (unsigned)stream_line_rate, (unsigned)stream_overruns);",
+            ),
+        ],
+        "gpio": [
+            ("// GPIO defines", "// Example uses GPIO 2", "#define GPIO 2"),
+            (
+                "// GPIO initialisation.",
+                "// We will make this GPIO an input, and pull it up by default",
+                "gpio_init(GPIO);",
+                "gpio_set_dir(GPIO, GPIO_IN);",
+                "gpio_pull_up(GPIO);",
+                "// See https://github.com/raspberrypi/pico-examples/tree/master/gpio for other gpio examples, including using interrupts",
+            ),
+        ],
+        "interp": [
+            (),
+            (
+                "// Interpolator example code",
+                "interp_config cfg = interp_default_config();",
+                "// Now use the various interpolator library functions for your use case",
+                "// e.g. interp_config_clamp(&cfg, true);",
+                "//      interp_config_shift(&cfg, 2);",
+                "// Then set the config ",
+                "interp_set_config(interp0, 0, &cfg);",
+                "// For examples of interpolator use see https://github.com/raspberrypi/pico-examples/tree/master/interp",
+            ),
+        ],
+        "timer": [
+            (
+                "int64_t alarm_callback(alarm_id_t id, void *user_data) {",
+                "    // Put your timeout handler code in here",
+                "    return 0;",
+                "}",
+            ),
+            (
+                "// Timer example code - This example fires off the callback after 2000ms",
+                "add_alarm_in_ms(2000, alarm_callback, NULL, false);",
+                "// For more examples of timer use see https://github.com/raspberrypi/pico-examples/tree/master/timer",
+            ),
+        ],
+        "watchdog": [
+            (),
+            (
+                "// Watchdog example code",
+                "if (watchdog_caused_reboot()) {",
+                '    printf("Rebooted by Watchdog!\\n");',
+                "    // Whatever action you may take if a watchdog caused a reboot",
+                "}",
+                "",
+                "// Enable the watchdog, requiring the watchdog to be updated every 100ms or the chip will reboot",
+                "// second arg is pause on debug which means the watchdog will pause when stepping through code",
+                "watchdog_enable(100, 1);",
+                "",
+                "// You need to call this function at least more often than the 100ms in the enable call to prevent a reboot",
+                "watchdog_update();",
+            ),
+        ],
+        "div": [
+            (),
+            (
+                "// Example of using the HW divider. The pico_divider library provides a more user friendly set of APIs ",
+                "// over the divider (and support for 64 bit divides), and of course by default regular C language integer",
+                "// divisions are redirected thru that library, meaning you can just use C level `/` and `%` operators and",
+                "// gain the benefits of the fast hardware divider.",
+                "int32_t dividend = 123456;",
+                "int32_t divisor = -321;",
+                "// This is the recommended signed fast divider for general use.",
+                "divmod_result_t result = hw_divider_divmod_s32(dividend, divisor);",
+                'printf("%d/%d = %d remainder %d\\n", dividend, divisor, to_quotient_s32(result), to_remainder_s32(result));',
+                "// This is the recommended unsigned fast divider for general use.",
+                "int32_t udividend = 123456;",
+                "int32_t udivisor = 321;",
+                "divmod_result_t uresult = hw_divider_divmod_u32(udividend, udivisor);",
+                'printf("%d/%d = %d remainder %d\\n", udividend, udivisor, to_quotient_u32(uresult), to_remainder_u32(uresult));',
+                "// See https://github.com/raspberrypi/pico-examples/tree/master/divider for more complex use",
+            ),
+        ],
+        "picow_led": [
+            (),
+            (
+                "// Example to turn on the Pico W LED",
+                "cyw43_arch_gpio_put(CYW43_WL_GPIO_LED_PIN, 1);",
+            ),
+        ],
+        "picow_wifi": [
+            (),
+            (
+                "// Enable wifi station",
+                "cyw43_arch_enable_sta_mode();\n",
+                'printf("Connecting to Wi-Fi...\\n");',
+                'if (cyw43_arch_wifi_connect_timeout_ms("Your Wi-Fi SSID", "Your Wi-Fi Password", CYW43_AUTH_WPA2_AES_PSK, 30000)) {',
+                '    printf("failed to connect.\\n");',
+                "    return 1;",
+                "} else {",
+                '    printf("Connected.\\n");',
+                "    // Read the ip address in a human readable way",
+                "    uint8_t *ip_address = (uint8_t*)&(cyw43_state.netif[0].ip_addr.addr);",
+                '    printf("IP address %d.%d.%d.%d\\n", ip_address[0], ip_address[1], ip_address[2], ip_address[3]);',
+                "}",
+            ),
+        ],
+    }
+
+    # Add wifi example for poll and background modes
+    fragments["picow_poll"] = fragments["picow_wifi"]
+    fragments["picow_background"] = fragments["picow_wifi"]
+
+    # With FreeRTOS the Wi-Fi chip can only be used once the scheduler runs, so
+    # the wifi example goes in a task that main starts (see freertos_kernel)
+    fragments["picow_freertos"] = [
         (
-            '#include "blink.pio.h"',
+            '#include "task.h"',
             "",
-            "void blink_pin_forever(PIO pio, uint sm, uint offset, uint pin, uint freq) {",
-            "    blink_program_init(pio, sm, offset, pin);",
-            "    pio_sm_set_enabled(pio, sm, true);",
+            "#define MAIN_TASK_PRIORITY (tskIDLE_PRIORITY + 2UL)",
+            "#define MAIN_TASK_STACK_SIZE (configMINIMAL_STACK_SIZE * 4)",
             "",
-            '    printf("Blinking pin %d at %d Hz\\n", pin, freq);',
+            "static void main_task(void *params) {",
+            "    // Initialise the Wi-Fi chip, lwIP runs in a task of its own from here on",
+            "    if (cyw43_arch_init()) {",
+            '        printf("Wi-Fi init failed\\n");',
+            "        vTaskDelete(NULL);",
+            "    }",
             "",
-            "    // PIO counter program takes 3 more cycles in total than we pass as",
-            "    // input (wait for n + 1; mov; jmp)",
-            "    pio->txf[sm] = (125000000 / (2 * freq)) - 3;",
-            "}",
-        ),
-        (
-            "// PIO Blinking example",
-            "PIO pio = pio0;",
-            "uint offset = pio_add_program(pio, &blink_program);",
-            'printf("Loaded program at %d\\n", offset);',
+            "    // Enable wifi station",
+            "    cyw43_arch_enable_sta_mode();",
+            '    printf("Connecting to Wi-Fi...\\n");',
+            '    if (cyw43_arch_wifi_connect_timeout_ms("Your Wi-Fi SSID", "Your Wi-Fi Password", CYW43_AUTH_WPA2_AES_PSK, 30000)) {',
+            '        printf("failed to connect.\\n");',
+            "    } else {",
+            '        printf("Connected.\\n");',
+            "        // Read the ip address in a human readable way",
+            "        uint8_t *ip_address = (uint8_t*)&(cyw43_state.netif[0].ip_addr.addr);",
+            '        printf("IP address %d.%d.%d.%d\\n", ip_address[0], ip_address[1], ip_address[2], ip_address[3]);',
+            "    }",
             "",
-            "#ifdef PICO_DEFAULT_LED_PIN",
-            "blink_pin_forever(pio, 0, offset, PICO_DEFAULT_LED_PIN, 3);",
-            "#else",
-            "blink_pin_forever(pio, 0, offset, 6, 3);",
-            "#endif",
-            "// For more pio examples see https://github.com/raspberrypi/pico-examples/tree/master/pio",
-        ),
-    ],
-    "clocks": [
-        (),
-        (
-            'printf("System Clock Frequency is %d Hz\\n", clock_get_hz(clk_sys));',
-            'printf("USB Clock Frequency is %d Hz\\n", clock_get_hz(clk_usb));',
-            "// For more examples of clocks use see https://github.com/raspberrypi/pico-examples/tree/master/clocks",
-        ),
-    ],
-    "gpio": [
-        ("// GPIO defines", "// Example uses GPIO 2", "#define GPIO 2"),
-        (
-            "// GPIO initialisation.",
-            "// We will make this GPIO an input, and pull it up by default",
-            "gpio_init(GPIO);",
-            "gpio_set_dir(GPIO, GPIO_IN);",
-            "gpio_pull_up(GPIO);",
-            "// See https://github.com/raspberrypi/pico-examples/tree/master/gpio for other gpio examples, including using interrupts",
-        ),
-    ],
-    "interp": [
-        (),
-        (
-            "// Interpolator example code",
-            "interp_config cfg = interp_default_config();",
-            "// Now use the various interpolator library functions for your use case",
-            "// e.g. interp_config_clamp(&cfg, true);",
-            "//      interp_config_shift(&cfg, 2);",
-            "// Then set the config ",
-            "interp_set_config(interp0, 0, &cfg);",
-            "// For examples of interpolator use see https://github.com/raspberrypi/pico-examples/tree/master/interp",
-        ),
-    ],
-    "timer": [
-        (
-            "int64_t alarm_callback(alarm_id_t id, void *user_data) {",
-            "    // Put your timeout handler code in here",
-            "    return 0;",
+            "    while (true) {",
+            '        printf("Hello, world!\\n");',
+            "        vTaskDelay(pdMS_TO_TICKS(1000));",
+            "    }",
             "}",
         ),
-        (
-            "// Timer example code - This example fires off the callback after 2000ms",
-            "add_alarm_in_ms(2000, alarm_callback, NULL, false);",
-            "// For more examples of timer use see https://github.com/raspberrypi/pico-examples/tree/master/timer",
-        ),
-    ],
-    "watchdog": [
         (),
+    ]
+    fragments["memory_layout"] = [
         (
-            "// Watchdog example code",
-            "if (watchdog_caused_reboot()) {",
-            '    printf("Rebooted by Watchdog!\\n");',
-            "    // Whatever action you may take if a watchdog caused a reboot",
-            "}",
+            "// Hot code and data, placed by PICO_VSCODE_HOT_CODE and PICO_VSCODE_HOT_DATA in CMakeLists.txt",
+            "static uint32_t HOT_DATA(hot_buffer)[256];",
             "",
-            "// Enable the watchdog, requiring the watchdog to be updated every 100ms or the chip will reboot",
-            "// second arg is pause on debug which means the watchdog will pause when stepping through code",
-            "watchdog_enable(100, 1);",
-            "",
-            "// You need to call this function at least more often than the 100ms in the enable call to prevent a reboot",
-            "watchdog_update();",
-        ),
-    ],
-    "div": [
-        (),
-        (
-            "// Example of using the HW divider. The pico_divider library provides a more user friendly set of APIs ",
-            "// over the divider (and support for 64 bit divides), and of course by default regular C language integer",
-            "// divisions are redirected thru that library, meaning you can just use C level `/` and `%` operators and",
-            "// gain the benefits of the fast hardware divider.",
-            "int32_t dividend = 123456;",
-            "int32_t divisor = -321;",
-            "// This is the recommended signed fast divider for general use.",
-            "divmod_result_t result = hw_divider_divmod_s32(dividend, divisor);",
-            'printf("%d/%d = %d remainder %d\\n", dividend, divisor, to_quotient_s32(result), to_remainder_s32(result));',
-            "// This is the recommended unsigned fast divider for general use.",
-            "int32_t udividend = 123456;",
-            "int32_t udivisor = 321;",
-            "divmod_result_t uresult = hw_divider_divmod_u32(udividend, udivisor);",
-            'printf("%d/%d = %d remainder %d\\n", udividend, udivisor, to_quotient_u32(uresult), to_remainder_u32(uresult));',
-            "// See https://github.com/raspberrypi/pico-examples/tree/master/divider for more complex use",
+            "static uint32_t HOT_FUNC(hot_checksum)(const uint32_t *data, uint words) {",
+            "    uint32_t sum = 0;",
+            "    for (uint i = 0; i < words; i++) {",
+            "        sum = (sum << 1 | sum >> 31) ^ data[i];",
+            "    }",
+            "    return sum;",
+            "}",
         ),
-    ],
-    "picow_led": [
-        (),
         (
-            "// Example to turn on the Pico W LED",
-            "cyw43_arch_gpio_put(CYW43_WL_GPIO_LED_PIN, 1);",
+            "// Hot code and data placement",
+            "for (uint i = 0; i < count_of(hot_buffer); i++) {",
+            "    hot_buffer[i] = i;",
+            "}",
+            'printf("hot_checksum at %p, hot_buffer at %p, checksum %08x\\n", (void *)hot_checksum, (void *)hot_buffer,',
+            "       (unsigned)hot_checksum(hot_buffer, count_of(hot_buffer)));",
         ),
-    ],
-    "picow_wifi": [
+    ]
+    fragments["freertos_kernel"] = [
         (),
         (
-            "// Enable wifi station",
-            "cyw43_arch_enable_sta_mode();\n",
-            'printf("Connecting to Wi-Fi...\\n");',
-            'if (cyw43_arch_wifi_connect_timeout_ms("Your Wi-Fi SSID", "Your Wi-Fi Password", CYW43_AUTH_WPA2_AES_PSK, 30000)) {',
-            '    printf("failed to connect.\\n");',
-            "    return 1;",
-            "} else {",
-            '    printf("Connected.\\n");',
-            "    // Read the ip address in a human readable way",
-            "    uint8_t *ip_address = (uint8_t*)&(cyw43_state.netif[0].ip_addr.addr);",
-            '    printf("IP address %d.%d.%d.%d\\n", ip_address[0], ip_address[1], ip_address[2], ip_address[3]);',
-            "}",
+            "// Start the scheduler, on both cores with SMP. It doesn't return, the",
+            "// application carries on in main_task",
+            'xTaskCreate(main_task, "main", MAIN_TASK_STACK_SIZE, NULL, MAIN_TASK_PRIORITY, NULL);',
+            "vTaskStartScheduler();",
         ),
-    ],
-}
+    ]
+
+    return fragments
+
+
+_code_fragments = None
+
+
+def CodeFragments():
+    """Code fragments per feature, built on first use as conversions never need them"""
+    global _code_fragments
+    if _code_fragments is None:
+        _code_fragments = _BuildCodeFragments()
+    return _code_fragments
+
+
+def __getattr__(name):
+    # Keep code_fragments_per_feature available to importers of this module
+    if name == "code_fragments_per_feature":
+        return CodeFragments()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-# Add wifi example for poll and background modes
-code_fragments_per_feature["picow_poll"] = code_fragments_per_feature["picow_wifi"]
-code_fragments_per_feature["picow_background"] = code_fragments_per_feature[
-    "picow_wifi"
-]
 
 configuration_dictionary = list(dict())
 
@@ -483,9 +1028,658 @@ def semver_compare_ge(first, second):
 
 def CheckSystemType():
     global isMac, isWindows, isx86
-    isMac = platform.system() == "Darwin"
-    isWindows = platform.system() == "Windows"
-    isx86 = platform.machine().lower() in ["x86_64", "amd64"]
+    isMac = sys.platform == "darwin"
+    isWindows = sys.platform == "win32"
+    # os.uname() doesn't exist on Windows, this is what platform.machine() would check there
+    machine = (
+        os.environ.get("PROCESSOR_ARCHITECTURE", "")
+        if isWindows
+        else os.uname().machine
+    )
+    isx86 = machine.lower() in ["x86_64", "amd64"]
+
+
+class ProjectGenerationError(Exception):
+    """Raised when a project cannot be generated, the message is meant for the user"""
+
+
+def SetToolchain(toolchainVersion):
+    """Select the compiler triple and compiler path used for the given toolchain version"""
+    global COMPILER_TRIPLE, compilerPath
+    if "RISCV" in toolchainVersion:
+        if "COREV" in toolchainVersion:
+            COMPILER_TRIPLE = COREV_TRIPLE
+        else:
+            COMPILER_TRIPLE = RISCV_TRIPLE
+    else:
+        COMPILER_TRIPLE = ARM_TRIPLE
+
+    compilerPath = Path(codeToolchainPath(toolchainVersion) + "/bin/" + COMPILER_NAME())
+
+
+def WriteFileIfChanged(path, content):
+    """Write content (str or bytes) to path, unless the file already holds exactly that
+
+    Every generated file goes through here, so regenerating an unchanged project
+    doesn't touch mtimes (which would trigger CMake Tools, IntelliSense and file
+    watchers). Text is written with the platform line endings like open(path, "w").
+    Changed files are written to a temporary file next to path and renamed over
+    it, so nobody ever sees a partially written file. Returns True if path was written.
+    """
+    path = os.fspath(path)
+    if isinstance(content, str):
+        content = content.replace("\n", os.linesep).encode()
+
+    try:
+        if os.path.getsize(path) == len(content):
+            with open(path, "rb") as f:
+                if f.read() == content:
+                    return False
+    except OSError:
+        # doesn't exist yet (or can't be read), so just write it
+        pass
+
+    tmpPath = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmpPath, "wb") as f:
+            f.write(content)
+        if os.path.exists(path):
+            shutil.copymode(path, tmpPath)
+        os.replace(tmpPath, path)
+    except BaseException:
+        if os.path.exists(tmpPath):
+            os.remove(tmpPath)
+        raise
+    return True
+
+
+# Contents of files copied into projects, so batch generation only reads each one once
+_source_file_cache = {}
+
+
+def CopySourceFile(src, dst):
+    """Copy src to dst if it differs, reading src only once per process"""
+    src = os.fspath(src)
+    if src not in _source_file_cache:
+        with open(src, "rb") as f:
+            _source_file_cache[src] = f.read()
+    return WriteFileIfChanged(dst, _source_file_cache[src])
+
+
+def CMakeFingerprint(params):
+    """Hash of all generator inputs that end up in CMakeCache.txt when configuring the project"""
+    import hashlib
+
+    relevant = {key: params.get(key) for key in CMAKE_FINGERPRINT_PARAMS}
+    relevant["compilerTriple"] = COMPILER_TRIPLE
+    return hashlib.sha256(
+        json.dumps(relevant, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+# Architecture flags the SDK compiles with for each PICO_PLATFORM, used until CMake provides the real ones
+platform_compile_flags = {
+    "rp2040": ["-mcpu=cortex-m0plus", "-mthumb"],
+    "rp2350-arm-s": [
+        "-mcpu=cortex-m33",
+        "-mthumb",
+        "-march=armv8-m.main+fp+dsp",
+        "-mfloat-abi=softfp",
+        "-mcmse",
+    ],
+    "rp2350-riscv": ["-march=rv32imac_zicsr_zifencei_zba_zbb_zbs_zbkb", "-mabi=ilp32"],
+}
+
+
+def BoardPlatform(sdkPath, board, toolchainVersion):
+    """PICO_PLATFORM the SDK will pick for board, from the pico_cmake_set line in its board header"""
+    if "RISCV" in toolchainVersion:
+        return "rp2350-riscv"
+
+    header = Path(sdkPath, "src", "boards", "include", "boards", f"{board}.h")
+    try:
+        with open(header, "r") as f:
+            match = re.search(r"pico_cmake_set\s+PICO_PLATFORM\s*=\s*([\w-]+)", f.read())
+    except OSError:
+        match = None
+
+    if match is None:
+        return "rp2040"
+    if match.group(1) == "rp2350":
+        return "rp2350-arm-s"
+    return match.group(1)
+
+
+def PlatformChip(platform):
+    return "rp2350" if platform.startswith("rp2350") else "rp2040"
+
+
+def FeatureLibraries(features):
+    """Libraries target_link_libraries gets for the selected features, pico_stdlib first"""
+    libs = [STANDARD_LIBRARIES]
+    for feat in features:
+        if feat in features_list:
+            libs.append(features_list[feat][LIB_NAME])
+        if feat in generator_option_features and generator_option_features[feat][LIB_NAME]:
+            # option features can need the library of a selected feature too
+            if generator_option_features[feat][LIB_NAME] not in libs:
+                libs.append(generator_option_features[feat][LIB_NAME])
+        if feat in picow_options_list and picow_options_list[feat][LIB_NAME]:
+            libs.append(picow_options_list[feat][LIB_NAME])
+    return libs
+
+
+# Include directories outside src/ that the headers of SDK libraries need, when there is no SDK index
+sdk_external_include_dirs = {
+    "pico_cyw43_arch_none": ["lib/cyw43-driver/src"],
+    "pico_cyw43_arch_lwip_poll": ["lib/cyw43-driver/src", "lib/lwip/src/include"],
+    "pico_cyw43_arch_lwip_threadsafe_background": [
+        "lib/cyw43-driver/src",
+        "lib/lwip/src/include",
+    ],
+    "pico_cyw43_arch_lwip_sys_freertos": [
+        "lib/cyw43-driver/src",
+        "lib/lwip/src/include",
+    ],
+}
+
+# SDK indexes loaded by this process, per (userHome, sdkVersion)
+_sdk_indexes = {}
+
+
+def ImportScriptModule(name):
+    """Import one of the modules next to this script, done on first use to keep them out of the startup time"""
+    import importlib
+
+    if sourcefolder not in sys.path:
+        sys.path.insert(0, sourcefolder)
+    return importlib.import_module(name)
+
+
+def SdkIndex(params):
+    """Index of the project's SDK libraries, see pico_sdk_index.py, or None if there is none
+
+    The index is built when the SDK is installed. The SDK isn't scanned here,
+    that would make the first project with an SDK version wait for it.
+    """
+    key = (params["userHome"], params["sdkVersion"])
+    if key not in _sdk_indexes:
+        _sdk_indexes[key] = ImportScriptModule("pico_sdk_index").ReadIndex(*key)
+    return _sdk_indexes[key]
+
+
+def LinkedLibraries(params, chip, libs):
+    """libs and all SDK libraries they link, as far as the SDK index knows"""
+    index = SdkIndex(params)
+    if index is None:
+        return libs
+    return ImportScriptModule("pico_sdk_index").Closure(index, chip, libs)
+
+
+def SdkIncludeDirs(params, chip, libs):
+    """Include directories of libs for chip, relative to the SDK root
+
+    Taken from the SDK index. Without one, the include directories of all SDK
+    libraries for chip are used. Empty if the SDK isn't installed.
+    """
+    sdkPath = Path(params["userHome"] + relativeSDKPath(params["sdkVersion"]))
+    index = SdkIndex(params)
+    if index is not None:
+        includeDirs = ImportScriptModule("pico_sdk_index").IncludeDirs(
+            index, chip, libs
+        )
+    else:
+        includeDirs = []
+        for group in ("common", "rp2_common", chip):
+            groupPath = sdkPath / "src" / group
+            if not groupPath.is_dir():
+                continue
+            for lib in sorted(groupPath.iterdir()):
+                if (lib / "include").is_dir():
+                    includeDirs.append(f"src/{group}/{lib.name}/include")
+        if includeDirs:
+            for lib in libs:
+                for d in sdk_external_include_dirs.get(lib, []):
+                    if d not in includeDirs:
+                        includeDirs.append(d)
+
+    # the board headers on their own don't make a usable include path
+    if includeDirs and (sdkPath / "src" / "boards" / "include").is_dir():
+        includeDirs.append("src/boards/include")
+    return includeDirs
+
+
+def CodeIncludePath(params, features):
+    """SDK include directories for the board and features, in the ${userHome} form c_cpp_properties.json uses
+
+    Returns None if the SDK isn't installed, so the recursive SDK include is kept.
+    """
+    sdkPath = params["userHome"] + relativeSDKPath(params["sdkVersion"])
+    platform = BoardPlatform(sdkPath, params["boardtype"], params["toolchainVersion"])
+    includeDirs = SdkIncludeDirs(
+        params, PlatformChip(platform), FeatureLibraries(features)
+    )
+    if not includeDirs:
+        return None
+
+    return [f"{codeSdkPath(params['sdkVersion'])}/{d}" for d in includeDirs]
+
+
+def SynthesizeCompileCommands(projectPath, params, features):
+    """Write a compile_commands.json for the entry point of a new project into the build folder
+
+    Until the first configure, IntelliSense would otherwise fall back to indexing
+    the whole SDK. The entry is built from what the generator already knows: the
+    board and its platform, and the libraries of the selected features with
+    their include directories from the SDK index. The two headers the SDK generates at configure time get
+    placeholders so pico/stdlib.h resolves. CMake overwrites all of these with the
+    real ones on configure.
+    """
+    sdkPath = params["userHome"] + relativeSDKPath(params["sdkVersion"])
+    platform = BoardPlatform(sdkPath, params["boardtype"], params["toolchainVersion"])
+    chip = PlatformChip(platform)
+    buildPath = Path(projectPath, "build")
+    generatedPath = buildPath / "generated" / "pico_base"
+
+    os.makedirs(generatedPath / "pico", exist_ok=True)
+    if not (generatedPath / "pico" / "config_autogen.h").exists():
+        WriteFileIfChanged(
+            generatedPath / "pico" / "config_autogen.h",
+            "// Placeholder written by pico_project.py, CMake replaces it on configure\n"
+            f'#include "{sdkPath}/src/boards/include/boards/{params["boardtype"]}.h"\n',
+        )
+    version = re.match(r"(\d+)\.(\d+)\.(\d+)", params["sdkVersion"])
+    if version and not (generatedPath / "pico" / "version.h").exists():
+        WriteFileIfChanged(
+            generatedPath / "pico" / "version.h",
+            "// Placeholder written by pico_project.py, CMake replaces it on configure\n"
+            "#ifndef _PICO_VERSION_H\n"
+            "#define _PICO_VERSION_H\n"
+            f"#define PICO_SDK_VERSION_MAJOR {version.group(1)}\n"
+            f"#define PICO_SDK_VERSION_MINOR {version.group(2)}\n"
+            f"#define PICO_SDK_VERSION_REVISION {version.group(3)}\n"
+            f'#define PICO_SDK_VERSION_STRING "{params["sdkVersion"]}"\n'
+            "#endif\n",
+        )
+
+    defines = [
+        f'PICO_BOARD="{params["boardtype"]}"',
+        "PICO_BUILD=1",
+        "PICO_ON_DEVICE=1",
+        "PICO_NO_HARDWARE=0",
+        "PICO_32BIT=1",
+        f"PICO_{chip.upper()}=1",
+        f"PICO_NO_FLASH={1 if params['wantRunFromRAM'] else 0}",
+    ]
+    libs = FeatureLibraries(features)
+    defines += [
+        f"LIB_{lib.upper()}=1" for lib in LinkedLibraries(params, chip, libs)
+    ]
+    if params["configs"]:
+        for c, v in params["configs"].items():
+            defines.append(f"{c}={ConfigValue(v)}")
+
+    includeDirs = [Path(projectPath).as_posix(), buildPath.as_posix()]
+    includeDirs.append(generatedPath.as_posix())
+    includeDirs += [
+        Path(sdkPath, d).as_posix() for d in SdkIncludeDirs(params, chip, libs)
+    ]
+
+    entryName = params["projectName"] if params["wantEntryProjName"] else "main"
+    if params["wantCPP"]:
+        entryFile = f"{entryName}.cpp"
+        compiler = f"{COMPILER_TRIPLE}-g++"
+        standard = "-std=gnu++17"
+    else:
+        entryFile = f"{entryName}.c"
+        compiler = COMPILER_NAME()
+        standard = "-std=gnu11"
+    compiler = Path(
+        params["userHome"] + relativeToolchainPath(params["toolchainVersion"]),
+        "bin",
+        compiler + (".exe" if isWindows else ""),
+    ).as_posix()
+
+    arguments = [compiler]
+    arguments += [f"-D{define}" for define in defines]
+    arguments += [f"-I{includeDir}" for includeDir in includeDirs]
+    arguments += platform_compile_flags.get(platform, [])
+    arguments += [
+        "-g",
+        standard,
+        "-o",
+        f"CMakeFiles/{params['projectName']}.dir/{entryFile}.o",
+        "-c",
+        Path(projectPath, entryFile).as_posix(),
+    ]
+
+    WriteFileIfChanged(
+        buildPath / "compile_commands.json",
+        json.dumps(
+            [
+                {
+                    "directory": buildPath.as_posix(),
+                    "arguments": arguments,
+                    "file": Path(projectPath, entryFile).as_posix(),
+                }
+            ],
+            indent=2,
+        )
+        + "\n",
+    )
+
+
+def ConfigTable(params):
+    """PICO_CONFIG table of the project's SDK version, by config name
+
+    The table pico_configs.py extracted when the SDK was installed, or the one
+    shipped in pico_configs.tsv if there is none. The SDK isn't scanned here,
+    that would make the first project with an SDK version wait for it.
+    """
+    pico_configs = ImportScriptModule("pico_configs")
+    tablePath = pico_configs.TablePath(params["userHome"], params["sdkVersion"])
+    if not tablePath.exists():
+        tablePath = GetFilePath("pico_configs.tsv")
+    return pico_configs.LoadTable(tablePath)
+
+
+def ConfigValue(v):
+    """A config value as written to the defines, configs from JSON can also be ints and bools"""
+    if v is True or v == "True":
+        return "1"
+    if v is False or v == "False":
+        return "0"
+    return str(v)
+
+
+def ValidateConfigs(params):
+    """Check the values of params["configs"] against the SDK's PICO_CONFIG table
+
+    Raises ProjectGenerationError listing every invalid value, so nothing is
+    written for a project that couldn't be built. Unknown names are only
+    reported, they can be the project's own defines.
+    """
+    table = ConfigTable(params)
+    problems = []
+    for c, v in params["configs"].items():
+        v = ConfigValue(v)
+        if c not in table:
+            print(f"{c} is not a known PICO_CONFIG of SDK {params['sdkVersion']}")
+            continue
+        row = table[c]
+        if row["type"] == "bool":
+            if v not in ("true", "false", "1", "0"):
+                problems.append(f"{c} must be a bool, not {v}")
+            continue
+        if row["type"] != "int" and not (row["min"] or row["max"]):
+            continue
+
+        try:
+            value = int(v, 0)
+        except ValueError:
+            # macros and expressions like (1u << 3) are left to the compiler,
+            # only plain numbers can be checked
+            continue
+        # bounds can be macros too
+        number = r"0x[0-9a-fA-F]+|[1-9][0-9]*|0"
+        if re.fullmatch(number, row["min"]) and value < int(row["min"], 0):
+            problems.append(f"{c} must be at least {row['min']}, not {v}")
+        if re.fullmatch(number, row["max"]) and value > int(row["max"], 0):
+            problems.append(f"{c} must be at most {row['max']}, not {v}")
+
+    if problems:
+        raise ProjectGenerationError(
+            "Invalid PICO_CONFIG values: " + "; ".join(problems)
+        )
+
+
+# PLL_SYS limits check_sys_clock_khz in the SDK searches within
+XOSC_KHZ = 12000
+PLL_VCO_MIN_KHZ = 750000
+PLL_VCO_MAX_KHZ = 1600000
+
+# Fastest flash clock the boot stage 2 should run the flash at, and the
+# PICO_FLASH_SPI_CLKDIV the SDK uses unless told otherwise
+FLASH_SPI_MAX_KHZ = 133000
+FLASH_SPI_CLKDIV_DEFAULT = 2
+
+# System clock the SDK runs each chip at unless told otherwise
+sys_clock_default_khz = {"rp2040": 125000, "rp2350": 150000}
+
+# Core voltage for sys clocks up to each limit in kHz, None keeps the default
+# 1.10V. The first limit is the datasheet maximum, anything above is overclocking.
+sys_clock_vreg = {
+    "rp2040": (
+        (133000, None),
+        (200000, "VREG_VOLTAGE_1_15"),
+        (250000, "VREG_VOLTAGE_1_20"),
+        (300000, "VREG_VOLTAGE_1_30"),
+    ),
+    "rp2350": (
+        (150000, None),
+        (200000, "VREG_VOLTAGE_1_15"),
+        (250000, "VREG_VOLTAGE_1_20"),
+        (300000, "VREG_VOLTAGE_1_30"),
+    ),
+}
+
+
+def SysClockPll(sysClockKhz):
+    """(VCO kHz, postdiv1, postdiv2) for sysClockKhz, or None if PLL_SYS can't make it
+
+    Searches in the same order as check_sys_clock_khz in the SDK, so it finds the
+    same setting set_sys_clock_khz would use.
+    """
+    for fbdiv in range(320, 15, -1):
+        vco = fbdiv * XOSC_KHZ
+        if vco < PLL_VCO_MIN_KHZ or vco > PLL_VCO_MAX_KHZ:
+            continue
+        for postdiv1 in range(7, 0, -1):
+            for postdiv2 in range(postdiv1, 0, -1):
+                if vco == sysClockKhz * postdiv1 * postdiv2:
+                    return vco, postdiv1, postdiv2
+    return None
+
+
+def AchievableSysClocks():
+    """Every sys clock in kHz PLL_SYS can make, sorted"""
+    clocks = set()
+    for fbdiv in range(-(-PLL_VCO_MIN_KHZ // XOSC_KHZ), PLL_VCO_MAX_KHZ // XOSC_KHZ + 1):
+        vco = fbdiv * XOSC_KHZ
+        for postdiv in {p1 * p2 for p1 in range(1, 8) for p2 in range(1, p1 + 1)}:
+            if vco % postdiv == 0:
+                clocks.add(vco // postdiv)
+    return sorted(clocks)
+
+
+def SysClockSettings(params):
+    """PLL, core voltage and flash settings for params["sysClockKhz"], None if it isn't set
+
+    Raises ProjectGenerationError if PLL_SYS can't make the clock or it is above
+    what the generator sets the chip up for.
+    """
+    sysClockKhz = params.get("sysClockKhz")
+    if not sysClockKhz:
+        return None
+
+    sdkPath = params["userHome"] + relativeSDKPath(params["sdkVersion"])
+    chip = PlatformChip(
+        BoardPlatform(sdkPath, params["boardtype"], params["toolchainVersion"])
+    )
+    limits = sys_clock_vreg.get(chip, sys_clock_vreg["rp2040"])
+    if sysClockKhz > limits[-1][0]:
+        raise ProjectGenerationError(
+            f"A {sysClockKhz} kHz system clock is above the {limits[-1][0]} kHz the {chip} can be set up for"
+        )
+
+    pll = SysClockPll(sysClockKhz)
+    if pll is None:
+        clocks = AchievableSysClocks()
+        lower = max((c for c in clocks if c < sysClockKhz), default=None)
+        higher = min((c for c in clocks if c > sysClockKhz), default=None)
+        nearest = " and ".join(f"{c} kHz" for c in (lower, higher) if c is not None)
+        raise ProjectGenerationError(
+            f"A {sysClockKhz} kHz system clock can't be made from the {XOSC_KHZ} kHz crystal, the nearest possible are {nearest}"
+        )
+
+    vreg = next(voltage for limit, voltage in limits if sysClockKhz <= limit)
+
+    # the divider has to be even
+    flashClkdiv = -(-sysClockKhz // FLASH_SPI_MAX_KHZ)
+    flashClkdiv += flashClkdiv % 2
+    if flashClkdiv <= FLASH_SPI_CLKDIV_DEFAULT or params["wantRunFromRAM"]:
+        flashClkdiv = None
+
+    return {
+        "chip": chip,
+        "sysClockKhz": sysClockKhz,
+        "overclocked": sysClockKhz > limits[0][0],
+        "nominalKhz": limits[0][0],
+        "vcoKhz": pll[0],
+        "postdiv1": pll[1],
+        "postdiv2": pll[2],
+        "vreg": vreg,
+        "flashClkdiv": flashClkdiv,
+    }
+
+
+def PioStreamSettings(params):
+    """Clock divider for the --pioStreamBitRate state machines, None if it isn't set
+
+    The programs take one cycle per bit, so the divider is the system clock over
+    the bit rate. Raises ProjectGenerationError if that is outside the 1 to 65536
+    PIO clock dividers can do.
+    """
+    bitRate = params.get("pioStreamBitRate")
+    if not bitRate:
+        return None
+
+    sdkPath = params["userHome"] + relativeSDKPath(params["sdkVersion"])
+    chip = PlatformChip(
+        BoardPlatform(sdkPath, params["boardtype"], params["toolchainVersion"])
+    )
+    sysClockKhz = params.get("sysClockKhz") or sys_clock_default_khz.get(chip, 125000)
+    div = sysClockKhz * 1000 / bitRate
+    if div < 1 or div > 65536:
+        raise ProjectGenerationError(
+            f"A PIO bit rate of {bitRate} bits/s needs a clock divider of {div:g} at {sysClockKhz / 1000:g} MHz, PIO can only divide by 1 to 65536"
+        )
+    return {"bitRate": bitRate, "sysClockKhz": sysClockKhz, "div": div}
+
+
+def OptionFragments(params):
+    """Code fragments of the generator_option_features params selects, and
+    replacements for the fragments of features options change"""
+    fragments = {}
+
+    if params.get("multicoreInRam"):
+        fragments["multicore"] = MulticoreFragments(True)
+
+    pioStream = PioStreamSettings(params)
+    if pioStream is not None:
+        div = pioStream["div"]
+        # the 8 bit fraction makes bits alternate between whole cycle lengths
+        divNote = "" if div == int(div) else ", the fraction makes bit lengths jitter by a cycle"
+        fragments["pio_stream"] = [
+            (
+                '#include "hardware/clocks.h"',
+                '#include "pio_stream.pio.h"',
+                "",
+                "// PIO stream on one pin, looped back into a second state machine. DMA feeds",
+                "// the TX FIFO and empties the RX FIFO, one bit takes one PIO cycle.",
+                f"// At {pioStream['sysClockKhz'] / 1000:g} MHz the clock divider is {div:g}{divNote}",
+                f"#define PIO_STREAM_BIT_RATE {pioStream['bitRate']}",
+                "#define PIO_STREAM_PIN 2",
+                "#define PIO_STREAM_WORDS 4096",
+                "",
+                "static uint32_t pio_stream_tx[PIO_STREAM_WORDS];",
+                "static uint32_t pio_stream_rx[PIO_STREAM_WORDS];",
+                "",
+                "static int pio_stream_dma(PIO pio, uint sm, bool is_tx, uint32_t *buffer) {",
+                "    int chan = dma_claim_unused_channel(true);",
+                "    dma_channel_config c = dma_channel_get_default_config(chan);",
+                "    channel_config_set_transfer_data_size(&c, DMA_SIZE_32);",
+                "    channel_config_set_read_increment(&c, is_tx);",
+                "    channel_config_set_write_increment(&c, !is_tx);",
+                "    channel_config_set_dreq(&c, pio_get_dreq(pio, sm, is_tx));",
+                "    if (is_tx) {",
+                "        dma_channel_configure(chan, &c, &pio->txf[sm], buffer, PIO_STREAM_WORDS, false);",
+                "    } else {",
+                "        dma_channel_configure(chan, &c, buffer, &pio->rxf[sm], PIO_STREAM_WORDS, false);",
+                "    }",
+                "    return chan;",
+                "}",
+            ),
+            (
+                "// PIO stream self-check: send PIO_STREAM_WORDS words through the loopback,",
+                "// check DMA kept up with the state machines and report the bit rate",
+                "PIO stream_pio = pio1;",
+                "float stream_div = (float)clock_get_hz(clk_sys) / PIO_STREAM_BIT_RATE;",
+                "uint out_offset = pio_add_program(stream_pio, &pio_stream_out_program);",
+                "uint in_offset = pio_add_program(stream_pio, &pio_stream_in_program);",
+                "uint out_sm = pio_claim_unused_sm(stream_pio, true);",
+                "uint in_sm = pio_claim_unused_sm(stream_pio, true);",
+                "pio_stream_out_program_init(stream_pio, out_sm, out_offset, PIO_STREAM_PIN, stream_div);",
+                "pio_stream_in_program_init(stream_pio, in_sm, in_offset, PIO_STREAM_PIN, stream_div);",
+                "for (uint i = 0; i < PIO_STREAM_WORDS; i++) {",
+                "    pio_stream_tx[i] = i * 0x9e3779b9u;",
+                "}",
+                "int out_chan = pio_stream_dma(stream_pio, out_sm, true, pio_stream_tx);",
+                "int in_chan = pio_stream_dma(stream_pio, in_sm, false, pio_stream_rx);",
+                "dma_start_channel_mask((1u << out_chan) | (1u << in_chan));",
+                "",
+                "// Stall flags are sticky, a stall before the last word is queued means DMA fell behind",
+                "stream_pio->fdebug = 0xffffffff;",
+                "uint64_t stream_start = time_us_64();",
+                "pio_enable_sm_mask_in_sync(stream_pio, (1u << out_sm) | (1u << in_sm));",
+                "dma_channel_wait_for_finish_blocking(out_chan);",
+                "bool tx_underrun = stream_pio->fdebug & (1u << (PIO_FDEBUG_TXSTALL_LSB + out_sm));",
+                "dma_channel_wait_for_finish_blocking(in_chan);",
+                "uint64_t stream_us = time_us_64() - stream_start;",
+                "pio_set_sm_mask_enabled(stream_pio, (1u << out_sm) | (1u << in_sm), false);",
+                "bool rx_overflow = stream_pio->fdebug & (1u << (PIO_FDEBUG_RXSTALL_LSB + in_sm));",
+                "",
+                "uint32_t stream_bits = PIO_STREAM_WORDS * 32;",
+                'printf("PIO stream: %u bits in %u us, %u bits/s for %u requested%s%s\\n", (unsigned)stream_bits,',
+                "       (unsigned)stream_us, (unsigned)(stream_bits * 1000000ull / stream_us), (unsigned)PIO_STREAM_BIT_RATE,",
+                '       tx_underrun ? ", TX underrun" : "", rx_overflow ? ", RX overflow" : "");',
+            ),
+        ]
+
+    clock = SysClockSettings(params)
+    if clock is not None:
+        mhz = f"{clock['sysClockKhz'] / 1000:g} MHz"
+        preInitialisers = []
+        if clock["vreg"]:
+            preInitialisers += [
+                "// Raise the core voltage first and let it settle",
+                f"vreg_set_voltage({clock['vreg']});",
+                "sleep_ms(10);",
+            ]
+        preInitialisers += [
+            f"// Run the system clock at {mhz}",
+            "set_sys_clock_pll(SYS_CLOCK_VCO_HZ, SYS_CLOCK_POSTDIV1, SYS_CLOCK_POSTDIV2);",
+            "// Keep clk_peri at 48 MHz from the USB PLL, so UART and SPI rates don't change with the system clock",
+            "clock_configure(clk_peri, 0, CLOCKS_CLK_PERI_CTRL_AUXSRC_VALUE_CLKSRC_PLL_USB, 48 * MHZ, 48 * MHZ);",
+            "",
+        ]
+        fragments["sys_clock"] = [
+            (
+                '#include "hardware/clocks.h"',
+                "",
+                f"// {mhz} system clock: {XOSC_KHZ // 1000} MHz crystal * {clock['vcoKhz'] // XOSC_KHZ}"
+                f" = {clock['vcoKhz'] // 1000} MHz VCO, / {clock['postdiv1']} / {clock['postdiv2']}",
+                f"#define SYS_CLOCK_VCO_HZ {clock['vcoKhz'] * 1000}",
+                f"#define SYS_CLOCK_POSTDIV1 {clock['postdiv1']}",
+                f"#define SYS_CLOCK_POSTDIV2 {clock['postdiv2']}",
+            ),
+            (
+                'printf("System clock is %u kHz\\n", (unsigned)(clock_get_hz(clk_sys) / 1000));',
+            ),
+            tuple(preInitialisers),
+        ]
+
+    return fragments
 
 
 def GetFilePath(filename):
@@ -578,6 +1772,12 @@ def ParseCommandLine():
         action="store_true",
         help="Console output to USB (disables other USB functionality",
     )
+    parser.add_argument(
+        "-rtt",
+        "--rtt",
+        action="store_true",
+        help="Console output over SEGGER RTT, shown in the debugger (SDK 2.0.0 and later)",
+    )
     parser.add_argument(
         "-cpp", "--cpp", action="store_true", default=0, help="Generate C++ code"
     )
@@ -652,56 +1852,447 @@ def ParseCommandLine():
         "--userHome",
         help="Full path to user's home directory",
     )
+    parser.add_argument(
+        "-batch",
+        "--batch",
+        help="Generate all projects listed in a JSON manifest, command line options are used as defaults",
+    )
+    parser.add_argument(
+        "-server",
+        "--server",
+        action="store_true",
+        help="Serve JSON-RPC generation requests on stdin/stdout, command line options are used as defaults",
+    )
+    parser.add_argument(
+        "-sysclk",
+        "--sysClockKhz",
+        type=int,
+        help="System clock in kHz to set up at start-up, checked against what the PLL can make",
+    )
+    parser.add_argument(
+        "-multicoreRam",
+        "--multicoreInRam",
+        action="store_true",
+        help="Run core 1's loop of the multicore feature from RAM, with its data in scratch RAM",
+    )
+    parser.add_argument(
+        "-dmaStream",
+        "--dmaStream",
+        choices=dma_stream_peripherals,
+        help="Stream data to or from this peripheral with double-buffered DMA",
+    )
+    for kind in runtime_implementations:
+        parser.add_argument(
+            f"-{kind}",
+            f"--{kind}Implementation",
+            choices=sorted(
+                {impl for impls in runtime_implementations[kind].values() for impl in impls}
+            ),
+            help=f"{kind.capitalize()} implementation to link, checked against the board's platform",
+        )
+    parser.add_argument(
+        "-hotCode",
+        "--hotCodePlacement",
+        choices=hot_code_placements,
+        help="Where functions marked HOT_FUNC go",
+    )
+    parser.add_argument(
+        "-hotData",
+        "--hotDataPlacement",
+        choices=hot_data_placements,
+        help="Where buffers marked HOT_DATA go",
+    )
+    parser.add_argument(
+        "-stack",
+        "--stackSize",
+        type=int,
+        help="Stack size of core 0 in bytes",
+    )
+    parser.add_argument(
+        "-core1Stack",
+        "--core1StackSize",
+        type=int,
+        help="Stack size of core 1 in bytes",
+    )
+    parser.add_argument(
+        "-linkerScript",
+        "--linkerScript",
+        action="store_true",
+        help="Link with a project-local copy of the SDK linker script",
+    )
+    parser.add_argument(
+        "-freertos",
+        "--freertosKernelPath",
+        default=os.environ.get("FREERTOS_KERNEL_PATH"),
+        help="Local FreeRTOS kernel for the picow_freertos feature, defaults to FREERTOS_KERNEL_PATH",
+    )
+    parser.add_argument(
+        "-pioStream",
+        "--pioStreamBitRate",
+        type=int,
+        help="Generate a DMA fed PIO stream at this many bits per second, with a throughput self-check",
+    )
+    parser.add_argument(
+        "-profile",
+        "--buildProfile",
+        choices=list(build_profiles),
+        default="default",
+        help="Build profile: "
+        + ", ".join(f"{name} ({desc})" for name, desc in build_profiles.items()),
+    )
+    parser.add_argument(
+        "-pch",
+        "--precompiledHeaders",
+        action="store_true",
+        help="Precompile the SDK and feature headers (needs CMake 3.16 or later)",
+    )
+    parser.add_argument(
+        "-unity",
+        "--unityBuild",
+        action="store_true",
+        help="Compile the project's sources in unity batches (needs CMake 3.18 or later)",
+    )
+    parser.add_argument(
+        "-unityBatch",
+        "--unityBatchSize",
+        type=int,
+        default=UNITY_BATCH_SIZE,
+        help=f"Sources per unity batch (default {UNITY_BATCH_SIZE})",
+    )
+    parser.add_argument(
+        "-unityExclude",
+        "--unityExclude",
+        action="append",
+        help="Source file name to keep out of the unity batches, can be repeated",
+    )
+    parser.add_argument(
+        "-convAll",
+        "--convertAll",
+        help="Convert every existing project found under this folder in parallel, command line options are used as defaults",
+    )
+    parser.add_argument(
+        "-jobs",
+        "--jobs",
+        type=int,
+        help="Number of projects --convertAll converts at the same time (default: number of CPUs)",
+    )
 
     return parser.parse_args()
 
 
-def GenerateMain(folder, projectName, features, cpp, wantEntryProjName):
-
-    executableName = projectName if wantEntryProjName else "main"
-    if cpp:
-        filename = Path(folder) / (executableName + ".cpp")
+def FeaturesAndExamples(params):
+    """The selected features plus the stdlib examples GenerateMain adds code for"""
+    if params["features"]:
+        features_and_examples = params["features"][:]
     else:
-        filename = Path(folder) / (executableName + ".c")
+        features_and_examples = []
 
-    file = open(filename, "w")
+    if params["wantExamples"]:
+        features_and_examples = (
+            list(stdlib_examples_list.keys()) + features_and_examples
+        )
 
-    main = "#include <stdio.h>\n" '#include "pico/stdlib.h"\n'
-    file.write(main)
+    if params["wantUARTExample"]:
+        # add uart to features_and_examples if not present
+        if "uart" not in features_and_examples:
+            features_and_examples.append("uart")
 
-    if features:
+    if params.get("multicoreInRam") and "multicore" not in features_and_examples:
+        features_and_examples.append("multicore")
 
-        # Add any includes
-        for feat in features:
-            if feat in features_list:
-                if len(features_list[feat][H_FILE]) == 0:
-                    continue
-                o = f'#include "{features_list[feat][H_FILE]}"\n'
-                file.write(o)
-            if feat in stdlib_examples_list:
-                if len(stdlib_examples_list[feat][H_FILE]) == 0:
-                    continue
-                o = f'#include "{stdlib_examples_list[feat][H_FILE]}"\n'
-                file.write(o)
-            if feat in picow_options_list:
-                if len(picow_options_list[feat][H_FILE]) == 0:
-                    continue
-                o = f'#include "{picow_options_list[feat][H_FILE]}"\n'
-                file.write(o)
+    if params.get("sysClockKhz"):
+        features_and_examples.append("sys_clock")
 
-        file.write("\n")
+    if params.get("dmaStream"):
+        features_and_examples += [f"dma_stream_{params['dmaStream']}", "dma_stream"]
 
-        # Add any defines
-        for feat in features:
-            if feat in code_fragments_per_feature:
-                for s in code_fragments_per_feature[feat][DEFINES]:
-                    file.write(s)
+    if params.get("pioStreamBitRate"):
+        features_and_examples += ["dma_channels", "pio_stream"]
+
+    if params.get("hotCodePlacement") or params.get("hotDataPlacement"):
+        features_and_examples.append("memory_layout")
+
+    # last, as its initialiser starts the scheduler and doesn't return
+    if "picow_freertos" in features_and_examples:
+        features_and_examples.append("freertos_kernel")
+
+    return features_and_examples
+
+
+def FeatureHeaders(features):
+    """Headers GenerateMain includes for features, after stdio.h and pico/stdlib.h"""
+    headers = []
+    for feat in features:
+        for feature_list in (
+            features_list,
+            stdlib_examples_list,
+            picow_options_list,
+            generator_option_features,
+        ):
+            if feat in feature_list and feature_list[feat][H_FILE]:
+                if feature_list[feat][H_FILE] not in headers:
+                    headers.append(feature_list[feat][H_FILE])
+    return headers
+
+
+def PrecompiledHeaders(
+    target, headers, condition="CMAKE_VERSION VERSION_GREATER_EQUAL 3.16"
+):
+    """CMake to precompile headers for target, target_precompile_headers needs CMake 3.16"""
+    return (
+        f"if ({condition})\n"
+        f"    target_precompile_headers({target} PRIVATE\n"
+        + "".join(f"        <{header}>\n" for header in headers)
+        + "    )\n"
+        "endif()\n\n"
+    )
+
+
+def BuildProfileCMake(target, wantRunFromRAM):
+    """CMake applying the build profile PICO_VSCODE_PROFILE selects to target
+
+    Every profile is written out, so switching only needs PICO_VSCODE_PROFILE
+    changed. PICO_VSCODE_LTO turns link-time optimisation off again, for
+    projects linking something that doesn't survive it.
+    """
+    if wantRunFromRAM:
+        copyToRam = "    # no_flash binaries already run from RAM\n"
+    else:
+        copyToRam = f"    pico_set_binary_type({target} copy_to_ram)\n"
+    return (
+        'option(PICO_VSCODE_LTO "Use link-time optimisation in the max-speed and min-size profiles" ON)\n'
+        'if (PICO_VSCODE_PROFILE STREQUAL "max-speed")\n'
+        + copyToRam
+        + f"    target_compile_options({target} PRIVATE -O3)\n"
+        'elseif (PICO_VSCODE_PROFILE STREQUAL "min-size")\n'
+        "    # unused sections are already dropped, the SDK links with --gc-sections\n"
+        f"    target_compile_options({target} PRIVATE -Os)\n"
+        "endif()\n"
+        'if (PICO_VSCODE_LTO AND PICO_VSCODE_PROFILE MATCHES "^(max-speed|min-size)$")\n'
+        "    include(CheckIPOSupported)\n"
+        "    check_ipo_supported(RESULT ipo_supported OUTPUT ipo_output LANGUAGES C)\n"
+        "    if (ipo_supported)\n"
+        f"        set_target_properties({target} PROPERTIES INTERPROCEDURAL_OPTIMIZATION ON)\n"
+        "    else()\n"
+        '        message(WARNING "Link-time optimisation is not supported: ${ipo_output}")\n'
+        "    endif()\n"
+        "endif()\n\n"
+    )
+
+
+def FreeRTOSKernelCMake(kernelPath):
+    """CMake to pull in the FreeRTOS kernel from a local checkout, has to come before project()"""
+    portPaths = "".join(
+        f'{"if" if i == 0 else "elseif"} (PICO_PLATFORM STREQUAL "{platform}")\n'
+        f"    set(FREERTOS_KERNEL_PORT {port})\n"
+        for i, (platform, port) in enumerate(freertos_ports.items())
+    )
+    return (
+        "# Pull in the FreeRTOS kernel from a local checkout (must be before project)\n"
+        f'set(FREERTOS_KERNEL_PATH "{Path(kernelPath).as_posix()}" CACHE PATH "FreeRTOS kernel source")\n'
+        + portPaths
+        + "endif()\n"
+        "set(FREERTOS_KERNEL_IMPORT ${FREERTOS_KERNEL_PATH}/portable/ThirdParty/GCC/${FREERTOS_KERNEL_PORT}/FreeRTOS_Kernel_import.cmake)\n"
+        "if (NOT EXISTS ${FREERTOS_KERNEL_IMPORT})\n"
+        '    message(FATAL_ERROR "No FreeRTOS kernel port for ${PICO_PLATFORM} in ${FREERTOS_KERNEL_PATH}")\n'
+        "endif()\n"
+        "include(${FREERTOS_KERNEL_IMPORT})\n\n"
+    )
+
+
+def MemoryLayoutSettings(params):
+    """The memory layout options, checked, or None if none of them are set
+
+    Raises ProjectGenerationError for unknown placements, and for stacks that
+    don't fit their scratch bank with the SDK's linker scripts.
+    """
+    keys = ("hotCodePlacement", "hotDataPlacement", "stackSize", "core1StackSize", "linkerScript")
+    if not any(params.get(key) for key in keys):
+        return None
+
+    hotCode = params.get("hotCodePlacement")
+    if hotCode and hotCode not in hot_code_placements:
+        raise ProjectGenerationError(f"Can't put hot code in {hotCode}")
+    hotData = params.get("hotDataPlacement")
+    if hotData and hotData not in hot_data_placements:
+        raise ProjectGenerationError(f"Can't put hot data in {hotData}")
+
+    for key, core in (("stackSize", 0), ("core1StackSize", 1)):
+        size = params.get(key)
+        if size is None:
+            continue
+        if size <= 0 or size % 8:
+            raise ProjectGenerationError(
+                f"The core {core} stack size has to be a positive multiple of 8 bytes, not {size}"
+            )
+        if size > SCRATCH_BANK_SIZE and not params.get("linkerScript"):
+            raise ProjectGenerationError(
+                f"A {size} byte core {core} stack doesn't fit its {SCRATCH_BANK_SIZE} byte scratch bank, use --linkerScript to place it elsewhere"
+            )
+
+    if params.get("linkerScript") and (params.get("buildProfile") == "max-speed"):
+        raise ProjectGenerationError(
+            "The max-speed profile sets its own linker script, it can't be combined with --linkerScript"
+        )
+
+    return {
+        "hotPlacement": bool(hotCode or hotData),
+        "hotCode": hotCode or "flash",
+        "hotData": hotData or "sram",
+        "stackSize": params.get("stackSize"),
+        "core1StackSize": params.get("core1StackSize"),
+        "linkerScript": params.get("linkerScript"),
+    }
+
+
+def SdkLinkerScript(params):
+    """Path of the SDK linker script the project-local one starts from"""
+    sdkPath = Path(params["userHome"] + relativeSDKPath(params["sdkVersion"]))
+    chip = PlatformChip(
+        BoardPlatform(str(sdkPath), params["boardtype"], params["toolchainVersion"])
+    )
+    name = "memmap_no_flash.ld" if params["wantRunFromRAM"] else "memmap_default.ld"
+    for folder in sdk_linker_script_dirs:
+        script = sdkPath / folder.format(chip=chip) / name
+        if script.is_file():
+            return script
+    # SDKs that moved them somewhere else still keep them in a folder per chip
+    for script in sorted((sdkPath / "src").glob(f"**/{chip}/**/{name}")):
+        return script
+    raise ProjectGenerationError(f"Can't find the SDK's {name} for {chip}")
+
+
+def MemoryLayoutCMake(target, layout):
+    """CMake for the memory layout options, see MemoryLayoutSettings"""
+    cmake = ""
+    definitions = []
+    if layout["hotPlacement"]:
+        cmake += (
+            f'set(PICO_VSCODE_HOT_CODE {layout["hotCode"]} CACHE STRING "Where HOT_FUNC code goes: {", ".join(hot_code_placements)}")\n'
+            f'set(PICO_VSCODE_HOT_DATA {layout["hotData"]} CACHE STRING "Where HOT_DATA data goes: {", ".join(hot_data_placements)}")\n'
+            'string(TOUPPER "${PICO_VSCODE_HOT_CODE}" hot_code)\n'
+            'string(TOUPPER "${PICO_VSCODE_HOT_DATA}" hot_data)\n'
+        )
+        definitions += ["PICO_VSCODE_HOT_CODE_${hot_code}=1", "PICO_VSCODE_HOT_DATA_${hot_data}=1"]
+    # the stacks are reserved by crt0 and pico_multicore, which are compiled as part of the target
+    if layout["stackSize"]:
+        definitions.append(f"PICO_STACK_SIZE={layout['stackSize']:#x}")
+    if layout["core1StackSize"]:
+        definitions.append(f"PICO_CORE1_STACK_SIZE={layout['core1StackSize']:#x}")
+    if definitions:
+        cmake += f"target_compile_definitions({target} PRIVATE\n"
+        cmake += "".join(f"    {d}\n" for d in definitions)
+        cmake += "    )\n"
+    if layout["linkerScript"]:
+        cmake += (
+            "# Project-local copy of the SDK linker script, edit it to place sections in specific banks\n"
+            f"pico_set_linker_script({target} ${{CMAKE_CURRENT_LIST_DIR}}/{PROJECT_LINKER_SCRIPT})\n"
+        )
+    return cmake + "\n"
+
+
+def RuntimeImplementations(params):
+    """The pico_set_<kind>_implementation choices of params that aren't default, by kind
+
+    Raises ProjectGenerationError for choices the board's platform doesn't have.
+    """
+    chosen = {kind: params.get(f"{kind}Implementation") for kind in runtime_implementations}
+    if not any(impl and impl != "default" for impl in chosen.values()):
+        return {}
+
+    sdkPath = params["userHome"] + relativeSDKPath(params["sdkVersion"])
+    platform = BoardPlatform(sdkPath, params["boardtype"], params["toolchainVersion"])
+    implementations = {}
+    for kind, impl in chosen.items():
+        if not impl or impl == "default":
+            continue
+        available = runtime_implementations[kind].get(platform, ())
+        if impl not in available:
+            raise ProjectGenerationError(
+                f"There is no {impl} {kind} implementation for {platform}, choose from {', '.join(available)}"
+            )
+        implementations[kind] = impl
+    return implementations
+
+
+def UnityBuild(
+    target, batchSize, exclude=(), condition="CMAKE_VERSION VERSION_GREATER_EQUAL 3.18"
+):
+    """CMake to compile the sources of target in unity batches, UNITY_BUILD_MODE GROUP needs CMake 3.18
+
+    Only sources added to target itself are grouped, the SDK sources it gets
+    from the libraries it links are still compiled one by one. Sources in
+    PICO_VSCODE_UNITY_EXCLUDE, or with SKIP_UNITY_BUILD_INCLUSION set, are
+    also compiled on their own.
+    """
+    return (
+        f"if ({condition})\n"
+        f"    set(PICO_VSCODE_UNITY_EXCLUDE {' '.join(exclude)})\n"
+        f"    get_target_property(unity_sources {target} SOURCES)\n"
+        "    set(unity_index 0)\n"
+        "    foreach(unity_source IN LISTS unity_sources)\n"
+        '        get_filename_component(unity_name "${unity_source}" NAME)\n'
+        '        if (unity_source MATCHES "\\\\.(c|cpp|cc|cxx)$" AND NOT unity_name IN_LIST PICO_VSCODE_UNITY_EXCLUDE)\n'
+        f'            math(EXPR unity_batch "${{unity_index}} / {batchSize}")\n'
+        f'            set_source_files_properties(${{unity_source}} PROPERTIES UNITY_GROUP "{target}_${{unity_batch}}")\n'
+        '            math(EXPR unity_index "${unity_index} + 1")\n'
+        "        endif()\n"
+        "    endforeach()\n"
+        f"    set_target_properties({target} PROPERTIES UNITY_BUILD ON UNITY_BUILD_MODE GROUP)\n"
+        "endif()\n\n"
+    )
+
+
+def GenerateMain(
+    folder, projectName, features, cpp, wantEntryProjName, optionFragments=None
+):
+
+    executableName = projectName if wantEntryProjName else "main"
+    if cpp:
+        filename = Path(folder) / (executableName + ".cpp")
+    else:
+        filename = Path(folder) / (executableName + ".c")
+
+    file = io.StringIO()
+
+    code_fragments_per_feature = {**CodeFragments(), **(optionFragments or {})}
+
+    main = "#include <stdio.h>\n" '#include "pico/stdlib.h"\n'
+    file.write(main)
+
+    if features:
+
+        # Add any includes
+        for header in FeatureHeaders(features):
+            file.write(f'#include "{header}"\n')
+
+        file.write("\n")
+
+        # Add any defines
+        for feat in features:
+            if feat in code_fragments_per_feature:
+                for s in code_fragments_per_feature[feat][DEFINES]:
+                    file.write(s)
                     file.write("\n")
                 file.write("\n")
 
-    main = "\n\n" "int main()\n" "{\n" "    stdio_init_all();\n\n"
+    main = "\n\n" "int main()\n" "{\n"
+
+    # Add any initialisers that have to run before stdio is set up
+    for feat in features:
+        fragments = code_fragments_per_feature.get(feat, ())
+        if len(fragments) > PRE_INITIALISERS:
+            for s in fragments[PRE_INITIALISERS]:
+                main += "    " + s + "\n"
+
+    main += "    stdio_init_all();\n\n"
 
-    if any([feat in picow_options_list and feat != "picow_none" for feat in features]):
+    # with FreeRTOS, main_task initialises the Wi-Fi chip
+    scheduler = "freertos_kernel" in features
+
+    if not scheduler and any(
+        [feat in picow_options_list and feat != "picow_none" for feat in features]
+    ):
         main += (
             "    // Initialise the Wi-Fi chip\n"
             "    if (cyw43_arch_init()) {\n"
@@ -721,17 +2312,58 @@ def GenerateMain(folder, projectName, features, cpp, wantEntryProjName):
                     main += "\n"
                 main += "\n"
 
-    main += (
-        "    while (true) {\n"
-        '        printf("Hello, world!\\n");\n'
-        "        sleep_ms(1000);\n"
-        "    }\n"
-        "}\n"
-    )
+    if scheduler:
+        main += "    return 0;\n}\n"
+    else:
+        main += (
+            "    while (true) {\n"
+            '        printf("Hello, world!\\n");\n'
+            "        sleep_ms(1000);\n"
+            "    }\n"
+            "}\n"
+        )
 
     file.write(main)
 
-    file.close()
+    WriteFileIfChanged(filename, file.getvalue())
+
+
+# Result of converting an existing project, returned by GenerateCMake
+CONVERT_CONVERTED = "converted"
+CONVERT_ALREADY_CONVERTED = "already converted"
+CONVERT_HEADER_UPGRADED = "old header upgraded"
+
+# What converting needs to know about an existing CMakeLists.txt, see ScanExistingCMake
+cmake_scan_markers = {
+    "header": CMAKE_DO_NOT_EDIT_HEADER_PREFIX,
+    "oldHeader": CMAKE_DO_NOT_EDIT_HEADER_PREFIX_OLD,
+    "picoBoard": "set(PICO_BOARD",
+    "wifi": "WIFI_SSID",
+    "tcpServerIp": "TEST_TCP_SERVER_IP",
+    "mqttServer": "MQTT_SERVER",
+    "cyw43": "pico_cyw43_arch",
+}
+
+_add_executable_re = re.compile(r"^\s*add_executable\s*\(\s*([\w.+-]+)")
+
+
+def ScanExistingCMake(lines):
+    """Which of cmake_scan_markers the lines of an existing CMakeLists.txt contain, in a single pass
+
+    "executables" lists the targets of its add_executable calls.
+    """
+    found = dict.fromkeys(cmake_scan_markers, False)
+    found["executables"] = []
+    remaining = dict(cmake_scan_markers)
+    for line in lines:
+        for key, marker in list(remaining.items()):
+            if marker in line:
+                found[key] = True
+                del remaining[key]
+        executable = _add_executable_re.match(line)
+        if executable:
+            found["executables"].append(executable.group(1))
+    return found
 
 
 def GenerateCMake(folder, params):
@@ -770,8 +2402,10 @@ def GenerateCMake(folder, params):
         f'set(PICO_BOARD {board_type} CACHE STRING "Board type")\n\n'
         "# Pull in Raspberry Pi Pico SDK (must be before project)\n"
         "include(pico_sdk_import.cmake)\n\n"
-        f"project({projectName} C CXX ASM)\n"
     )
+    if "picow_freertos" in (params.get("features") or []):
+        cmake_header2 += FreeRTOSKernelCMake(params["freertosKernelPath"])
+    cmake_header2 += f"project({projectName} C CXX ASM)\n"
 
     cmake_header3 = (
         "\n# Initialise the Raspberry Pi Pico SDK\n"
@@ -780,46 +2414,44 @@ def GenerateCMake(folder, params):
     )
 
     if params["wantConvert"]:
-        with open(filename, "r+") as file:
-            content = file.read()
-            file.seek(0)
-            lines = file.readlines()
-            file.seek(0)
-            file.truncate()
+        with open(filename, "r") as existing:
+            content = existing.read()
+        lines = io.StringIO(content).readlines()
+        found = ScanExistingCMake(lines)
+        status = CONVERT_CONVERTED
+        with io.StringIO() as file:
             if not params["wantExample"]:
-                if CMAKE_DO_NOT_EDIT_HEADER_PREFIX in content:
+                if found["header"]:
                     print(
                         "Not adding duplicate header to existing Pico VS Code project"
                     )
-                elif CMAKE_DO_NOT_EDIT_HEADER_PREFIX_OLD in content:
+                    status = CONVERT_ALREADY_CONVERTED
+                elif found["oldHeader"]:
                     print("Replacing old header with new")
                     content = content.replace(
                         CMAKE_DO_NOT_EDIT_HEADER_PREFIX_OLD,
                         CMAKE_DO_NOT_EDIT_HEADER_PREFIX,
                     )
+                    status = CONVERT_HEADER_UPGRADED
                 else:
                     # Preexisting CMake configuration - just adding cmake_header_us
                     file.write(cmake_header_us)
                     # If no PICO_BOARD, then add a line for that, defaulting to pico
-                    if not any(["set(PICO_BOARD" in line for line in lines]):
+                    if not found["picoBoard"]:
                         file.write(
                             f'set(PICO_BOARD pico CACHE STRING "Board type")\n\n'
                         )
                 file.write(content)
             else:
-                for line in lines:
-                    if "WIFI_SSID" in line and "WIFI_SSID" not in cmake_header2:
-                        cmake_header2 += (
-                            '\nset(WIFI_SSID "Your Wi-Fi SSID")\n'
-                            'set(WIFI_PASSWORD "Your Wi-Fi Password")\n'
-                        )
-                    if (
-                        "TEST_TCP_SERVER_IP" in line
-                        and "TEST_TCP_SERVER_IP" not in cmake_header2
-                    ):
-                        cmake_header2 += '\nset(TEST_TCP_SERVER_IP "192.168.1.100") # Change this to your TCP server IP\n'
-                    if "MQTT_SERVER" in line and "MQTT_SERVER" not in cmake_header2:
-                        cmake_header2 += '\nset(MQTT_SERVER "myMQTTserver") # Change this to the host name of your MQTT server\n'
+                if found["wifi"]:
+                    cmake_header2 += (
+                        '\nset(WIFI_SSID "Your Wi-Fi SSID")\n'
+                        'set(WIFI_PASSWORD "Your Wi-Fi Password")\n'
+                    )
+                if found["tcpServerIp"]:
+                    cmake_header2 += '\nset(TEST_TCP_SERVER_IP "192.168.1.100") # Change this to your TCP server IP\n'
+                if found["mqttServer"]:
+                    cmake_header2 += '\nset(MQTT_SERVER "myMQTTserver") # Change this to the host name of your MQTT server\n'
 
                 if params["wantBTStackExample"]:
                     """
@@ -851,7 +2483,6 @@ def GenerateCMake(folder, params):
                 file.write(cmake_header3)
                 for lib in params["exampleLibs"]:
                     file.write(f"add_subdirectory({lib})\n")
-                file.flush()
                 # Remove example_auto_set_url
                 for i, line in enumerate(lines):
                     if "example_auto_set_url" in line:
@@ -861,9 +2492,41 @@ def GenerateCMake(folder, params):
                         for lib in params["exampleLibs"]:
                             lines[i] += f"  {lib}\n"
                 file.writelines(lines)
-        return
 
-    file = open(filename, "w")
+                if params.get("wantUnityBuild"):
+                    file.write(
+                        "\n# Compile the example sources in unity batches, add sources that\n"
+                        "# don't build that way to PICO_VSCODE_UNITY_EXCLUDE\n"
+                    )
+                    for target in found["executables"]:
+                        file.write(
+                            UnityBuild(
+                                target,
+                                params.get("unityBatchSize") or UNITY_BATCH_SIZE,
+                                params.get("unityExclude") or (),
+                                f"CMAKE_VERSION VERSION_GREATER_EQUAL 3.18 AND TARGET {target}",
+                            )
+                        )
+
+                if params.get("wantPCH"):
+                    headers = ["pico/stdlib.h"]
+                    if found["cyw43"]:
+                        headers.append("pico/cyw43_arch.h")
+                    file.write(
+                        "\n# Precompile the SDK headers the example sources include\n"
+                    )
+                    for target in found["executables"]:
+                        file.write(
+                            PrecompiledHeaders(
+                                target,
+                                headers,
+                                f"CMAKE_VERSION VERSION_GREATER_EQUAL 3.16 AND TARGET {target}",
+                            )
+                        )
+            WriteFileIfChanged(filename, file.getvalue())
+        return status
+
+    file = io.StringIO()
 
     file.write(cmake_header1)
     file.write(cmake_header_us)
@@ -875,17 +2538,26 @@ def GenerateCMake(folder, params):
     if params["rtti"]:
         file.write("\nset(PICO_CXX_ENABLE_RTTI 1)\n")
 
+    file.write(
+        f"\nset(PICO_VSCODE_PROFILE {params.get('buildProfile') or 'default'} CACHE STRING "
+        f'"Build profile: {", ".join(build_profiles)}")\n'
+    )
+
+    clock = SysClockSettings(params)
+    if clock and clock["flashClkdiv"] and "PICO_FLASH_SPI_CLKDIV" not in (params["configs"] or {}):
+        file.write(
+            f"\n# Keep the flash clock in spec at {clock['sysClockKhz'] / 1000:g} MHz, this has to be set\n"
+            "# before pico_sdk_init() so the boot stage 2 is built with it too\n"
+            f"add_compile_definitions(PICO_FLASH_SPI_CLKDIV={clock['flashClkdiv']})\n"
+        )
+
     file.write(cmake_header3)
 
     # add the preprocessor defines for overall configuration
     if params["configs"]:
         file.write("# Add any PICO_CONFIG entries specified in the Advanced settings\n")
         for c, v in params["configs"].items():
-            if v == "True":
-                v = "1"
-            elif v == "False":
-                v = "0"
-            file.write(f"add_compile_definitions({c} = {v})\n")
+            file.write(f"add_compile_definitions({c} = {ConfigValue(v)})\n")
         file.write("\n")
 
     entry_point_file_name = projectName if params["wantEntryProjName"] else "main"
@@ -902,6 +2574,21 @@ def GenerateCMake(folder, params):
         file.write(f"# no_flash means the target is to run from RAM\n")
         file.write(f"pico_set_binary_type({projectName} no_flash)\n\n")
 
+    implementations = RuntimeImplementations(params)
+    if implementations:
+        file.write("# Select the float, double, divider and printf implementations\n")
+        for kind, impl in implementations.items():
+            file.write(f"pico_set_{kind}_implementation({projectName} {impl})\n")
+        file.write("\n")
+
+    file.write("# Apply the build profile\n")
+    file.write(BuildProfileCMake(projectName, params["wantRunFromRAM"]))
+
+    layout = MemoryLayoutSettings(params)
+    if layout is not None:
+        file.write("# Memory layout of hot code and data, and the stacks\n")
+        file.write(MemoryLayoutCMake(projectName, layout))
+
     # Add pio output
     if params["features"] and "pio" in params["features"]:
         file.write(f"# Generate PIO header\n")
@@ -909,6 +2596,12 @@ def GenerateCMake(folder, params):
             f"pico_generate_pio_header({projectName} ${{CMAKE_CURRENT_LIST_DIR}}/blink.pio)\n\n"
         )
 
+    if params.get("pioStreamBitRate"):
+        file.write(f"# Generate the PIO stream header\n")
+        file.write(
+            f"pico_generate_pio_header({projectName} ${{CMAKE_CURRENT_LIST_DIR}}/pio_stream.pio)\n\n"
+        )
+
     # Console output destinations
     file.write("# Modify the below lines to enable/disable output over UART/USB\n")
     if params["wantUART"]:
@@ -921,6 +2614,13 @@ def GenerateCMake(folder, params):
     else:
         file.write(f"pico_enable_stdio_usb({projectName} 0)\n\n")
 
+    if params.get("wantRTT"):
+        file.write(
+            "# Console output over SEGGER RTT through the debug probe, which only copies to a\n"
+            "# RAM buffer so doesn't block the code like UART/USB output does\n"
+        )
+        file.write(f"pico_enable_stdio_rtt({projectName} 1)\n\n")
+
     # If we need wireless, check for SSID and password
     # removed for the moment as these settings are currently only needed for the pico-examples
     # but may be required in here at a later date.
@@ -952,19 +2652,47 @@ def GenerateCMake(folder, params):
     file.write(")\n\n")
 
     # Selected libraries/features
-    if params["features"]:
+    # every requested library is linked explicitly, even if the SDK index says
+    # another one pulls it in, so the project doesn't depend on SDK internals
+    libs = list(dict.fromkeys(FeatureLibraries(FeaturesAndExamples(params))))
+    if len(libs) > 1:
         file.write("# Add any user requested libraries\n")
         file.write(f"target_link_libraries({projectName} \n")
-        for feat in params["features"]:
-            if feat in features_list:
-                file.write("        " + features_list[feat][LIB_NAME] + "\n")
-            if feat in picow_options_list:
-                file.write("        " + picow_options_list[feat][LIB_NAME] + "\n")
+        for lib in libs[1:]:
+            file.write("        " + lib + "\n")
         file.write("        )\n\n")
 
+    if params.get("wantPCH"):
+        file.write("# Precompile the SDK and feature headers the sources include\n")
+        file.write(
+            PrecompiledHeaders(
+                projectName,
+                ["stdio.h", "pico/stdlib.h"]
+                + [
+                    # the project's own headers, like benchmark.h, change with it
+                    header
+                    for header in FeatureHeaders(FeaturesAndExamples(params))
+                    if not (Path(folder) / header).exists()
+                ],
+            )
+        )
+
+    if params.get("wantUnityBuild"):
+        file.write(
+            "# Compile the project's sources in unity batches, add sources that\n"
+            "# don't build that way to PICO_VSCODE_UNITY_EXCLUDE\n"
+        )
+        file.write(
+            UnityBuild(
+                projectName,
+                params.get("unityBatchSize") or UNITY_BATCH_SIZE,
+                params.get("unityExclude") or (),
+            )
+        )
+
     file.write(f"pico_add_extra_outputs({projectName})\n\n")
 
-    file.close()
+    WriteFileIfChanged(filename, file.getvalue())
 
 
 # Generates the requested project files, if any
@@ -980,6 +2708,8 @@ def generateProjectFiles(
     cmakePath,
     openOCDVersion,
     useCmakeTools,
+    includePath=None,
+    rtt=False,
 ):
 
     oldCWD = os.getcwd()
@@ -988,379 +2718,438 @@ def generateProjectFiles(
 
     # Add a simple .gitignore file if there isn't one
     if not os.path.isfile(".gitignore"):
-        file = open(".gitignore", "w")
-        file.write("build\n")
-        file.write("!.vscode/*\n")
-        file.close()
+        WriteFileIfChanged(".gitignore", "build\n!.vscode/*\n")
 
-    debugger = debugger_config_list[debugger]
-
-    if debugger == "raspberrypi-swd.cfg":
-        shutil.copyfile(
+    if debugger_config_list[debugger] == "raspberrypi-swd.cfg":
+        CopySourceFile(
             sourcefolder + "/" + "raspberrypi-swd.cfg",
             projectPath / "raspberrypi-swd.cfg",
         )
 
-    # Need to escape windows files paths backslashes
-    # TODO: env in currently not supported in compilerPath var
-    # cPath = f"${{env:PICO_TOOLCHAIN_PATH_{envSuffix}}}" + os.path.sep + os.path.basename(str(compilerPath).replace('\\', '\\\\' ))
-    cPath = compilerPath.as_posix() + (".exe" if isWindows else "")
+    ctx = VscodeTemplateContext(
+        debugger,
+        sdkVersion,
+        toolchainVersion,
+        picotoolVersion,
+        ninjaPath,
+        cmakePath,
+        openOCDVersion,
+        useCmakeTools,
+        includePath,
+        rtt,
+    )
 
-    # if this is a path in the .pico-sdk homedir tell the settings to use the homevar
-    user_home = os.path.expanduser("~").replace("\\", "/")
-    use_home_var = f"{user_home}/.pico-sdk" in ninjaPath
+    for p in projects:
+        if p == "vscode":
+            # Create a build folder, and run our cmake project build from it
+            if not os.path.exists(VSCODE_FOLDER):
+                os.mkdir(VSCODE_FOLDER)
+
+            for filename, content in RenderVscodeFiles(ctx).items():
+                WriteFileIfChanged(os.path.join(VSCODE_FOLDER, filename), content)
+
+        else:
+            print("Unknown project type requested")
 
-    openocd_path = ""
-    server_path = '\n            "serverpath"'  # Because no \ in f-strings
+    os.chdir(oldCWD)
+
+
+def _openOCDExePath(user_home, openOCDVersion):
+    """Path of the installed openocd.exe in VS Code variable form, or "" if there is none"""
     openocd_path_os = Path(
         user_home,
         relativeOpenOCDPath(openOCDVersion).replace("/", "", 1),
         "openocd.exe",
     )
     if os.path.exists(openocd_path_os):
-        openocd_path = f"{codeOpenOCDPath(openOCDVersion)}/openocd.exe"
+        return f"{codeOpenOCDPath(openOCDVersion)}/openocd.exe"
+    return ""
 
-    for p in projects:
-        if p == "vscode":
-            launch = f"""{{
-    "version": "0.2.0",
-    "configurations": [
-        {{
-            "name": "Pico Debug (Cortex-Debug)",
-            "cwd": "{"${workspaceRoot}" if not openocd_path else f"{codeOpenOCDPath(openOCDVersion)}/scripts"}",
-            "executable": "${{command:raspberry-pi-pico.launchTargetPath}}",
-            "request": "launch",
-            "type": "cortex-debug",
-            "servertype": "openocd",\
-{f'{server_path}: "{openocd_path}",' if openocd_path else ""}
-            "gdbPath": "${{command:raspberry-pi-pico.getGDBPath}}",
+
+def VscodeTemplateContext(
+    debugger,
+    sdkVersion,
+    toolchainVersion,
+    picotoolVersion,
+    ninjaPath,
+    cmakePath,
+    openOCDVersion,
+    useCmakeTools,
+    includePath=None,
+    rtt=False,
+):
+    """Compute every value used by the .vscode templates once, see RenderVscodeFiles
+
+    includePath are the SDK include directories for c_cpp_properties.json, see
+    CodeIncludePath. Without them the whole SDK is included recursively. With
+    rtt the debug configurations show the RTT console.
+    """
+    # TODO: env in currently not supported in compilerPath var
+    # cPath = f"${{env:PICO_TOOLCHAIN_PATH_{envSuffix}}}" + os.path.sep + os.path.basename(str(compilerPath))
+    cPath = compilerPath.as_posix() + (".exe" if isWindows else "")
+
+    # if this is a path in the .pico-sdk homedir tell the settings to use the homevar
+    user_home = os.path.expanduser("~").replace("\\", "/")
+    use_home_var = f"{user_home}/.pico-sdk" in ninjaPath
+
+    def homeVar(path, var):
+        return path.replace(user_home, var) if use_home_var else path
+
+    return {
+        "debugger": debugger_config_list[debugger],
+        "sdkVersion": sdkVersion,
+        "compilerPath": cPath,
+        "useCmakeTools": useCmakeTools,
+        "rtt": rtt,
+        "codeSdkPath": codeSdkPath(sdkVersion),
+        "sdkIncludePath": includePath or [f"{codeSdkPath(sdkVersion)}/**"],
+        "codeOpenOCDPath": codeOpenOCDPath(openOCDVersion),
+        "openocdPath": _openOCDExePath(user_home, openOCDVersion),
+        "baseHeadersFolderName": (
+            "pico_base_headers"
+            if semver_compare_ge(sdkVersion, "2.0.0")
+            else "pico_base"
+        ),
+        "sdkPathWindows": propertiesSdkPath(sdkVersion, force_windows=True),
+        "sdkPath": propertiesSdkPath(sdkVersion, force_non_windows=True),
+        "toolchainPathWindows": propertiesToolchainPath(
+            toolchainVersion, force_windows=True
+        ),
+        "toolchainPath": propertiesToolchainPath(
+            toolchainVersion, force_non_windows=True
+        ),
+        "picotoolPathWindows": propertiesPicotoolPath(
+            picotoolVersion, force_windows=True
+        ),
+        "picotoolPath": propertiesPicotoolPath(
+            picotoolVersion, force_non_windows=True
+        ),
+        "cmakePathCode": homeVar(cmakePath, "${userHome}"),
+        "cmakePathSetting": homeVar(cmakePath, "${HOME}"),
+        "cmakeDirWindows": os.path.dirname(homeVar(cmakePath, "${env:USERPROFILE}")),
+        "cmakeDir": os.path.dirname(homeVar(cmakePath, "${env:HOME}")),
+        "ninjaPathCode": homeVar(ninjaPath, "${userHome}"),
+        "ninjaPathSetting": homeVar(ninjaPath, "${HOME}"),
+        "ninjaPathWindows": homeVar(ninjaPath, "${env:USERPROFILE}"),
+        "ninjaDirWindows": os.path.dirname(homeVar(ninjaPath, "${env:USERPROFILE}")),
+        "ninjaDir": os.path.dirname(homeVar(ninjaPath, "${env:HOME}")),
+    }
+
+
+def _launchTemplate(ctx):
+    svdFile = (
+        f"{ctx['codeSdkPath']}/src/${{command:raspberry-pi-pico.getChip}}"
+        "/hardware_regs/${command:raspberry-pi-pico.getChipUppercase}.svd"
+    )
+    # monitor reset init + load is a fix for no_flash binaries, where monitor reset halt
+    # doesn't do what is expected. Also works fine for flash binaries
+    overrideLaunchCommands = [
+        "monitor reset init",
+        'load "${command:raspberry-pi-pico.launchTargetPath}"',
+    ]
+
+    openocd = {
+        "name": "Pico Debug (Cortex-Debug)",
+        "cwd": (
+            f"{ctx['codeOpenOCDPath']}/scripts"
+            if ctx["openocdPath"]
+            else "${workspaceRoot}"
+        ),
+        "executable": "${command:raspberry-pi-pico.launchTargetPath}",
+        "request": "launch",
+        "type": "cortex-debug",
+        "servertype": "openocd",
+    }
+    if ctx["openocdPath"]:
+        openocd["serverpath"] = ctx["openocdPath"]
+    openocd.update(
+        {
+            "gdbPath": "${command:raspberry-pi-pico.getGDBPath}",
             "debuggerArgs": ["-ex", "set debug-file-directory /debug"],
-            "device": "${{command:raspberry-pi-pico.getChipUppercase}}",
+            "device": "${command:raspberry-pi-pico.getChipUppercase}",
             "configFiles": [
-                "{debugger}",
-                "target/${{command:raspberry-pi-pico.getTarget}}.cfg"
+                ctx["debugger"],
+                "target/${command:raspberry-pi-pico.getTarget}.cfg",
             ],
-            "svdFile": "{codeSdkPath(sdkVersion)}/src/${{command:raspberry-pi-pico.getChip}}/hardware_regs/${{command:raspberry-pi-pico.getChipUppercase}}.svd",
+            "svdFile": svdFile,
             "runToEntryPoint": "main",
-            // Fix for no_flash binaries, where monitor reset halt doesn't do what is expected
-            // Also works fine for flash binaries
-            "overrideLaunchCommands": [
-                "monitor reset init",
-                "load \\"${{command:raspberry-pi-pico.launchTargetPath}}\\""
-            ],
-            "openOCDLaunchCommands": [
-                "adapter speed 5000"
-            ]
-        }},
-        {{
-            "name": "Pico Debug (Cortex-Debug with external OpenOCD)",
-            "cwd": "${{workspaceRoot}}",
-            "executable": "${{command:raspberry-pi-pico.launchTargetPath}}",
-            "request": "launch",
-            "type": "cortex-debug",
-            "servertype": "external",
-            "gdbTarget": "localhost:3333",
-            "gdbPath": "${{command:raspberry-pi-pico.getGDBPath}}",
-            "debuggerArgs": ["-ex", "set debug-file-directory /debug"],
-            "device": "${{command:raspberry-pi-pico.getChipUppercase}}",
-            "svdFile": "{codeSdkPath(sdkVersion)}/src/${{command:raspberry-pi-pico.getChip}}/hardware_regs/${{command:raspberry-pi-pico.getChipUppercase}}.svd",
-            "runToEntryPoint": "main",
-            // Fix for no_flash binaries, where monitor reset halt doesn't do what is expected
-            // Also works fine for flash binaries
-            "overrideLaunchCommands": [
-                "monitor reset init",
-                "load \\"${{command:raspberry-pi-pico.launchTargetPath}}\\""
-            ]
-        }},
-    ]
-}}
-"""
+            "overrideLaunchCommands": overrideLaunchCommands,
+            "openOCDLaunchCommands": ["adapter speed 5000"],
+        }
+    )
 
-            base_headers_folder_name = (
-                "pico_base_headers"
-                if semver_compare_ge(sdkVersion, "2.0.0")
-                else "pico_base"
-            )
-            properties = f"""{{
-    "configurations": [
-        {{
+    external = {
+        "name": "Pico Debug (Cortex-Debug with external OpenOCD)",
+        "cwd": "${workspaceRoot}",
+        "executable": "${command:raspberry-pi-pico.launchTargetPath}",
+        "request": "launch",
+        "type": "cortex-debug",
+        "servertype": "external",
+        "gdbTarget": "localhost:3333",
+        "gdbPath": "${command:raspberry-pi-pico.getGDBPath}",
+        "debuggerArgs": ["-ex", "set debug-file-directory /debug"],
+        "device": "${command:raspberry-pi-pico.getChipUppercase}",
+        "svdFile": svdFile,
+        "runToEntryPoint": "main",
+        "overrideLaunchCommands": overrideLaunchCommands,
+    }
+
+    if ctx["rtt"]:
+        # stdio_rtt writes to channel 0, found through the _SEGGER_RTT symbol
+        rttConfig = {
+            "enabled": True,
+            "address": "auto",
+            "decoders": [{"label": "RTT", "port": 0, "type": "console"}],
+        }
+        openocd["rttConfig"] = rttConfig
+        external["rttConfig"] = rttConfig
+
+    return {"version": "0.2.0", "configurations": [openocd, external]}
+
+
+def _cCppPropertiesTemplate(ctx):
+    return {
+        "configurations": [
+            {
+                "name": "Pico",
+                "includePath": [
+                    "${workspaceFolder}/**",
+                    *ctx["sdkIncludePath"],
+                ],
+                "forcedInclude": [
+                    "${workspaceFolder}/build/generated/pico_base/pico/config_autogen.h",
+                    f"{ctx['codeSdkPath']}/src/common/{ctx['baseHeadersFolderName']}/include/pico.h",
+                ],
+                "defines": [],
+                "compilerPath": ctx["compilerPath"],
+                "compileCommands": "${workspaceFolder}/build/compile_commands.json",
+                "cStandard": "c17",
+                "cppStandard": "c++14",
+                "intelliSenseMode": "linux-gcc-arm",
+            }
+        ],
+        "version": 4,
+    }
+
+
+def _cmakeKitsTemplate(ctx):
+    return [
+        {
             "name": "Pico",
-            "includePath": [
-                "${{workspaceFolder}}/**",
-                "{codeSdkPath(sdkVersion)}/**"
-            ],
-            "forcedInclude": [
-                "${{workspaceFolder}}/build/generated/pico_base/pico/config_autogen.h",
-                "{codeSdkPath(sdkVersion)}/src/common/{base_headers_folder_name}/include/pico.h"
-            ],
-            "defines": [],
-            "compilerPath": "{cPath}",
-            "compileCommands": "${{workspaceFolder}}/build/compile_commands.json",
-            "cStandard": "c17",
-            "cppStandard": "c++14",
-            "intelliSenseMode": "linux-gcc-arm"
-        }}
-    ],
-    "version": 4
-}}
-"""
-
-            # kits
-            kits = f"""[
-    {{
-        "name": "Pico",
-        "compilers": {{
-            "C": "${{command:raspberry-pi-pico.getCompilerPath}}",
-            "CXX": "${{command:raspberry-pi-pico.getCxxCompilerPath}}"
-        }},
-        "environmentVariables": {{
-            "PATH": "${{command:raspberry-pi-pico.getEnvPath}};${{env:PATH}}"
-        }},
-        "cmakeSettings": {{
-            "Python3_EXECUTABLE": "${{command:raspberry-pi-pico.getPythonPath}}"
-        }}
-    }}
-]"""
-
-            # settings
-            settings = f'''{{
-    "cmake.showSystemKits": false,
-    "cmake.options.statusBarVisibility": "hidden",
-    "cmake.options.advanced": {{
-        "build": {{
-            "statusBarVisibility": "hidden"
-        }},
-        "launch": {{
-            "statusBarVisibility": "hidden"
-        }},
-        "debug": {{
-            "statusBarVisibility": "hidden"
-        }},
-        "variant": {{
-            "statusBarVisibility": "{"compact" if useCmakeTools else "hidden"}",
-        }},
-        "buildTarget": {{
-            "statusBarVisibility": "{"visible" if useCmakeTools else "hidden"}",
-        }}
-    }},
-    "cmake.configureOnEdit": {"true" if useCmakeTools else "false"},
-    "cmake.automaticReconfigure": {"true" if useCmakeTools else "false"},
-    "cmake.configureOnOpen": {"false"},
-    "cmake.generator": "Ninja",
-    "cmake.cmakePath": "{cmakePath.replace(user_home, "${userHome}") if use_home_var else cmakePath}",
-    "C_Cpp.debugShortcut": false,
-    "terminal.integrated.env.windows": {{
-        "PICO_SDK_PATH": "{propertiesSdkPath(sdkVersion, force_windows=True)}",
-        "PICO_TOOLCHAIN_PATH": "{propertiesToolchainPath(toolchainVersion, force_windows=True)}",
-        "Path": "\
-{propertiesToolchainPath(toolchainVersion, force_windows=True)}/bin;\
-{propertiesPicotoolPath(picotoolVersion, force_windows=True)}/picotool;\
-{os.path.dirname(cmakePath.replace(user_home, "${env:USERPROFILE}") if use_home_var else cmakePath)};\
-{os.path.dirname(ninjaPath.replace(user_home, "${env:USERPROFILE}") if use_home_var else ninjaPath)};\
-${{env:PATH}}"
-    }},
-    "terminal.integrated.env.osx": {{
-        "PICO_SDK_PATH": "{propertiesSdkPath(sdkVersion, force_non_windows=True)}",
-        "PICO_TOOLCHAIN_PATH": "{propertiesToolchainPath(toolchainVersion, force_non_windows=True)}",
-        "PATH": "\
-{propertiesToolchainPath(toolchainVersion, force_non_windows=True)}/bin:\
-{propertiesPicotoolPath(picotoolVersion, force_non_windows=True)}/picotool:\
-{os.path.dirname(cmakePath.replace(user_home, "${env:HOME}") if use_home_var else cmakePath)}:\
-{os.path.dirname(ninjaPath.replace(user_home, "${env:HOME}") if use_home_var else ninjaPath)}:\
-${{env:PATH}}"
-    }},
-    "terminal.integrated.env.linux": {{
-        "PICO_SDK_PATH": "{propertiesSdkPath(sdkVersion, force_non_windows=True)}",
-        "PICO_TOOLCHAIN_PATH": "{propertiesToolchainPath(toolchainVersion, force_non_windows=True)}",
-        "PATH": "\
-{propertiesToolchainPath(toolchainVersion, force_non_windows=True)}/bin:\
-{propertiesPicotoolPath(picotoolVersion, force_non_windows=True)}/picotool:\
-{os.path.dirname(cmakePath.replace(user_home, "${env:HOME}") if use_home_var else cmakePath)}:\
-{os.path.dirname(ninjaPath.replace(user_home, "${env:HOME}") if use_home_var else ninjaPath)}:\
-${{env:PATH}}"
-    }},
-    "raspberry-pi-pico.cmakeAutoConfigure": {"false" if useCmakeTools else "true"},
-    "raspberry-pi-pico.useCmakeTools": {"true" if useCmakeTools else "false"},
-    "raspberry-pi-pico.cmakePath": "{cmakePath.replace(user_home, "${HOME}") if use_home_var else cmakePath}",
-    "raspberry-pi-pico.ninjaPath": "{ninjaPath.replace(user_home, "${HOME}") if use_home_var else ninjaPath}"'''
-
-            settings += "\n}\n"
-
-            extensions = {
-                "recommendations": [
-                    "marus25.cortex-debug",
-                    "ms-vscode.cpptools",
-                    "ms-vscode.cpptools-extension-pack",
-                    "ms-vscode.vscode-serial-monitor",
-                    "raspberry-pi.raspberry-pi-pico",
+            "compilers": {
+                "C": "${command:raspberry-pi-pico.getCompilerPath}",
+                "CXX": "${command:raspberry-pi-pico.getCxxCompilerPath}",
+            },
+            "environmentVariables": {
+                "PATH": "${command:raspberry-pi-pico.getEnvPath};${env:PATH}"
+            },
+            "cmakeSettings": {
+                "Python3_EXECUTABLE": "${command:raspberry-pi-pico.getPythonPath}"
+            },
+        }
+    ]
+
+
+def _settingsTemplate(ctx):
+    useCmakeTools = bool(ctx["useCmakeTools"])
+
+    def terminalEnv(pathKey, windows, separator):
+        suffix = "Windows" if windows else ""
+        return {
+            "PICO_SDK_PATH": ctx["sdkPath" + suffix],
+            "PICO_TOOLCHAIN_PATH": ctx["toolchainPath" + suffix],
+            pathKey: separator.join(
+                [
+                    ctx["toolchainPath" + suffix] + "/bin",
+                    ctx["picotoolPath" + suffix] + "/picotool",
+                    ctx["cmakeDir" + suffix],
+                    ctx["ninjaDir" + suffix],
+                    "${env:PATH}",
                 ]
-            }
+            ),
+        }
+
+    return {
+        "cmake.showSystemKits": False,
+        "cmake.options.statusBarVisibility": "hidden",
+        "cmake.options.advanced": {
+            "build": {"statusBarVisibility": "hidden"},
+            "launch": {"statusBarVisibility": "hidden"},
+            "debug": {"statusBarVisibility": "hidden"},
+            "variant": {
+                "statusBarVisibility": "compact" if useCmakeTools else "hidden"
+            },
+            "buildTarget": {
+                "statusBarVisibility": "visible" if useCmakeTools else "hidden"
+            },
+        },
+        "cmake.configureOnEdit": useCmakeTools,
+        "cmake.automaticReconfigure": useCmakeTools,
+        "cmake.configureOnOpen": False,
+        "cmake.generator": "Ninja",
+        "cmake.cmakePath": ctx["cmakePathCode"],
+        "C_Cpp.debugShortcut": False,
+        "terminal.integrated.env.windows": terminalEnv("Path", True, ";"),
+        "terminal.integrated.env.osx": terminalEnv("PATH", False, ":"),
+        "terminal.integrated.env.linux": terminalEnv("PATH", False, ":"),
+        "raspberry-pi-pico.cmakeAutoConfigure": not useCmakeTools,
+        "raspberry-pi-pico.useCmakeTools": useCmakeTools,
+        "raspberry-pi-pico.cmakePath": ctx["cmakePathSetting"],
+        "raspberry-pi-pico.ninjaPath": ctx["ninjaPathSetting"],
+    }
 
-            # TODO: use get picotool path command!
-            tasks = f"""{{
-    "version": "2.0.0",
-    "tasks": [
-        {{
-            "label": "Compile Project",
-            "type": "process",
-            "isBuildCommand": true,
-            "command": "{ninjaPath.replace(user_home, "${userHome}") if use_home_var else ninjaPath}",
-            "args": ["-C", "${{workspaceFolder}}/build"],
-            "group": "build",
-            "presentation": {{
-                "reveal": "always",
-                "panel": "dedicated"
-            }},
-            "problemMatcher": "$gcc",
-            "windows": {{
-                "command": "{ninjaPath.replace(user_home, "${env:USERPROFILE}") if use_home_var else ninjaPath}.exe"
-            }}
-        }},
-        {{
-            "label": "Run Project",
-            "type": "process",
-            "command": "{propertiesPicotoolPath(picotoolVersion, force_non_windows=True)}/picotool/picotool",
-            "args": [
-                "load",
-                "${{command:raspberry-pi-pico.launchTargetPath}}",
-                "-fx"
-            ],
-            "presentation": {{
-                "reveal": "always",
-                "panel": "dedicated"
-            }},
-            "problemMatcher": [],
-            "windows": {{
-                "command": "{propertiesPicotoolPath(picotoolVersion, force_windows=True)}/picotool/picotool.exe"
-            }}
-        }},
-        {{
-            "label": "Flash",
-            "type": "process",
-            "command": "{openocd_path if openocd_path else "openocd"}",
-            "args": [
-                "-s",
-                "{codeOpenOCDPath(openOCDVersion)}/scripts",
-                "-f",
-                "{debugger}",
-                "-f",
-                "target/${{command:raspberry-pi-pico.getTarget}}.cfg",
-                "-c",
-                "adapter speed 5000; program \\"${{command:raspberry-pi-pico.launchTargetPath}}\\" verify reset exit"
-            ],
-            "problemMatcher": [],
-            "windows": {{
-                "command": "{openocd_path.replace("${userHome}", "${env:USERPROFILE}") if openocd_path else "openocd"}",
-            }}
-        }},
-        {{
-            "label": "Rescue Reset",
-            "type": "process",
-            "command": "{openocd_path if openocd_path else "openocd"}",
-            "args": [
-                "-s",
-                "{codeOpenOCDPath(openOCDVersion)}/scripts",
-                "-f",
-                "{debugger}",
-                "-f",
-                "target/${{command:raspberry-pi-pico.getChip}}-rescue.cfg",
-                "-c",
-                "adapter speed 5000; reset halt; exit"
-            ],
-            "problemMatcher": [],
-            "windows": {{
-                "command": "{openocd_path.replace("${userHome}", "${env:USERPROFILE}") if openocd_path else "openocd"}",
-            }}
-        }},
-        {{
-            "label": "RISC-V Reset (RP2350)",
+
+def _tasksTemplate(ctx):
+    openocd = ctx["openocdPath"] if ctx["openocdPath"] else "openocd"
+    openocdWindows = (
+        ctx["openocdPath"].replace("${userHome}", "${env:USERPROFILE}")
+        if ctx["openocdPath"]
+        else "openocd"
+    )
+
+    def openocdTask(label, args):
+        return {
+            "label": label,
             "type": "process",
-            "command": "{openocd_path if openocd_path else "openocd"}",
-            "args": [
-                "-s",
-                "{codeOpenOCDPath(openOCDVersion)}/scripts",
-                "-c",
-                "set USE_CORE {{ rv0 rv1 cm0 cm1 }}",
-                "-f",
-                "{debugger}",
-                "-f",
-                "target/rp2350.cfg",
-                "-c",
-                "adapter speed 5000; init;",
-                "-c",
-                "write_memory 0x40120158 8 {{ 0x3 }}; echo [format \\"Info : ARCHSEL 0x%02x\\" [read_memory 0x40120158 8 1]];",
-                "-c",
-                "reset halt; targets rp2350.rv0; echo [format \\"Info : ARCHSEL_STATUS 0x%02x\\" [read_memory 0x4012015C 8 1]]; exit"
-            ],
+            "command": openocd,
+            "args": ["-s", f"{ctx['codeOpenOCDPath']}/scripts"] + args,
             "problemMatcher": [],
-            "windows": {{
-                "command": "{openocd_path.replace("${userHome}", "${env:USERPROFILE}") if openocd_path else "openocd"}",
-            }}
-        }}
-    ]
-}}
-"""
+            "windows": {"command": openocdWindows},
+        }
+
+    # TODO: use get picotool path command!
+    return {
+        "version": "2.0.0",
+        "tasks": [
+            {
+                "label": "Compile Project",
+                "type": "process",
+                "isBuildCommand": True,
+                "command": ctx["ninjaPathCode"],
+                "args": ["-C", "${workspaceFolder}/build"],
+                "group": "build",
+                "presentation": {"reveal": "always", "panel": "dedicated"},
+                "problemMatcher": "$gcc",
+                "windows": {"command": ctx["ninjaPathWindows"] + ".exe"},
+            },
+            {
+                "label": "Run Project",
+                "type": "process",
+                "command": ctx["picotoolPath"] + "/picotool/picotool",
+                "args": [
+                    "load",
+                    "${command:raspberry-pi-pico.launchTargetPath}",
+                    "-fx",
+                ],
+                "presentation": {"reveal": "always", "panel": "dedicated"},
+                "problemMatcher": [],
+                "windows": {
+                    "command": ctx["picotoolPathWindows"] + "/picotool/picotool.exe"
+                },
+            },
+            openocdTask(
+                "Flash",
+                [
+                    "-f",
+                    ctx["debugger"],
+                    "-f",
+                    "target/${command:raspberry-pi-pico.getTarget}.cfg",
+                    "-c",
+                    'adapter speed 5000; program "${command:raspberry-pi-pico.launchTargetPath}" verify reset exit',
+                ],
+            ),
+            openocdTask(
+                "Rescue Reset",
+                [
+                    "-f",
+                    ctx["debugger"],
+                    "-f",
+                    "target/${command:raspberry-pi-pico.getChip}-rescue.cfg",
+                    "-c",
+                    "adapter speed 5000; reset halt; exit",
+                ],
+            ),
+            openocdTask(
+                "RISC-V Reset (RP2350)",
+                [
+                    "-c",
+                    "set USE_CORE { rv0 rv1 cm0 cm1 }",
+                    "-f",
+                    ctx["debugger"],
+                    "-f",
+                    "target/rp2350.cfg",
+                    "-c",
+                    "adapter speed 5000; init;",
+                    "-c",
+                    'write_memory 0x40120158 8 { 0x3 }; echo [format "Info : ARCHSEL 0x%02x" [read_memory 0x40120158 8 1]];',
+                    "-c",
+                    'reset halt; targets rp2350.rv0; echo [format "Info : ARCHSEL_STATUS 0x%02x" [read_memory 0x4012015C 8 1]]; exit',
+                ],
+            ),
+        ],
+    }
 
-            # Create a build folder, and run our cmake project build from it
-            if not os.path.exists(VSCODE_FOLDER):
-                os.mkdir(VSCODE_FOLDER)
 
-            os.chdir(VSCODE_FOLDER)
-
-            file = open(VSCODE_TASKS_FILENAME, "w")
-            file.write(tasks)
-            file.close()
-
-            filename = VSCODE_LAUNCH_FILENAME
-            file = open(filename, "w")
-            file.write(launch)
-            file.close()
-
-            file = open(VSCODE_C_PROPERTIES_FILENAME, "w")
-            file.write(properties)
-            file.close()
-
-            file = open(VSCODE_CMAKE_KITS_FILENAME, "w")
-            file.write(kits)
-            file.close()
-
-            file = open(VSCODE_SETTINGS_FILENAME, "w")
-            file.write(settings)
-            file.close()
-
-            # check if the extensions file exists and if not create it
-            # if exists get recommended extensions and append to extensions before writing
-            if os.path.exists(VSCODE_EXTENSIONS_FILENAME):
-                try:
-                    with open(VSCODE_EXTENSIONS_FILENAME, "r") as file:
-                        contents = file.read()
-                        old_extensions = json.loads(contents)
-                        if (
-                            "recommendations" in old_extensions
-                            and type(old_extensions["recommendations"]) == list
-                        ):
-                            print("old extensions", old_extensions)
-                            extensions["recommendations"] += old_extensions[
-                                "recommendations"
-                            ]
-                            extensions["recommendations"] = list(
-                                set(extensions["recommendations"])
-                            )
-                except OSError:
-                    # discard error and overwrite the file
-                    pass
-                except json.JSONDecodeError:
-                    # discard error and overwrite the file
-                    pass
+def _extensionsTemplate(ctx, old_extensions=None):
+    recommendations = [
+        "marus25.cortex-debug",
+        "ms-vscode.cpptools",
+        "ms-vscode.cpptools-extension-pack",
+        "ms-vscode.vscode-serial-monitor",
+        "raspberry-pi.raspberry-pi-pico",
+    ]
+    # Keep any recommendations already in the project, without duplicates
+    if old_extensions:
+        recommendations = list(dict.fromkeys(recommendations + old_extensions))
+    return {"recommendations": recommendations}
+
+
+def _readOldExtensions(filename):
+    """Recommended extensions of an existing extensions.json, or None if there are none"""
+    if not os.path.exists(filename):
+        return None
+    try:
+        with open(filename, "r") as file:
+            old_extensions = json.loads(file.read())
+    except (OSError, json.JSONDecodeError):
+        # discard error and overwrite the file
+        return None
+    if (
+        isinstance(old_extensions, dict)
+        and "recommendations" in old_extensions
+        and type(old_extensions["recommendations"]) == list
+    ):
+        print("old extensions", old_extensions)
+        return old_extensions["recommendations"]
+    return None
+
+
+# Structured templates for the .vscode files, each renders a context into JSON data
+vscode_templates = {
+    VSCODE_TASKS_FILENAME: _tasksTemplate,
+    VSCODE_LAUNCH_FILENAME: _launchTemplate,
+    VSCODE_C_PROPERTIES_FILENAME: _cCppPropertiesTemplate,
+    VSCODE_CMAKE_KITS_FILENAME: _cmakeKitsTemplate,
+    VSCODE_SETTINGS_FILENAME: _settingsTemplate,
+}
 
-            file = open(VSCODE_EXTENSIONS_FILENAME, "w")
-            file.write(json.dumps(extensions, indent=4))
-            file.close()
 
-        else:
-            print("Unknown project type requested")
+def RenderVscodeFiles(ctx, vscodeFolder=VSCODE_FOLDER):
+    """Render all .vscode files for a VscodeTemplateContext into memory, returns {filename: content}
 
-    os.chdir(oldCWD)
+    Existing recommendations in vscodeFolder's extensions.json are kept.
+    """
+    files = {
+        filename: json.dumps(template(ctx), indent=4) + "\n"
+        for filename, template in vscode_templates.items()
+    }
+    old_extensions = _readOldExtensions(
+        os.path.join(vscodeFolder, VSCODE_EXTENSIONS_FILENAME)
+    )
+    files[VSCODE_EXTENSIONS_FILENAME] = (
+        json.dumps(_extensionsTemplate(ctx, old_extensions), indent=4) + "\n"
+    )
+    return files
 
 
 def copyExampleConfigs(projectPath):
@@ -1369,7 +3158,7 @@ def copyExampleConfigs(projectPath):
         with open(lwipopts_path, "r") as f:
             if "lwipopts_examples_common.h" in f.read():
                 # Write lwipopts for examples
-                shutil.copy(
+                CopySourceFile(
                     os.path.join(sourcefolder, "lwipopts.h"),
                     os.path.join(projectPath, "lwipopts_examples_common.h"),
                 )
@@ -1379,7 +3168,7 @@ def copyExampleConfigs(projectPath):
         with open(mbedtls_config_path, "r") as f:
             if "mbedtls_config_examples_common.h" in f.read():
                 # Write mbedtls_config for examples
-                shutil.copy(
+                CopySourceFile(
                     os.path.join(sourcefolder, "mbedtls_config.h"),
                     os.path.join(projectPath, "mbedtls_config_examples_common.h"),
                 )
@@ -1389,18 +3178,66 @@ def copyExampleConfigs(projectPath):
         with open(btstack_config_path, "r") as f:
             if "btstack_config_common.h" in f.read():
                 # Write btstack_config for examples
-                shutil.copy(
+                CopySourceFile(
                     os.path.join(sourcefolder, "btstack_config.h"),
                     os.path.join(projectPath, "btstack_config_common.h"),
                 )
 
 
 def DoEverything(params):
+    """Generate or convert the project described by params, returning GenerateCMake's conversion result"""
     if not os.path.exists(params["projectRoot"]):
-        print("Invalid project path")
-        sys.exit(-1)
+        raise ProjectGenerationError("Invalid project path")
 
     oldCWD = os.getcwd()
+    try:
+        return _DoEverything(params)
+    finally:
+        os.chdir(oldCWD)
+
+
+def _DoEverything(params):
+    if params["configs"] and not params["wantConvert"]:
+        ValidateConfigs(params)
+
+    clock = SysClockSettings(params)
+    if clock and clock["overclocked"]:
+        print(
+            f"Warning: {clock['sysClockKhz']} kHz is above the {clock['nominalKhz']} kHz the {clock['chip']} is specified for"
+        )
+
+    PioStreamSettings(params)
+
+    RuntimeImplementations(params)
+
+    if params.get("wantRTT") and not semver_compare_ge(params["sdkVersion"], "2.0.0"):
+        raise ProjectGenerationError("RTT console output needs SDK 2.0.0 or later")
+
+    layout = MemoryLayoutSettings(params)
+    sdkLinkerScript = SdkLinkerScript(params) if layout and layout["linkerScript"] else None
+
+    if params["features"] and "picow_freertos" in params["features"]:
+        kernelPath = params.get("freertosKernelPath")
+        if not kernelPath:
+            raise ProjectGenerationError(
+                "Full lwIP needs the FreeRTOS kernel, pass its local path with --freertosKernelPath or set FREERTOS_KERNEL_PATH"
+            )
+        if not (Path(kernelPath) / "portable" / "ThirdParty" / "GCC").is_dir():
+            raise ProjectGenerationError(
+                f"{kernelPath} is not a FreeRTOS kernel with the Raspberry Pi ports"
+            )
+
+    if params.get("dmaStream") and params["dmaStream"] not in dma_stream_peripherals:
+        raise ProjectGenerationError(f"Can't stream with DMA to or from {params['dmaStream']}")
+
+    buildProfile = params.get("buildProfile") or "default"
+    if buildProfile not in build_profiles:
+        raise ProjectGenerationError(f"Unknown build profile {buildProfile}")
+    if buildProfile == "max-speed" and params["wantRunFromRAM"]:
+        raise ProjectGenerationError(
+            "The max-speed profile uses copy_to_ram, it can't be combined with running from RAM"
+        )
+
     os.chdir(params["projectRoot"])
 
     # Create our project folder as subfolder
@@ -1414,10 +3251,9 @@ def DoEverything(params):
     # If there is we abort unless the overwrite flag it set
     if os.path.exists(CMAKELIST_FILENAME):
         if not (params["wantOverwrite"] or params["wantConvert"]):
-            print(
+            raise ProjectGenerationError(
                 "There already appears to be a project in this folder. Use the --overwrite option to overwrite the existing project"
             )
-            sys.exit(-1)
 
         # We should really confirm the user wants to overwrite
         # print('Are you sure you want to overwrite the existing project files? (y/N)')
@@ -1427,7 +3263,7 @@ def DoEverything(params):
 
     # Copy the SDK finder cmake file to our project folder
     # Can be found here <PICO_SDK_PATH>/external/pico_sdk_import.cmake
-    shutil.copyfile(
+    CopySourceFile(
         os.path.join(
             params["userHome"] + relativeSDKPath(params["sdkVersion"]),
             "external",
@@ -1436,20 +3272,7 @@ def DoEverything(params):
         projectPath / "pico_sdk_import.cmake",
     )
 
-    if params["features"]:
-        features_and_examples = params["features"][:]
-    else:
-        features_and_examples = []
-
-    if params["wantExamples"]:
-        features_and_examples = (
-            list(stdlib_examples_list.keys()) + features_and_examples
-        )
-
-    if params["wantUARTExample"]:
-        # add uart to features_and_examples if not present
-        if "uart" not in features_and_examples:
-            features_and_examples.append("uart")
+    features_and_examples = FeaturesAndExamples(params)
 
     if not (params["wantConvert"]):
         GenerateMain(
@@ -1458,6 +3281,7 @@ def DoEverything(params):
             features_and_examples,
             params["wantCPP"],
             params["wantEntryProjName"],
+            OptionFragments(params),
         )
 
         # If we have any ancillary files, copy them to our project folder
@@ -1465,18 +3289,28 @@ def DoEverything(params):
         for feat in features_and_examples:
             if feat in features_list:
                 if features_list[feat][ANCILLARY_FILE] != "":
-                    shutil.copy(
+                    CopySourceFile(
                         sourcefolder + "/" + features_list[feat][ANCILLARY_FILE],
                         projectPath / features_list[feat][ANCILLARY_FILE],
                     )
             if feat in picow_options_list:
                 if picow_options_list[feat][ANCILLARY_FILE] != "":
-                    shutil.copy(
+                    CopySourceFile(
                         sourcefolder + "/" + picow_options_list[feat][ANCILLARY_FILE],
                         projectPath / picow_options_list[feat][ANCILLARY_FILE],
                     )
+            if feat in generator_option_features:
+                if generator_option_features[feat][ANCILLARY_FILE] != "":
+                    CopySourceFile(
+                        sourcefolder + "/" + generator_option_features[feat][ANCILLARY_FILE],
+                        projectPath / generator_option_features[feat][ANCILLARY_FILE],
+                    )
 
-    GenerateCMake(projectPath, params)
+        # Keep an existing linker script, it's there to be edited
+        if sdkLinkerScript and not (projectPath / PROJECT_LINKER_SCRIPT).exists():
+            CopySourceFile(sdkLinkerScript, projectPath / PROJECT_LINKER_SCRIPT)
+
+    conversion = GenerateCMake(projectPath, params)
 
     # Add examples common files if we are using examples
     if params["wantExample"]:
@@ -1489,15 +3323,25 @@ def DoEverything(params):
     os.chdir("build")
 
     # If we are overwriting a previous project, we should probably clear the folder, but that might delete something the users thinks is important, so
-    # for the moment, just delete the CMakeCache.txt file as certain changes may need that to be recreated.
-
+    # for the moment, just delete the CMakeCache.txt file if anything it caches changed, which is tracked by a fingerprint next to it.
+    # Otherwise keep it so the next configure is a fast incremental one.
+    fingerprint = CMakeFingerprint(params)
     if os.path.exists(CMAKECACHE_FILENAME):
-        os.remove(CMAKECACHE_FILENAME)
-
-    if not os.path.exists("compile_commands.json"):
+        oldFingerprint = None
+        if os.path.exists(CMAKE_FINGERPRINT_FILENAME):
+            with open(CMAKE_FINGERPRINT_FILENAME, "r") as f:
+                oldFingerprint = f.read().strip()
+        if oldFingerprint != fingerprint:
+            os.remove(CMAKECACHE_FILENAME)
+
+    WriteFileIfChanged(CMAKE_FINGERPRINT_FILENAME, fingerprint + "\n")
+
+    if not params["wantConvert"] and not os.path.exists(CMAKECACHE_FILENAME):
+        # Not configured yet, so give IntelliSense a compile command for the entry point
+        SynthesizeCompileCommands(projectPath, params, features_and_examples)
+    elif not os.path.exists("compile_commands.json"):
         # Create empty compile_commands.json to prevent intellisense warning
-        with open("compile_commands.json", "w") as f:
-            f.write("[]\n")
+        WriteFileIfChanged("compile_commands.json", "[]\n")
 
     if params["projects"]:
         generateProjectFiles(
@@ -1512,48 +3356,22 @@ def DoEverything(params):
             params["cmakePath"],
             params["openOCDVersion"],
             params["useCmakeTools"],
+            (
+                CodeIncludePath(params, features_and_examples)
+                if not params["wantConvert"]
+                else None
+            ),
+            params.get("wantRTT"),
         )
 
-    os.chdir(oldCWD)
-
-
-###################################################################################
-# main execution starteth here
-
-if __name__ == "__main__":
-    args = ParseCommandLine()
-
-    if args.nouart:
-        args.uart = False
-
-    if args.debugger > len(debugger_list) - 1:
-        args.debugger = 0
-
-    if "RISCV" in args.toolchainVersion:
-        if "COREV" in args.toolchainVersion:
-            COMPILER_TRIPLE = COREV_TRIPLE
-        else:
-            COMPILER_TRIPLE = RISCV_TRIPLE
-
-    # Populate isMac, isWindows, isx86 variables
-    CheckSystemType()
+    return conversion
 
-    if args.name == None:
-        print("No project name specified\n")
-        sys.exit(-1)
-
-    # Check if we were provided a compiler path, and override the default if so
-    if args.toolchainVersion:
-        compilerPath = Path(
-            codeToolchainPath(args.toolchainVersion) + "/bin/" + COMPILER_NAME()
-        )
-    else:
-        print("No toolchain version specified\n")
-        sys.exit(-1)
 
+def ParamsFromArgs(args):
+    """Create the params dict used by DoEverything from parsed command line arguments"""
     projectRoot = Path(os.getcwd()) if not args.projectRoot else Path(args.projectRoot)
 
-    params = {
+    return {
         "projectRoot": projectRoot,
         "userHome": args.userHome,
         "projectName": args.name,
@@ -1571,6 +3389,7 @@ if __name__ == "__main__":
         "wantUARTExample": args.uartExample,
         "wantUART": args.uart,
         "wantUSB": args.usb,
+        "wantRTT": args.rtt,
         "wantCPP": args.cpp,
         "debugger": args.debugger,
         "exceptions": args.cppexceptions,
@@ -1585,7 +3404,339 @@ if __name__ == "__main__":
         "openOCDVersion": args.openOCDVersion,
         "exampleLibs": args.exampleLibs if args.exampleLibs is not None else [],
         "useCmakeTools": args.useCmakeTools,
+        "sysClockKhz": args.sysClockKhz,
+        "multicoreInRam": args.multicoreInRam,
+        "dmaStream": args.dmaStream,
+        "pioStreamBitRate": args.pioStreamBitRate,
+        "freertosKernelPath": args.freertosKernelPath,
+        "floatImplementation": args.floatImplementation,
+        "doubleImplementation": args.doubleImplementation,
+        "dividerImplementation": args.dividerImplementation,
+        "printfImplementation": args.printfImplementation,
+        "hotCodePlacement": args.hotCodePlacement,
+        "hotDataPlacement": args.hotDataPlacement,
+        "stackSize": args.stackSize,
+        "core1StackSize": args.core1StackSize,
+        "linkerScript": args.linkerScript,
+        "buildProfile": args.buildProfile,
+        "wantPCH": args.precompiledHeaders,
+        "wantUnityBuild": args.unityBuild,
+        "unityBatchSize": args.unityBatchSize,
+        "unityExclude": args.unityExclude if args.unityExclude is not None else [],
     }
 
-    DoEverything(params)
+
+def LoadBatchManifest(manifestPath, defaults):
+    """Read a batch manifest and return the params for each project in it
+
+    The manifest is either a list of project entries, or an object with a
+    "projects" list and optional "defaults". Each entry uses the keys of the
+    params dict and overrides the manifest defaults, which in turn override
+    the command line defaults.
+    """
+    with open(manifestPath, "r") as f:
+        manifest = json.load(f)
+
+    if isinstance(manifest, list):
+        manifest = {"projects": manifest}
+
+    batchDefaults = {**defaults, **manifest.get("defaults", {})}
+    return [ParamsFromDict(entry, batchDefaults) for entry in manifest.get("projects", [])]
+
+
+def ParamsFromDict(entry, defaults):
+    """Create a params dict from a (JSON) dict of params keys on top of defaults"""
+    params = {**defaults, **entry}
+    params["projectRoot"] = Path(params["projectRoot"])
+    if params["exampleLibs"] is None:
+        params["exampleLibs"] = []
+    return params
+
+
+def GenerateProject(params):
+    """Run DoEverything for params and return a result dict instead of exiting on failure
+
+    Anything the generator prints is captured in the result's "output".
+    """
+    result = {
+        "projectName": params.get("projectName"),
+        "projectPath": None,
+        "success": False,
+        "error": None,
+        "conversion": None,
+        "output": "",
+        "elapsed": 0.0,
+    }
+    start = time.perf_counter()
+    output = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(output):
+            if not params.get("projectName"):
+                raise ProjectGenerationError("No project name specified")
+            if not params.get("toolchainVersion"):
+                raise ProjectGenerationError("No toolchain version specified")
+            SetToolchain(params["toolchainVersion"])
+            result["conversion"] = DoEverything(params)
+        result["projectPath"] = str(Path(params["projectRoot"]) / params["projectName"])
+        result["success"] = True
+    except ProjectGenerationError as e:
+        result["error"] = str(e)
+    except Exception as e:
+        # one broken entry mustn't stop the rest of the batch
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["output"] = output.getvalue()
+    result["elapsed"] = time.perf_counter() - start
+    return result
+
+
+def DoBatch(batch):
+    """Generate every project in batch within this process, returning one result dict per project"""
+    return [GenerateProject(params) for params in batch]
+
+
+def FindConvertibleProjects(root):
+    """Folders under root with a CMakeLists.txt that pulls in the Pico SDK
+
+    Subfolders of a project, build folders and hidden folders are not searched.
+    """
+    projects = []
+    for folder, dirs, files in os.walk(root):
+        dirs[:] = sorted(
+            d for d in dirs if not d.startswith(".") and d not in ("build", "node_modules")
+        )
+        if CMAKELIST_FILENAME not in files:
+            continue
+        try:
+            with open(os.path.join(folder, CMAKELIST_FILENAME), "r", errors="replace") as f:
+                content = f.read()
+        except OSError:
+            continue
+        if "pico_sdk_import.cmake" in content or "pico_sdk_init()" in content:
+            projects.append(Path(folder))
+            dirs[:] = []
+    return projects
+
+
+def ConvertAll(root, defaults, jobs=None):
+    """Convert every project under root, returning (params, result dict) per project
+
+    Generation changes the working directory, so projects are converted in
+    parallel worker processes rather than threads.
+    """
+    batch = [
+        ParamsFromDict(
+            {
+                "projectRoot": project.parent,
+                "projectName": project.name,
+                "wantConvert": True,
+                "wantExample": False,
+                "wantOverwrite": False,
+            },
+            defaults,
+        )
+        for project in FindConvertibleProjects(root)
+    ]
+    if not batch:
+        return []
+
+    # only needed here, so keep it out of the startup time
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(jobs, initializer=CheckSystemType) as pool:
+        return list(zip(batch, pool.map(GenerateProject, batch)))
+
+
+def ConvertAllReport(converted):
+    """Summary of ConvertAll's results, listing the projects that failed"""
+    counts = dict.fromkeys(
+        [CONVERT_CONVERTED, CONVERT_ALREADY_CONVERTED, CONVERT_HEADER_UPGRADED, "failed"],
+        0,
+    )
+    report = ""
+    for params, result in converted:
+        if result["success"]:
+            counts[result["conversion"]] += 1
+        else:
+            counts["failed"] += 1
+            report += f"Failed: {params['projectRoot'] / params['projectName']}: {result['error']}\n"
+
+    report += f"{len(converted)} projects: " + ", ".join(
+        f"{count} {status}" for status, count in counts.items()
+    )
+    return report
+
+
+def _RunCaptured(fn, *args):
+    """Call fn, returning what it printed and how long it took - the working directory is always restored"""
+    oldCWD = os.getcwd()
+    output = io.StringIO()
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(output):
+            fn(*args)
+    finally:
+        os.chdir(oldCWD)
+    return {"output": output.getvalue(), "elapsed": time.perf_counter() - start}
+
+
+def _ServerGenerateCMake(params):
+    SetToolchain(params["toolchainVersion"])
+    folder = params["projectRoot"] / params["projectName"]
+    return _RunCaptured(GenerateCMake, folder, params)
+
+
+def _ServerGenerateProjectFiles(params):
+    SetToolchain(params["toolchainVersion"])
+    return _RunCaptured(
+        generateProjectFiles,
+        params["projectRoot"] / params["projectName"],
+        params["projectName"],
+        params["projects"],
+        params["debugger"],
+        params["sdkVersion"],
+        params["toolchainVersion"],
+        params["picotoolVersion"],
+        params["ninjaPath"],
+        params["cmakePath"],
+        params["openOCDVersion"],
+        params["useCmakeTools"],
+        (
+            CodeIncludePath(params, FeaturesAndExamples(params))
+            if not params["wantConvert"]
+            else None
+        ),
+        params.get("wantRTT"),
+    )
+
+
+# JSON-RPC methods of the generator server, each taking a params dict
+server_methods = {
+    "doEverything": GenerateProject,
+    "generateCMake": _ServerGenerateCMake,
+    "generateProjectFiles": _ServerGenerateProjectFiles,
+}
+
+JSONRPC_PARSE_ERROR = -32700
+JSONRPC_INVALID_REQUEST = -32600
+JSONRPC_METHOD_NOT_FOUND = -32601
+JSONRPC_SERVER_ERROR = -32000
+
+
+def RunServer(defaults, requests=sys.stdin, responses=sys.stdout):
+    """Serve JSON-RPC 2.0 requests, one JSON object per line, until stdin closes or "shutdown" is called
+
+    Request params are params dict keys on top of defaults (the command line
+    options). Results carry the captured generator output and the elapsed
+    time in seconds. Notifications, requests without an id, get no response,
+    except for ones that can't be parsed, which are answered with a null id.
+    """
+
+    def respond(requestId, result=None, error=None):
+        response = {"jsonrpc": "2.0", "id": requestId}
+        if error is not None:
+            response["error"] = error
+        else:
+            response["result"] = result
+        responses.write(json.dumps(response) + "\n")
+        responses.flush()
+
+    for line in requests:
+        if not line.strip():
+            continue
+
+        try:
+            request = json.loads(line)
+        except json.JSONDecodeError as e:
+            respond(None, error={"code": JSONRPC_PARSE_ERROR, "message": str(e)})
+            continue
+
+        if not isinstance(request, dict) or "method" not in request:
+            respond(
+                None,
+                error={"code": JSONRPC_INVALID_REQUEST, "message": "Invalid request"},
+            )
+            continue
+
+        requestId = request.get("id")
+        isNotification = "id" not in request
+        method = request["method"]
+        if method == "shutdown":
+            if not isNotification:
+                respond(requestId, result=None)
+            break
+        if method not in server_methods:
+            if not isNotification:
+                respond(
+                    requestId,
+                    error={
+                        "code": JSONRPC_METHOD_NOT_FOUND,
+                        "message": f"Unknown method {method}",
+                    },
+                )
+            continue
+
+        try:
+            params = ParamsFromDict(request.get("params") or {}, defaults)
+            result = server_methods[method](params)
+        except Exception as e:
+            # a failing request mustn't take the server down with it
+            if not isNotification:
+                respond(
+                    requestId,
+                    error={
+                        "code": JSONRPC_SERVER_ERROR,
+                        "message": f"{type(e).__name__}: {e}",
+                    },
+                )
+            continue
+
+        if not isNotification:
+            respond(requestId, result=result)
+
+
+###################################################################################
+# main execution starteth here
+
+if __name__ == "__main__":
+    args = ParseCommandLine()
+
+    if args.nouart:
+        args.uart = False
+
+    if args.debugger > len(debugger_list) - 1:
+        args.debugger = 0
+
+    # Populate isMac, isWindows, isx86 variables
+    CheckSystemType()
+
+    if args.server:
+        RunServer(ParamsFromArgs(args))
+        sys.exit(0)
+
+    if args.batch:
+        results = DoBatch(LoadBatchManifest(args.batch, ParamsFromArgs(args)))
+        print(json.dumps(results, indent=4))
+        sys.exit(0 if all(r["success"] for r in results) else -1)
+
+    if args.convertAll:
+        converted = ConvertAll(args.convertAll, ParamsFromArgs(args), args.jobs)
+        print(ConvertAllReport(converted))
+        sys.exit(0 if all(result["success"] for _, result in converted) else -1)
+
+    if args.name == None:
+        print("No project name specified\n")
+        sys.exit(-1)
+
+    # Check if we were provided a compiler path, and override the default if so
+    if args.toolchainVersion:
+        SetToolchain(args.toolchainVersion)
+    else:
+        print("No toolchain version specified\n")
+        sys.exit(-1)
+
+    try:
+        DoEverything(ParamsFromArgs(args))
+    except ProjectGenerationError as e:
+        print(e)
+        sys.exit(-1)
     sys.exit(0)
@@ -0,0 +1,494 @@
+#!/usr/bin/env python3
+
+#
+# Copyright (c) 2020-2024 Raspberry Pi (Trading) Ltd.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+#
+
+"""Index of the libraries defined by an installed Pico SDK
+
+Scans the CMakeLists.txt files of the SDK's src/ tree (in parallel) for the
+interface libraries it defines, and records the include directories, source
+files and link dependencies of each hardware_*/pico_* library. The index is
+built once per SDK version when the extension installs it and saved under
+~/.pico-sdk, so the project generator can compute include paths and link
+lists without scanning.
+
+All paths in the index are relative to the SDK root and use forward slashes.
+"""
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+# Bump when the index format or the scanner changes, so older indexes get rebuilt
+INDEX_VERSION = 1
+
+# Folders of src/ that are scanned, libraries from the chip folders are stored per chip
+COMMON_FOLDERS = ("common", "rp2_common")
+CHIP_FOLDERS = ("rp2040", "rp2350")
+
+# Where the SDK's path variables point by default, relative to the SDK root
+path_variables = {
+    "PICO_SDK_PATH": "",
+    "PICO_CYW43_DRIVER_PATH": "lib/cyw43-driver",
+    "PICO_LWIP_PATH": "lib/lwip",
+    "PICO_TINYUSB_PATH": "lib/tinyusb",
+    "PICO_BTSTACK_PATH": "lib/btstack",
+    "PICO_MBEDTLS_PATH": "lib/mbedtls",
+}
+
+# SDK helpers that define a library named after their first argument
+library_commands = ("pico_add_library", "pico_add_impl_library")
+
+# SDK helpers for the simple hardware_<name> libraries, which have an include
+# folder, an optional <name>.c and depend on the chip's register definitions
+simple_hardware_commands = {
+    "pico_simple_hardware_target": True,
+    "pico_simple_hardware_impl_target": True,
+    "pico_simple_hardware_headers_target": False,
+    "pico_simple_hardware_headers_only_target": False,
+}
+simple_hardware_deps = ["pico_base", "hardware_structs", "hardware_regs"]
+
+SCOPE_KEYWORDS = {"INTERFACE", "PUBLIC", "PRIVATE", "SYSTEM", "BEFORE", "AFTER"}
+
+_command_re = re.compile(r"([A-Za-z_][A-Za-z0-9_]*)\s*\(")
+_argument_re = re.compile(r'"(?:[^"\\]|\\.)*"|[^\s"]+')
+_variable_re = re.compile(r"\$\{([A-Za-z0-9_]+)\}")
+
+
+def IndexPath(userHome, sdkVersion):
+    return Path(userHome, ".pico-sdk", "cmake", "sdk-index", f"{sdkVersion}.json")
+
+
+def _StripComments(text):
+    """Remove # comments, keeping # inside quoted arguments"""
+    return re.sub(r'("(?:[^"\\]|\\.)*")|#[^\n]*', lambda m: m.group(1) or "", text)
+
+
+def ParseCommands(text):
+    """Return the (name, arguments) of every command in a CMake file, in order"""
+    text = _StripComments(text)
+    commands = []
+    pos = 0
+    while True:
+        match = _command_re.search(text, pos)
+        if match is None:
+            break
+        # arguments run up to the matching closing parenthesis
+        depth = 1
+        end = match.end()
+        while end < len(text) and depth:
+            if text[end] == "(":
+                depth += 1
+            elif text[end] == ")":
+                depth -= 1
+            end += 1
+        arguments = [
+            a[1:-1] if a.startswith('"') else a
+            for a in _argument_re.findall(text[match.end() : end - 1])
+        ]
+        commands.append((match.group(1).lower(), arguments))
+        pos = end
+    return commands
+
+
+def _BaseName(target):
+    """Fold the <lib>_headers targets into <lib>, they are one library for our purposes"""
+    return target[: -len("_headers")] if target.endswith("_headers") else target
+
+
+def ScanCMakeLists(sdkPath, cmakeListsPath):
+    """Collect the libraries defined by one CMakeLists.txt of the SDK
+
+    Only what can be resolved statically is recorded: arguments using unknown
+    variables or generator expressions are skipped. Dependencies added inside
+    if() blocks are kept apart as optional, they depend on the configuration.
+    """
+    listDir = Path(cmakeListsPath).parent.relative_to(sdkPath).as_posix()
+    variables = dict(path_variables)
+    variables["CMAKE_CURRENT_LIST_DIR"] = listDir
+    variables["CMAKE_CURRENT_SOURCE_DIR"] = listDir
+
+    def resolve(argument):
+        value = _variable_re.sub(
+            lambda m: variables.get(m.group(1), "\0"), argument
+        )
+        if "\0" in value or "$<" in value or "${" in value:
+            return None
+        return value.lstrip("/")
+
+    libraries = {}
+
+    def library(name):
+        return libraries.setdefault(
+            _BaseName(name),
+            {"dir": listDir, "includeDirs": [], "sources": [], "deps": [], "optionalDeps": []},
+        )
+
+    def add(values, items):
+        for item in items:
+            if item not in values:
+                values.append(item)
+
+    with open(cmakeListsPath, "r", encoding="utf-8", errors="replace") as f:
+        commands = ParseCommands(f.read())
+
+    # one entry per enclosing if(), True unless it is just an include guard
+    conditions = []
+    inDefinition = 0
+    for name, arguments in commands:
+        if name in ("function", "macro"):
+            inDefinition += 1
+        elif name in ("endfunction", "endmacro"):
+            inDefinition -= 1
+        if inDefinition:
+            continue
+
+        conditional = any(conditions)
+        if name == "if":
+            conditions.append(arguments[:2] != ["NOT", "TARGET"])
+        elif name == "endif" and conditions:
+            conditions.pop()
+        elif name == "set" and len(arguments) >= 2 and not conditional:
+            value = resolve(arguments[1])
+            if value is not None:
+                variables[arguments[0]] = value
+        elif name in library_commands and arguments:
+            library(arguments[0])
+        elif name == "add_library" and "INTERFACE" in arguments[1:2]:
+            library(arguments[0])
+        elif name in simple_hardware_commands and arguments:
+            lib = library(f"hardware_{arguments[0]}")
+            add(lib["includeDirs"], [f"{listDir}/include"])
+            add(lib["deps"], simple_hardware_deps)
+            if simple_hardware_commands[name]:
+                add(lib["sources"], [f"{listDir}/{arguments[0]}.c"])
+        elif name in (
+            "target_include_directories",
+            "target_sources",
+            "target_link_libraries",
+            "pico_mirrored_target_link_libraries",
+        ) and arguments:
+            lib = library(arguments[0])
+            values = [
+                value
+                for value in map(resolve, arguments[1:])
+                if value and value not in SCOPE_KEYWORDS
+            ]
+            if name == "target_include_directories":
+                add(lib["includeDirs"], values)
+            elif name == "target_sources":
+                add(lib["sources"], values)
+            else:
+                deps = [_BaseName(dep) for dep in values if dep != _BaseName(arguments[0])]
+                add(lib["optionalDeps" if conditional else "deps"], deps)
+
+    return libraries
+
+
+def _ScanJob(job):
+    sdkPath, cmakeListsPath = job
+    return cmakeListsPath, ScanCMakeLists(sdkPath, cmakeListsPath)
+
+
+def FindCMakeLists(sdkPath):
+    """All scanned CMakeLists.txt files, with the src/ folder they belong to"""
+    found = []
+    for folder in COMMON_FOLDERS + CHIP_FOLDERS:
+        for root, dirs, files in os.walk(Path(sdkPath, "src", folder)):
+            dirs.sort()
+            if "CMakeLists.txt" in files:
+                found.append((folder, os.path.join(root, "CMakeLists.txt")))
+    return found
+
+
+def Signature(found):
+    """Changes when a scanned file is added, removed or modified (e.g. a develop SDK is updated)"""
+    return [len(found), max((os.path.getmtime(p) for _, p in found), default=0)]
+
+
+def BuildIndex(sdkPath, sdkVersion, processes=None):
+    """Scan the SDK at sdkPath and return its index"""
+    found = FindCMakeLists(sdkPath)
+    folders = {path: folder for folder, path in found}
+    jobs = [(os.fspath(sdkPath), path) for _, path in found]
+
+    index = {
+        "indexVersion": INDEX_VERSION,
+        "sdkVersion": sdkVersion,
+        "signature": Signature(found),
+        "libraries": {},
+        "chipLibraries": {chip: {} for chip in CHIP_FOLDERS},
+    }
+    if not jobs:
+        return index
+
+    with ProcessPoolExecutor(processes) as pool:
+        results = dict(pool.map(_ScanJob, jobs, chunksize=16))
+
+    # merge in walk order, so the index doesn't depend on which process was fastest
+    for folder, path in found:
+        target = (
+            index["chipLibraries"][folder]
+            if folder in CHIP_FOLDERS
+            else index["libraries"]
+        )
+        for name, lib in results[path].items():
+            if name in target:
+                for key in ("includeDirs", "sources", "deps", "optionalDeps"):
+                    target[name][key] += [
+                        v for v in lib[key] if v not in target[name][key]
+                    ]
+            else:
+                target[name] = lib
+    return index
+
+
+def ReadIndex(userHome, sdkVersion):
+    """The saved index of SDK sdkVersion, or None if there is none in the current format
+
+    Unlike LoadIndex this never scans the SDK, not even to check that the
+    index is up to date.
+    """
+    try:
+        with open(IndexPath(userHome, sdkVersion), "r") as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return index if index.get("indexVersion") == INDEX_VERSION else None
+
+
+def LoadIndex(userHome, sdkVersion, rebuild=False):
+    """Index of the installed SDK sdkVersion, building and saving it if needed
+
+    Returns None if the SDK isn't installed.
+    """
+    sdkPath = Path(userHome, ".pico-sdk", "sdk", sdkVersion)
+    if not Path(sdkPath, "src").is_dir():
+        return None
+
+    indexPath = IndexPath(userHome, sdkVersion)
+    if not rebuild:
+        try:
+            with open(indexPath, "r") as f:
+                index = json.load(f)
+            if index.get("indexVersion") == INDEX_VERSION and index.get(
+                "signature"
+            ) == Signature(FindCMakeLists(sdkPath)):
+                return index
+        except (OSError, ValueError):
+            pass
+
+    index = BuildIndex(sdkPath, sdkVersion)
+    os.makedirs(indexPath.parent, exist_ok=True)
+    tmpPath = f"{indexPath}.{os.getpid()}.tmp"
+    with open(tmpPath, "w") as f:
+        json.dump(index, f, indent=1, sort_keys=True)
+    os.replace(tmpPath, indexPath)
+    return index
+
+
+def Libraries(index, chip):
+    """All libraries available for chip, the chip's own definitions win"""
+    libraries = dict(index["libraries"])
+    libraries.update(index["chipLibraries"].get(chip, {}))
+    return libraries
+
+
+def Closure(index, chip, libs, optional=True):
+    """libs and everything they link, in breadth first order
+
+    With optional=False, dependencies that only apply to some configurations
+    are not followed.
+    """
+    libraries = Libraries(index, chip)
+    closure = []
+    queue = [_BaseName(lib) for lib in libs]
+    while queue:
+        lib = queue.pop(0)
+        if lib in closure:
+            continue
+        closure.append(lib)
+        if lib in libraries:
+            queue += libraries[lib]["deps"]
+            if optional:
+                queue += libraries[lib]["optionalDeps"]
+    return closure
+
+
+def IncludeDirs(index, chip, libs):
+    """Include directories, relative to the SDK root, of libs and everything they link"""
+    libraries = Libraries(index, chip)
+    includeDirs = []
+    for lib in Closure(index, chip, libs):
+        for includeDir in libraries.get(lib, {}).get("includeDirs", []):
+            if includeDir not in includeDirs:
+                includeDirs.append(includeDir)
+    return includeDirs
+
+
+def MinimalLinkLibraries(index, chip, libs):
+    """libs without the ones another of libs always links anyway
+
+    Unknown libraries are kept, so this is safe with an incomplete index.
+    """
+    minimal = list(libs)
+    for lib in libs:
+        # one at a time, so of libraries linking each other one is kept
+        others = [other for other in minimal if other != lib]
+        if lib in Closure(index, chip, others, optional=False):
+            minimal.remove(lib)
+    return minimal
+
+
+# Board configured for each chip when checking against CMake, wireless so the
+# cyw43 libraries are defined too
+check_boards = {"rp2040": "pico_w", "rp2350": "pico2_w"}
+
+_check_line_re = re.compile(r"pico_sdk_index_check (\S+) (.*)$")
+_generator_expression_re = re.compile(r"\$<")
+
+
+def _CMakeDeps(value):
+    """(unconditional, conditional) base names of an INTERFACE_LINK_LIBRARIES value"""
+    unconditional, conditional = set(), set()
+    if value.endswith("-NOTFOUND"):
+        return unconditional, conditional
+    for item in value.split(";"):
+        if not item:
+            continue
+        if _generator_expression_re.search(item):
+            # $<...:lib> only links lib in some configurations
+            name = re.sub(r"[$<>]", "", item.split(":")[-1])
+            if name:
+                conditional.add(_BaseName(name))
+        else:
+            unconditional.add(_BaseName(item))
+    return unconditional, conditional
+
+
+def CheckAgainstCMake(index, chip, sdkPath, cmake="cmake", toolchainPath=None):
+    """Compare the indexed dependencies for chip with what the SDK's CMake really sets up
+
+    Configures a throwaway project with the SDK at sdkPath, which needs a
+    working toolchain, and reads back INTERFACE_LINK_LIBRARIES of every indexed
+    library. Returns a list of problems, empty if the index matches:
+    dependencies CMake has that the index misses, and ones the index takes as
+    unconditional that CMake only links conditionally or not at all.
+    """
+    libraries = Libraries(index, chip)
+    names = sorted(libraries)
+    with tempfile.TemporaryDirectory() as folder:
+        Path(folder, "CMakeLists.txt").write_text(
+            "cmake_minimum_required(VERSION 3.13)\n"
+            "include(${PICO_SDK_PATH}/external/pico_sdk_import.cmake)\n"
+            "project(pico_sdk_index_check C CXX ASM)\n"
+            "pico_sdk_init()\n"
+            f"foreach(lib IN ITEMS {' '.join(names)})\n"
+            "    foreach(target ${lib} ${lib}_headers)\n"
+            "        if (TARGET ${target})\n"
+            "            get_target_property(deps ${target} INTERFACE_LINK_LIBRARIES)\n"
+            '            message(STATUS "pico_sdk_index_check ${lib} ${deps}")\n'
+            "        endif()\n"
+            "    endforeach()\n"
+            "endforeach()\n"
+        )
+        command = [
+            cmake,
+            "-S",
+            folder,
+            "-B",
+            Path(folder, "build").as_posix(),
+            f"-DPICO_SDK_PATH={Path(sdkPath).as_posix()}",
+            f"-DPICO_BOARD={check_boards[chip]}",
+        ]
+        if toolchainPath:
+            command.append(f"-DPICO_TOOLCHAIN_PATH={Path(toolchainPath).as_posix()}")
+        result = subprocess.run(command, capture_output=True, text=True)
+    if result.returncode != 0:
+        return [f"CMake failed:\n{result.stdout}{result.stderr}"]
+
+    unconditional, conditional = {}, {}
+    for line in result.stdout.splitlines():
+        match = _check_line_re.search(line)
+        if match is None:
+            continue
+        deps, optionalDeps = _CMakeDeps(match.group(2))
+        unconditional.setdefault(match.group(1), set()).update(deps)
+        conditional.setdefault(match.group(1), set()).update(optionalDeps)
+
+    problems = []
+    for name in names:
+        if name not in unconditional:
+            problems.append(f"{name}: not a target for {check_boards[chip]}")
+            continue
+        real = unconditional[name] - {name}
+        realAll = real | conditional[name]
+        indexed = set(libraries[name]["deps"]) - {name}
+        indexedAll = indexed | set(libraries[name]["optionalDeps"])
+        for dep in sorted(realAll - indexedAll):
+            problems.append(f"{name}: links {dep}, which the index misses")
+        for dep in sorted(indexed - real):
+            problems.append(f"{name}: index says it always links {dep}, CMake doesn't")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("sdkVersion", help="Version of the installed SDK to index")
+    parser.add_argument(
+        "-home", "--userHome", default=Path.home(), help="Folder containing .pico-sdk"
+    )
+    parser.add_argument(
+        "-r", "--rebuild", action="store_true", help="Rebuild even if up to date"
+    )
+    parser.add_argument("-l", "--lib", action="append", help="Show what lib needs")
+    parser.add_argument("-c", "--chip", default="rp2040", choices=CHIP_FOLDERS)
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="Check the index against a CMake configure of the SDK, exits with 1 on differences",
+    )
+    parser.add_argument("--cmake", default="cmake", help="CMake to configure with")
+    parser.add_argument("--toolchainPath", help="Toolchain for the --check configure")
+    args = parser.parse_args()
+
+    index = LoadIndex(args.userHome, args.sdkVersion, args.rebuild)
+    if index is None:
+        print(f"SDK {args.sdkVersion} is not installed")
+        sys.exit(-1)
+
+    print(
+        f"{len(Libraries(index, args.chip))} libraries for {args.chip} "
+        f"in {IndexPath(args.userHome, args.sdkVersion)}"
+    )
+    if args.lib:
+        print("Links:", " ".join(Closure(index, args.chip, args.lib)))
+        print("Minimal link list:", " ".join(MinimalLinkLibraries(index, args.chip, args.lib)))
+        print("Include directories:")
+        for includeDir in IncludeDirs(index, args.chip, args.lib):
+            print(f"  {includeDir}")
+
+    if args.check:
+        sdkPath = Path(args.userHome, ".pico-sdk", "sdk", args.sdkVersion)
+        problems = CheckAgainstCMake(
+            index, args.chip, sdkPath, args.cmake, args.toolchainPath
+        )
+        for problem in problems:
+            print(problem)
+        if problems:
+            sys.exit(1)
+        print("Index matches CMake")
+
+
+if __name__ == "__main__":
+    main()
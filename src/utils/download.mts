@@ -537,12 +537,15 @@ export async function downloadAndInstallSDK(
     return false;
   }
 
-  // Install pico-vscode.cmake file - overwrite if it's already there
+  // Install pico-vscode.cmake and the compiler cache it includes
+  // - overwrite if they're already there
   await mkdir(buildCMakeIncPath(true), { recursive: true });
-  copyFileSync(
-    joinPosix(getScriptsRoot(extensionUri), "pico-vscode.cmake"),
-    joinPosix(buildCMakeIncPath(true), "pico-vscode.cmake")
-  );
+  for (const cmakeFile of ["pico-vscode.cmake", "pico-vscode-compiler.cmake"]) {
+    copyFileSync(
+      joinPosix(getScriptsRoot(extensionUri), cmakeFile),
+      joinPosix(buildCMakeIncPath(true), cmakeFile)
+    );
+  }
 
   const targetDirectory = buildSDKPath(version);
 
@@ -588,11 +591,19 @@ export async function downloadAndInstallSDK(
       const result = await initSubmodules(targetDirectory, gitPath);
       if (result) {
         await LastUsedDepsStore.instance.record("pico-sdk", version);
+        await indexSDK(extensionUri, version, python3Path);
       }
 
       return result;
     } else {
       await LastUsedDepsStore.instance.record("pico-sdk", version);
+      // SDKs installed by older versions of the extension have no index yet
+      if (
+        !existsSync(buildSDKConfigsPath(version)) ||
+        !existsSync(buildSDKIndexPath(version))
+      ) {
+        await indexSDK(extensionUri, version, python3Path);
+      }
 
       return true;
     }
@@ -632,6 +643,7 @@ export async function downloadAndInstallSDK(
     const result = await initSubmodules(targetDirectory, gitPath);
     if (result) {
       await LastUsedDepsStore.instance.record("pico-sdk", version);
+      await indexSDK(extensionUri, version, python3);
     }
 
     return result;
@@ -640,6 +652,80 @@ export async function downloadAndInstallSDK(
   return false;
 }
 
+/**
+ * Path of the PICO_CONFIG table pico_configs.py extracts from an SDK.
+ *
+ * @param version The version of the SDK
+ * @returns The path of the table, must match TablePath in pico_configs.py
+ */
+function buildSDKConfigsPath(version: string): string {
+  return joinPosix(buildCMakeIncPath(true), "pico-configs", `${version}.tsv`);
+}
+
+/**
+ * Path of the library index pico_sdk_index.py builds for an SDK.
+ *
+ * @param version The version of the SDK
+ * @returns The path of the index, must match IndexPath in pico_sdk_index.py
+ */
+function buildSDKIndexPath(version: string): string {
+  return joinPosix(buildCMakeIncPath(true), "sdk-index", `${version}.json`);
+}
+
+/**
+ * Extracts the PICO_CONFIG table (pico_configs.py) and builds the library
+ * index (pico_sdk_index.py) of an installed SDK, so project generation
+ * doesn't have to scan the SDK. Failures are only logged, the generator
+ * then uses the config table it ships with and the full SDK include paths.
+ *
+ * @param extensionUri The URI of the extension
+ * @param version The version of the installed SDK
+ * @param python3Path The path to a Python3 executable
+ * @returns A promise that resolves to true if both were built
+ */
+async function indexSDK(
+  extensionUri: Uri,
+  version: string,
+  python3Path?: string
+): Promise<boolean> {
+  const python3Exe: string =
+    python3Path ||
+    Settings.getInstance()
+      ?.getString(SettingsKey.python3Path)
+      ?.replace(HOME_VAR, homeDirectory.replaceAll("\\", "/")) ||
+    (process.platform === "win32" ? "python" : "python3");
+  const python3: string | null = await which(python3Exe, { nothrow: true });
+  if (python3 === null) {
+    Logger.warn(
+      LoggerSource.downloader,
+      `Python 3 was not found, not indexing SDK ${version}.`
+    );
+
+    return false;
+  }
+
+  let success = true;
+  for (const script of ["pico_configs.py", "pico_sdk_index.py"]) {
+    const command = [
+      `"${python3}"`,
+      `"${joinPosix(getScriptsRoot(extensionUri), script)}"`,
+      version,
+      "--userHome",
+      `"${homeDirectory.replaceAll("\\", "/")}"`,
+    ].join(" ");
+    const result = await _runCommand(command, { windowsHide: true });
+    if (result !== 0) {
+      Logger.warn(
+        LoggerSource.downloader,
+        `Running ${script} for SDK ${version} failed.`
+      );
+      success = false;
+    }
+  }
+
+  return success;
+}
+
 /**
  * Downloads and installs a GitHub release asset.
  *
@@ -28,22 +28,39 @@ async function updateCppPropertiesFile(
     const jsonData = await readFile(file, "utf8");
     const cppProperties: CppProperties = JSON.parse(jsonData) as CppProperties;
 
+    const baseHeadersFolderName = compareGe(newSDKVersion, "2.0.0")
+      ? "pico_base_headers"
+      : "pico_base";
+
     // Update the compilerPath value
     cppProperties.configurations.forEach(config => {
-      // Remove the old pico-sdk includePath values set by this extension
+      // Retarget the pico-sdk includePath values set by this extension,
+      // which are either the whole SDK or the directories the project needs
+      const sdkIncludePath = config.includePath
+        .filter(item => item.startsWith("${userHome}/.pico-sdk/sdk/"))
+        .map(item =>
+          item
+            .replace(
+              /^\$\{userHome\}\/\.pico-sdk\/sdk\/[^/]+/,
+              `\${userHome}/.pico-sdk/sdk/${newSDKVersion}`
+            )
+            .replace(
+              /\/src\/common\/pico_base(_headers)?\/include$/,
+              `/src/common/${baseHeadersFolderName}/include`
+            )
+        );
       config.includePath = config.includePath.filter(
         item => !item.startsWith("${userHome}/.pico-sdk")
       );
-      // Add the new pico-sdk includePath
-      config.includePath.push(`\${userHome}/.pico-sdk/sdk/${newSDKVersion}/**`);
+      if (sdkIncludePath.length === 0) {
+        sdkIncludePath.push(`\${userHome}/.pico-sdk/sdk/${newSDKVersion}/**`);
+      }
+      config.includePath.push(...sdkIncludePath);
 
       // Remove the old pico-sdk forcedInclude values set by this extension
       config.forcedInclude = config.forcedInclude.filter(
         item => !item.startsWith("${userHome}/.pico-sdk")
       );
-      const baseHeadersFolderName = compareGe(newSDKVersion, "2.0.0")
-        ? "pico_base_headers"
-        : "pico_base";
       // Add the new pico-sdk forcedInclude
       config.forcedInclude.push(
         `\${userHome}/.pico-sdk/sdk/${newSDKVersion}` +
@@ -2348,7 +2348,9 @@ export class NewProjectPanel {
     const command: string = [
       // TODO: maybe use includes powershell instead of .exe and ===
       `${process.env.ComSpec === "powershell.exe" ? "&" : ""}"${pythonExe}"`,
-      `"${joinPosix(getScriptsRoot(this._extensionUri), "pico_project.py")}"`,
+      // run as a module (cwd is the scripts root) so its bytecode gets cached
+      "-m",
+      "pico_project",
       ...basicNewProjectOptions,
       ...libraryAndCodeGenerationOptions,
       enumToParam(options.debugger),